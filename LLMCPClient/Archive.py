@@ -0,0 +1,197 @@
+"""
+Conversation export/import, streamed one message at a time.
+
+Two formats, told apart by their first bytes when reading:
+
+    msgpack   zstd-compressed msgpack: a header map, then one [role, content] array per
+              message. Compact and fast; the default.
+    jsonl     a header line, then one {"role": ..., "content": ...} object per line, for
+              other tools.
+
+Both are written and read record by record through a compressor/parser with a fixed
+buffer, so exporting or importing (or converting between the two) a history of any
+size takes constant memory apart from the messages the caller keeps. Attachments are
+exported as their references (see LLMCPClient.Attachments), not their content.
+
+    python -m LLMCPClient.Archive --benchmark 100000
+
+compares size and speed with a plain JSON dump of the same conversation.
+"""
+
+import argparse
+import json
+import os
+import random
+import string
+import tempfile
+import time
+import tracemalloc
+from typing import BinaryIO, Iterable, Iterator
+
+from LLMCPClient.Messages import Message
+
+MSGPACK = "msgpack"
+JSONL = "jsonl"
+FORMATS = (MSGPACK, JSONL)
+EXTENSIONS = {MSGPACK: ".chat.zst", JSONL: ".jsonl"}
+
+HEADER = {"format": "chat-genie", "version": 1}
+_ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+_READ_SIZE = 1 << 16
+
+
+class ArchiveError(ValueError):
+    """The file is not a conversation export (or is of an unsupported version)."""
+
+
+def _check_header(header):
+    if not isinstance(header, dict) or header.get("format") != HEADER["format"]:
+        raise ArchiveError("Not a Chat Genie conversation export")
+    if header.get("version") != HEADER["version"]:
+        raise ArchiveError(f"Unsupported export version {header.get('version')!r}")
+
+
+def export_conversation(messages: Iterable[Message], fileobj: BinaryIO, format: str = MSGPACK, level: int = 3) -> int:
+    """Write messages to a binary file object; returns the number written."""
+    if format == MSGPACK:
+        import msgpack
+        import zstandard
+
+        packer = msgpack.Packer()
+        count = 0
+        with zstandard.ZstdCompressor(level=level).stream_writer(fileobj, closefd=False) as out:
+            out.write(packer.pack(HEADER))
+            for message in messages:
+                out.write(packer.pack((message.role, message.content)))
+                count += 1
+        return count
+    if format == JSONL:
+        count = 0
+        fileobj.write(json.dumps(HEADER).encode() + b"\n")
+        for message in messages:
+            # Not message.json: caching every encoding would grow with the history
+            record = {"role": message.role, "content": message.content}
+            fileobj.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode() + b"\n")
+            count += 1
+        return count
+    raise ValueError(f"Unknown export format {format!r}; expected one of {FORMATS}")
+
+
+def import_conversation(fileobj: BinaryIO) -> Iterator[Message]:
+    """Yield the messages of an export, in either format, from a seekable binary file object."""
+    start = fileobj.tell()
+    magic = fileobj.read(len(_ZSTD_MAGIC))
+    fileobj.seek(start)
+
+    if magic == _ZSTD_MAGIC:
+        import msgpack
+        import zstandard
+
+        with zstandard.ZstdDecompressor().stream_reader(fileobj, closefd=False) as stream:
+            records = msgpack.Unpacker(stream, raw=False, read_size=_READ_SIZE)
+            _check_header(next(records, None))
+            for role, content in records:
+                yield Message(role, content)
+        return
+
+    try:
+        _check_header(json.loads(fileobj.readline()))
+    except ValueError as e:
+        raise ArchiveError("Not a Chat Genie conversation export") from e
+    for line in fileobj:
+        if line.strip():
+            record = json.loads(line)
+            yield Message(record["role"], record["content"])
+
+
+def convert(source: BinaryIO, destination: BinaryIO, format: str) -> int:
+    """Re-encode an export in another format, one message at a time."""
+    return export_conversation(import_conversation(source), destination, format)
+
+
+# ---------- benchmark ----------
+
+def _sample_messages(count: int) -> Iterator[Message]:
+    # Seeded random prose: compresses roughly like real chat text, unlike repeated strings
+    rng = random.Random(0)
+    vocabulary = [
+        "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(2, 9))) for _ in range(5000)
+    ]
+    for i in range(count):
+        words = rng.choices(vocabulary, k=rng.randint(8, 30) if i % 2 == 0 else rng.randint(40, 250))
+        yield Message("assistant" if i % 2 else "user", " ".join(words) + ".")
+
+
+def _measure(action) -> tuple[float, int]:
+    tracemalloc.start()
+    started = time.perf_counter()
+    action()
+    elapsed = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def benchmark(count: int):
+    """Print size, time and peak allocation of each format against a plain JSON dump."""
+    # Built up front so only encoding/decoding is measured
+    messages = list(_sample_messages(count))
+    with tempfile.TemporaryDirectory() as directory:
+        rows = []
+
+        path = os.path.join(directory, "plain.json")
+
+        def write_json():
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump([m.payload for m in messages], f, ensure_ascii=False)
+
+        def read_json():
+            with open(path, encoding="utf-8") as f:
+                for record in json.load(f):
+                    Message(record["role"], record["content"])
+
+        write = _measure(write_json)
+        rows.append(("json (one document)", os.path.getsize(path), write, _measure(read_json)))
+
+        for format in (JSONL, MSGPACK):
+            path = os.path.join(directory, "export" + EXTENSIONS[format])
+
+            def write_export():
+                with open(path, "wb") as f:
+                    export_conversation(messages, f, format)
+
+            def read_export():
+                with open(path, "rb") as f:
+                    for _ in import_conversation(f):
+                        pass
+
+            write = _measure(write_export)
+            rows.append((format, os.path.getsize(path), write, _measure(read_export)))
+
+    print(f"{count} messages")
+    print(f"{'format':<22}{'size':>12}{'write s':>10}{'write peak':>12}{'read s':>10}{'read peak':>12}")
+    for name, size, (write_s, write_peak), (read_s, read_peak) in rows:
+        print(
+            f"{name:<22}{size / 1e6:>10.2f}MB{write_s:>10.2f}{write_peak / 1e6:>10.1f}MB"
+            f"{read_s:>10.2f}{read_peak / 1e6:>10.1f}MB"
+        )
+
+
+def run():
+    parser = argparse.ArgumentParser(description="Convert or benchmark conversation exports")
+    parser.add_argument("--benchmark", type=int, metavar="MESSAGES", help="benchmark the formats on a synthetic conversation")
+    parser.add_argument("--convert", nargs=2, metavar=("SOURCE", "DESTINATION"), help="re-encode an export")
+    parser.add_argument("--format", choices=FORMATS, default=MSGPACK, help="format for --convert")
+    args = parser.parse_args()
+    if args.benchmark:
+        benchmark(args.benchmark)
+    elif args.convert:
+        source, destination = args.convert
+        with open(source, "rb") as src, open(destination, "wb") as dst:
+            print(f"Converted {convert(src, dst, args.format)} messages")
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    run()
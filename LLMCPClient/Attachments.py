@@ -0,0 +1,252 @@
+"""
+Content-addressed storage for chat attachments.
+
+Uploads are streamed to CHATGENIE_ATTACHMENT_DIR (default "attachments/") in 1 MiB
+chunks, hashed as they are written and stored once under their SHA-256, so a document
+attached from any number of sessions is kept on disk once and never held in session
+state. Messages only carry a small reference block:
+
+    {"type": "document", "title": "report.pdf",
+     "source": {"type": "attachment", "sha256": "...", "media_type": "application/pdf"}}
+
+which the providers expand (resolve()) just before sending. References from outside the
+process go through checked() first: imported conversations keep references to stored
+attachments (the hash works like a capability), gateway requests keep none. Expanded
+blocks are built from a memory map of the stored file, at most once per attachment while
+they stay in a bounded LRU cache, and the last document of a request is marked for
+prompt caching, so re-sending a conversation with the same attachments re-reads nothing
+locally and is billed as cached input.
+"""
+
+import asyncio
+import base64
+import hashlib
+import mmap
+import mimetypes
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Iterable, Iterator, Sequence
+
+from LLMCPClient.Messages import Message
+
+ATTACHMENT_DIR = os.getenv("CHATGENIE_ATTACHMENT_DIR", "attachments")
+CHUNK_SIZE = 1 << 20
+_SHA256 = re.compile(r"[0-9a-f]{64}")
+
+_TEXT_TYPES = ("application/json", "application/xml", "application/x-yaml", "application/javascript")
+
+
+def _is_text(media_type: str) -> bool:
+    return media_type.startswith("text/") or media_type in _TEXT_TYPES
+
+
+def _is_reference(block) -> bool:
+    return (
+        isinstance(block, dict)
+        and block.get("type") == "document"
+        and isinstance(block.get("source"), dict)
+        and block["source"].get("type") == "attachment"
+    )
+
+
+def _check_sha256(sha256) -> str:
+    # Joined into a path: anything but a hex digest could point outside the directory
+    if not isinstance(sha256, str) or not _SHA256.fullmatch(sha256):
+        raise ValueError(f"Not an attachment hash: {sha256!r}")
+    return sha256
+
+
+@dataclass(frozen=True)
+class Attachment:
+    sha256: str
+    name: str
+    media_type: str
+    size: int
+
+    def reference(self) -> dict:
+        """The block to put in a message in place of the document itself."""
+        return {
+            "type": "document",
+            "title": self.name,
+            "source": {"type": "attachment", "sha256": self.sha256, "media_type": self.media_type},
+        }
+
+
+class AttachmentStore:
+    """The attachment directory, shared by every session in the process."""
+
+    _instance = None
+    _lock = threading.Lock()
+
+    def __init__(self, directory: str = ATTACHMENT_DIR, cache_bytes: int = 64 << 20):
+        self.directory = directory
+        self.cache_bytes = cache_bytes
+        os.makedirs(directory, exist_ok=True)
+        self._blocks: OrderedDict = OrderedDict()
+        self._cached = 0
+        self._cache_lock = threading.Lock()
+
+    @classmethod
+    def get(cls) -> "AttachmentStore":
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    def path(self, sha256: str) -> str:
+        _check_sha256(sha256)
+        return os.path.join(self.directory, sha256[:2], sha256)
+
+    def stored(self, reference: dict) -> bool:
+        """Whether a reference is well-formed and its attachment is in the directory."""
+        source = reference["source"]
+        sha256 = source.get("sha256")
+        if not isinstance(sha256, str) or not _SHA256.fullmatch(sha256) or not isinstance(source.get("media_type"), str):
+            return False
+        return os.path.isfile(self.path(sha256))
+
+    def add(self, fileobj, name: str, media_type: str = None) -> Attachment:
+        """
+        Store a binary file object, chunk by chunk, and return its Attachment.
+
+        Content that is already stored (from this or any other session) is not kept twice.
+        """
+        media_type = media_type or mimetypes.guess_type(name)[0] or "application/octet-stream"
+        digest = hashlib.sha256()
+        size = 0
+        fd, partial = tempfile.mkstemp(dir=self.directory, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as out:
+                while chunk := fileobj.read(CHUNK_SIZE):
+                    digest.update(chunk)
+                    out.write(chunk)
+                    size += len(chunk)
+            sha256 = digest.hexdigest()
+            path = self.path(sha256)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if os.path.exists(path):
+                os.remove(partial)
+            else:
+                os.replace(partial, path)
+        except BaseException:
+            if os.path.exists(partial):
+                os.remove(partial)
+            raise
+        return Attachment(sha256, name, media_type, size)
+
+    @contextmanager
+    def _mapped(self, sha256: str):
+        with open(self.path(sha256), "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                # mmap can't map an empty file
+                yield b""
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                yield data
+
+    def block(self, reference: dict, documents: bool = True) -> dict:
+        """
+        The content block for an attachment reference.
+
+        With documents=False the attachment is given as plain text, for providers
+        without document blocks.
+        """
+        source = reference["source"]
+        _check_sha256(source["sha256"])
+        key = (source["sha256"], source["media_type"], reference.get("title"), documents)
+        with self._cache_lock:
+            if key in self._blocks:
+                self._blocks.move_to_end(key)
+                return self._blocks[key][0]
+
+        block = self._build(source["sha256"], source["media_type"], reference.get("title") or "attachment", documents)
+        size = len(str(block))
+        with self._cache_lock:
+            self._blocks[key] = (block, size)
+            self._cached += size
+            while self._cached > self.cache_bytes and len(self._blocks) > 1:
+                _, (_, evicted) = self._blocks.popitem(last=False)
+                self._cached -= evicted
+        return block
+
+    def _build(self, sha256: str, media_type: str, title: str, documents: bool) -> dict:
+        with self._mapped(sha256) as data:
+            if _is_text(media_type):
+                text = str(data, "utf-8", "replace")
+                if documents:
+                    return {"type": "document", "title": title, "source": {"type": "text", "media_type": "text/plain", "data": text}}
+                return {"type": "text", "text": f'<document title="{title}">\n{text}\n</document>'}
+            if media_type == "application/pdf" and documents:
+                encoded = base64.b64encode(data).decode("ascii")
+                return {"type": "document", "title": title, "source": {"type": "base64", "media_type": media_type, "data": encoded}}
+            return {"type": "text", "text": f"[Attachment {title} ({media_type}, {len(data)} bytes) can't be read here]"}
+
+
+def has_references(messages: Sequence[dict]) -> bool:
+    return any(
+        not isinstance(m["content"], str) and any(_is_reference(b) for b in m["content"])
+        for m in messages
+    )
+
+
+def expand(messages: Sequence[dict], documents: bool = True) -> list[dict]:
+    """
+    The messages with attachment references replaced by their content blocks.
+
+    Messages without references are passed through as-is. With documents, the last
+    document block gets a cache breakpoint, which caches every attachment before it.
+    """
+    store = AttachmentStore.get()
+    expanded = []
+    last = None
+    for message in messages:
+        content = message["content"]
+        if isinstance(content, str) or not any(_is_reference(b) for b in content):
+            expanded.append(message)
+            continue
+        blocks = [store.block(b, documents) if _is_reference(b) else b for b in content]
+        expanded.append({"role": message["role"], "content": blocks})
+        for index, block in enumerate(blocks):
+            if block["type"] == "document":
+                last = (len(expanded) - 1, index)
+    if documents and last is not None:
+        # Blocks are shared through the cache; mark a copy
+        blocks = expanded[last[0]]["content"]
+        blocks[last[1]] = dict(blocks[last[1]], cache_control={"type": "ephemeral"})
+    return expanded
+
+
+def checked(messages: Iterable[Message], references: bool = True) -> Iterator[Message]:
+    """
+    Messages from outside the process with every attachment reference that isn't to a
+    stored attachment replaced by a note, so that expanding them only reads stored files.
+
+    A stored hash is enough to read the attachment, so pass references=False for senders
+    that can't have uploaded anything: then every reference is replaced.
+    """
+    store = AttachmentStore.get()
+
+    def kept(block) -> bool:
+        return not _is_reference(block) or (references and store.stored(block))
+
+    for message in messages:
+        content = message.content
+        if isinstance(content, str) or all(kept(b) for b in content):
+            yield message
+            continue
+        yield Message(message.role, [
+            b if kept(b) else {"type": "text", "text": f"[Attachment {b.get('title') or ''} is not available]"}
+            for b in content
+        ])
+
+
+async def resolve(messages: Sequence[dict], documents: bool = True) -> Sequence[dict]:
+    """expand(), run off the event loop when there is anything to read from disk."""
+    if not has_references(messages):
+        return messages
+    return await asyncio.to_thread(expand, messages, documents)
@@ -0,0 +1,45 @@
+import asyncio
+import concurrent.futures
+import threading
+
+
+class BackgroundLoop:
+    """
+    A single asyncio event loop running in a daemon thread, shared by the whole process.
+
+    Streamlit re-executes the app script on a fresh thread for every interaction, so any
+    coroutine that has to outlive one rerun (or be cancelled from the next one) is
+    scheduled here instead of being driven by a throwaway asyncio.run().
+    """
+
+    _instance = None
+    _lock = threading.Lock()
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, name="chat-genie-loop", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    @classmethod
+    def get(cls) -> "BackgroundLoop":
+        """Return the process-wide loop, starting it on first use."""
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    @property
+    def thread_ident(self) -> int:
+        return self._thread.ident
+
+    def submit(self, coro) -> concurrent.futures.Future:
+        """Schedule a coroutine on the loop and return a thread-safe future for it."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro, timeout: float | None = None):
+        """Run a coroutine on the loop and block the calling thread until it finishes."""
+        return self.submit(coro).result(timeout)
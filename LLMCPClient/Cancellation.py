@@ -0,0 +1,55 @@
+import concurrent.futures
+import time
+from typing import Callable, Optional
+
+from LLMCPClient.BackgroundLoop import BackgroundLoop
+
+
+class TurnCancelled(Exception):
+    """Raised by Turn.wait() when the turn was cancelled before it produced a response."""
+
+
+class Turn:
+    """
+    One cancellable request/response cycle running on the background loop.
+
+    Cancelling the turn cancels the underlying asyncio task, so the CancelledError
+    propagates through the whole async stack: the Anthropic stream is closed and any
+    pending MCP call_tool requests are abandoned instead of running to completion.
+    """
+
+    def __init__(self, coro, loop: Optional[BackgroundLoop] = None):
+        self.started = time.monotonic()
+        self._future = (loop or BackgroundLoop.get()).submit(coro)
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    def done(self) -> bool:
+        return self._future.done()
+
+    def cancel(self) -> bool:
+        """Cancel the turn if it is still running. Returns False if it already finished."""
+        return self._future.cancel()
+
+    def wait(self, on_tick: Optional[Callable[[float], None]] = None, poll_interval: float = 0.2):
+        """
+        Block until the turn finishes and return its result.
+
+        on_tick is called with the elapsed time every poll_interval seconds while waiting.
+        In a Streamlit app it should touch a placeholder: sending a delta is where Streamlit
+        raises its rerun/stop exceptions, which is how a Stop click or a new message
+        interrupts the wait. Any such interruption cancels the turn before propagating.
+        """
+        try:
+            while not self._future.done():
+                done, _ = concurrent.futures.wait((self._future,), timeout=poll_interval)
+                if not done and on_tick is not None:
+                    on_tick(self.elapsed)
+            return self._future.result()
+        except concurrent.futures.CancelledError:
+            raise TurnCancelled() from None
+        except BaseException:
+            self.cancel()
+            raise
@@ -0,0 +1,347 @@
+"""
+Record/replay of Anthropic and MCP traffic, for offline load tests and regressions.
+
+    CHATGENIE_CASSETTE=cassettes/slow_turn.jsonl.gz CHATGENIE_CASSETTE_MODE=record streamlit run chatbot_app_mcp.py
+    CHATGENIE_CASSETTE=cassettes/slow_turn.jsonl.gz CHATGENIE_CASSETTE_MODE=replay CHATGENIE_REPLAY_SPEED=0 ...
+
+A cassette is a gzip-compressed JSON-lines file, one interaction per line:
+
+    {"kind": "http", "key": ..., "status": 200, "headers": [...], "headers_at": 0.41,
+     "chunks": [[0.52, "event: message_start..."], ...]}
+    {"kind": "mcp", "key": ..., "op": "call_tool", "elapsed": 1.3, "result": {...}}
+
+HTTP traffic (the direct API path and the Anthropic SDK inside MCPClient) is captured
+at the httpx transport, chunk by chunk with its arrival time, so streamed responses
+replay with their original pacing. MCP traffic is captured per session call.
+Replay timing is divided by CHATGENIE_REPLAY_SPEED (1 = original, 0 = no delays).
+Request headers (API keys) are never written.
+"""
+
+import asyncio
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import Optional
+
+import httpx
+from mcp.types import (
+    CallToolResult,
+    EmptyResult,
+    GetPromptResult,
+    InitializeResult,
+    ListPromptsResult,
+    ListResourcesResult,
+    ListToolsResult,
+    ReadResourceResult,
+)
+
+RECORD = "record"
+REPLAY = "replay"
+
+# Response headers that are meaningless (or wrong) once the body is replayed
+_DROPPED_HEADERS = {"set-cookie", "content-encoding", "content-length", "transfer-encoding"}
+
+
+def _key(*parts) -> str:
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _http_key(request: httpx.Request) -> str:
+    try:
+        body = json.loads(request.content) if request.content else None
+    except ValueError:
+        body = request.content.decode("utf-8", "surrogateescape")
+    return _key(request.method, str(request.url.copy_with(query=None)), body)
+
+
+class MissingInteraction(LookupError):
+    """Replay was asked for a request that is not in the cassette."""
+
+
+class Cassette:
+    """One cassette file, shared by every client in the process."""
+
+    _instances: dict = {}
+    _lock = threading.Lock()
+
+    def __init__(self, path: str, mode: str, speed: float = 1.0):
+        if mode not in (RECORD, REPLAY):
+            raise ValueError(f"Cassette mode must be '{RECORD}' or '{REPLAY}', not {mode!r}")
+        self.path = path
+        self.mode = mode
+        self.speed = speed
+        self._write_lock = threading.Lock()
+        self._interactions: dict[str, list[dict]] = defaultdict(list)
+        self._cursor: dict[str, int] = defaultdict(int)
+        if mode == REPLAY:
+            self._load()
+        else:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    @classmethod
+    def from_env(cls) -> Optional["Cassette"]:
+        """The cassette configured by CHATGENIE_CASSETTE*, or None when not recording/replaying."""
+        path = os.getenv("CHATGENIE_CASSETTE")
+        if not path:
+            return None
+        mode = os.getenv("CHATGENIE_CASSETTE_MODE", REPLAY)
+        speed = float(os.getenv("CHATGENIE_REPLAY_SPEED", "1"))
+        with cls._lock:
+            if path not in cls._instances:
+                cls._instances[path] = cls(path, mode, speed)
+            return cls._instances[path]
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == REPLAY
+
+    def _load(self):
+        with gzip.open(self.path, "rt", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    interaction = json.loads(line)
+                    self._interactions[interaction["key"]].append(interaction)
+
+    def _write(self, interaction: dict):
+        line = json.dumps(interaction, separators=(",", ":")) + "\n"
+        # Each write appends a gzip member; readers see one continuous stream
+        with self._write_lock, gzip.open(self.path, "at", encoding="utf-8") as f:
+            f.write(line)
+
+    def _next(self, key: str, description: str) -> dict:
+        """Recorded interactions for a key replay in order; the last one repeats."""
+        recorded = self._interactions.get(key)
+        if not recorded:
+            raise MissingInteraction(f"No recorded interaction for {description} in {self.path}")
+        index = min(self._cursor[key], len(recorded) - 1)
+        self._cursor[key] += 1
+        return recorded[index]
+
+    async def _sleep(self, seconds: float):
+        if self.speed > 0 and seconds > 0:
+            await asyncio.sleep(seconds / self.speed)
+
+    # ---------- HTTP ----------
+
+    def transport(self) -> httpx.AsyncBaseTransport:
+        """An httpx transport that records through to the network, or replays."""
+        return _ReplayTransport(self) if self.replaying else _RecordingTransport(self)
+
+    def http_client(self, **kwargs) -> httpx.AsyncClient:
+        return httpx.AsyncClient(transport=self.transport(), **kwargs)
+
+    # ---------- MCP ----------
+
+    def session(self, endpoint: str, session=None):
+        """Wrap a live ClientSession for recording, or return a replay stub for endpoint."""
+        if self.replaying:
+            return _ReplaySession(self, endpoint)
+        return _RecordingSession(self, endpoint, session)
+
+
+def transport() -> Optional[httpx.AsyncBaseTransport]:
+    """Transport for an httpx client: the configured cassette's, or None for the default."""
+    cassette = Cassette.from_env()
+    return cassette.transport() if cassette is not None else None
+
+
+class _RecordingStream(httpx.AsyncByteStream):
+    def __init__(self, cassette: Cassette, interaction: dict, inner: httpx.AsyncByteStream, started: float):
+        self.cassette = cassette
+        self.interaction = interaction
+        self.inner = inner
+        self.started = started
+        self.closed = False
+
+    async def __aiter__(self):
+        async for chunk in self.inner:
+            offset = time.monotonic() - self.started
+            self.interaction["chunks"].append([round(offset, 4), chunk.decode("utf-8", "surrogateescape")])
+            yield chunk
+
+    async def aclose(self):
+        await self.inner.aclose()
+        if not self.closed:
+            self.closed = True
+            self.cassette._write(self.interaction)
+
+
+class _RecordingTransport(httpx.AsyncBaseTransport):
+    def __init__(self, cassette: Cassette):
+        self.cassette = cassette
+        self.inner = httpx.AsyncHTTPTransport()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        # Transports see the raw body; ask for it uncompressed so chunks replay as-is
+        request.headers["Accept-Encoding"] = "identity"
+        started = time.monotonic()
+        response = await self.inner.handle_async_request(request)
+        interaction = {
+            "kind": "http",
+            "key": _http_key(request),
+            "url": str(request.url),
+            "status": response.status_code,
+            "headers": [[k, v] for k, v in response.headers.items() if k.lower() not in _DROPPED_HEADERS],
+            "headers_at": round(time.monotonic() - started, 4),
+            "chunks": [],
+        }
+        stream = _RecordingStream(self.cassette, interaction, response.stream, started)
+        return httpx.Response(response.status_code, headers=response.headers, stream=stream, extensions=response.extensions)
+
+    async def aclose(self):
+        await self.inner.aclose()
+
+
+class _ReplayStream(httpx.AsyncByteStream):
+    def __init__(self, cassette: Cassette, interaction: dict):
+        self.cassette = cassette
+        self.interaction = interaction
+
+    async def __aiter__(self):
+        previous = self.interaction["headers_at"]
+        for offset, text in self.interaction["chunks"]:
+            await self.cassette._sleep(offset - previous)
+            previous = offset
+            yield text.encode("utf-8", "surrogateescape")
+
+
+class _ReplayTransport(httpx.AsyncBaseTransport):
+    def __init__(self, cassette: Cassette):
+        self.cassette = cassette
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        interaction = self.cassette._next(_http_key(request), f"{request.method} {request.url}")
+        await self.cassette._sleep(interaction["headers_at"])
+        return httpx.Response(
+            interaction["status"],
+            headers=interaction["headers"],
+            stream=_ReplayStream(self.cassette, interaction),
+            request=request,
+        )
+
+
+class _RecordingSession:
+    """Proxy for a ResumableSession that records its handshake and every MCP request the client makes."""
+
+    def __init__(self, cassette: Cassette, endpoint: str, session):
+        self._cassette = cassette
+        self._endpoint = endpoint
+        self._session = session
+
+    def __getattr__(self, name):
+        return getattr(self._session, name)
+
+    async def _record(self, op: str, key: str, call):
+        started = time.monotonic()
+        result = await call
+        self._cassette._write({
+            "kind": "mcp",
+            "key": key,
+            "op": op,
+            "elapsed": round(time.monotonic() - started, 4),
+            "result": result.model_dump(mode="json"),
+        })
+        return result
+
+    async def open(self) -> InitializeResult:
+        # Replay needs the server's capabilities to prefetch the same catalogs
+        return await self._record("initialize", _key("initialize", self._endpoint), self._session.open())
+
+    async def list_tools(self, *args, **kwargs):
+        key = _key("list_tools", self._endpoint)
+        return await self._record("list_tools", key, self._session.list_tools(*args, **kwargs))
+
+    async def list_resources(self, *args, **kwargs):
+        key = _key("list_resources", self._endpoint)
+        return await self._record("list_resources", key, self._session.list_resources(*args, **kwargs))
+
+    async def list_prompts(self, *args, **kwargs):
+        key = _key("list_prompts", self._endpoint)
+        return await self._record("list_prompts", key, self._session.list_prompts(*args, **kwargs))
+
+    async def call_tool(self, name: str, arguments: Optional[dict] = None, *args, **kwargs):
+        key = _key("call_tool", self._endpoint, name, arguments)
+        return await self._record("call_tool", key, self._session.call_tool(name, arguments, *args, **kwargs))
+
+    async def read_resource(self, uri):
+        key = _key("read_resource", self._endpoint, str(uri))
+        return await self._record("read_resource", key, self._session.read_resource(uri))
+
+    async def subscribe_resource(self, uri):
+        key = _key("subscribe_resource", self._endpoint, str(uri))
+        return await self._record("subscribe_resource", key, self._session.subscribe_resource(uri))
+
+    async def unsubscribe_resource(self, uri):
+        key = _key("unsubscribe_resource", self._endpoint, str(uri))
+        return await self._record("unsubscribe_resource", key, self._session.unsubscribe_resource(uri))
+
+    async def get_prompt(self, name: str, arguments: Optional[dict] = None):
+        key = _key("get_prompt", self._endpoint, name, arguments)
+        return await self._record("get_prompt", key, self._session.get_prompt(name, arguments))
+
+    async def set_logging_level(self, level):
+        key = _key("set_logging_level", self._endpoint, level)
+        return await self._record("set_logging_level", key, self._session.set_logging_level(level))
+
+
+class _ReplaySession:
+    """Stands in for a ClientSession, answering from the cassette with recorded timing."""
+
+    def __init__(self, cassette: Cassette, endpoint: str):
+        self._cassette = cassette
+        self._endpoint = endpoint
+
+    async def _replay(self, key: str, description: str) -> dict:
+        interaction = self._cassette._next(key, description)
+        await self._cassette._sleep(interaction["elapsed"])
+        return interaction["result"]
+
+    async def open(self) -> InitializeResult:
+        result = await self._replay(_key("initialize", self._endpoint), f"initialize on {self._endpoint}")
+        return InitializeResult.model_validate(result)
+
+    async def initialize(self):
+        return None
+
+    async def send_ping(self):
+        return None
+
+    async def list_tools(self, *args, **kwargs) -> ListToolsResult:
+        result = await self._replay(_key("list_tools", self._endpoint), f"list_tools on {self._endpoint}")
+        return ListToolsResult.model_validate(result)
+
+    async def list_resources(self, *args, **kwargs) -> ListResourcesResult:
+        result = await self._replay(_key("list_resources", self._endpoint), f"list_resources on {self._endpoint}")
+        return ListResourcesResult.model_validate(result)
+
+    async def list_prompts(self, *args, **kwargs) -> ListPromptsResult:
+        result = await self._replay(_key("list_prompts", self._endpoint), f"list_prompts on {self._endpoint}")
+        return ListPromptsResult.model_validate(result)
+
+    async def call_tool(self, name: str, arguments: Optional[dict] = None, *args, **kwargs) -> CallToolResult:
+        result = await self._replay(_key("call_tool", self._endpoint, name, arguments), f"call_tool {name}")
+        return CallToolResult.model_validate(result)
+
+    async def read_resource(self, uri) -> ReadResourceResult:
+        result = await self._replay(_key("read_resource", self._endpoint, str(uri)), f"read_resource {uri}")
+        return ReadResourceResult.model_validate(result)
+
+    async def subscribe_resource(self, uri) -> EmptyResult:
+        result = await self._replay(_key("subscribe_resource", self._endpoint, str(uri)), f"subscribe_resource {uri}")
+        return EmptyResult.model_validate(result)
+
+    async def unsubscribe_resource(self, uri) -> EmptyResult:
+        result = await self._replay(_key("unsubscribe_resource", self._endpoint, str(uri)), f"unsubscribe_resource {uri}")
+        return EmptyResult.model_validate(result)
+
+    async def get_prompt(self, name: str, arguments: Optional[dict] = None) -> GetPromptResult:
+        result = await self._replay(_key("get_prompt", self._endpoint, name, arguments), f"get_prompt {name}")
+        return GetPromptResult.model_validate(result)
+
+    async def set_logging_level(self, level) -> EmptyResult:
+        result = await self._replay(_key("set_logging_level", self._endpoint, level), f"set_logging_level on {self._endpoint}")
+        return EmptyResult.model_validate(result)
@@ -0,0 +1,116 @@
+"""
+Background summarization of conversation history that has left the request window.
+
+After a turn, the app calls Compactor.get().schedule(conversation, keep). Once at least
+`batch` messages older than the last `keep` are not yet summarized, a cheap model
+(CHATGENIE_SUMMARY_MODEL) folds them into the conversation's rolling Summary on the
+background loop, as background work for the Scheduler, so it never delays a turn or
+competes with interactive requests. Conversation.context() puts the summary ahead of
+the recent messages on the next turn, which keeps prompts bounded without dropping the
+start of a long chat. If summarizing fails, the messages stay in the window for up to
+another `keep` messages and the next turn tries again.
+"""
+
+import os
+import threading
+import weakref
+from typing import Optional, Sequence
+
+from LLMCPClient.BackgroundLoop import BackgroundLoop
+from LLMCPClient.Messages import Conversation, Message, Summary
+from LLMCPClient.Providers import Provider, get_router, text_deltas
+from LLMCPClient.Scheduler import BACKGROUND, work
+
+SUMMARY_MODEL = os.getenv("CHATGENIE_SUMMARY_MODEL", "claude-3-haiku-20240307")
+SUMMARY_PREFIX = "Summary of the earlier conversation:\n\n"
+MAX_MESSAGE_CHARS = 4000  # per message in the summarization prompt
+
+_INSTRUCTIONS = (
+    "You maintain the running summary of a chat between a user and an assistant. "
+    "Update the summary with the new messages. Keep facts, names, numbers, decisions, "
+    "open questions and the user's preferences; drop pleasantries. Write at most a few "
+    "short paragraphs in the third person, and reply with the summary only."
+)
+
+
+def _clip(text: str) -> str:
+    return text if len(text) <= MAX_MESSAGE_CHARS else text[:MAX_MESSAGE_CHARS] + " [...]"
+
+
+class Compactor:
+    """Schedules and runs the summarization of old turns, at most one per conversation at a time."""
+
+    _instance = None
+    _lock = threading.Lock()
+
+    def __init__(self, model: str = SUMMARY_MODEL, batch: int = 4, max_tokens: int = 600):
+        self.model = model
+        self.batch = batch
+        self.max_tokens = max_tokens
+        self._running: "weakref.WeakKeyDictionary[Conversation, object]" = weakref.WeakKeyDictionary()
+        self._running_lock = threading.Lock()
+
+    @classmethod
+    def get(cls) -> "Compactor":
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    def schedule(
+        self,
+        conversation: Conversation,
+        keep: int,
+        anthropic_api_key: Optional[str] = None,
+        openai_api_key: Optional[str] = None,
+        session: str = "",
+    ) -> bool:
+        """Start summarizing the messages before the last `keep` if enough are pending; True if started."""
+        # Read before the messages: if clear() runs in between, the summary is discarded, not misattached
+        epoch = conversation.epoch
+        summary = conversation.summary
+        covered = summary.covered if summary is not None else 0
+        end = len(conversation) - keep
+        if end - covered < self.batch:
+            return False
+        with self._running_lock:
+            running = self._running.get(conversation)
+            if running is not None and not running.done():
+                return False
+            provider = get_router("anthropic", anthropic_api_key, openai_api_key)
+            self._running[conversation] = BackgroundLoop.get().submit(
+                self._compact(conversation, conversation[covered:end], epoch, summary, end, session, provider)
+            )
+        return True
+
+    async def _compact(
+        self,
+        conversation: Conversation,
+        messages: Sequence[Message],
+        epoch: int,
+        previous: Optional[Summary],
+        covered: int,
+        session: str,
+        provider: Provider,
+    ):
+        previous_text = previous.message.content[len(SUMMARY_PREFIX):] if previous is not None else ""
+        try:
+            with work(BACKGROUND, session):
+                text = await self.summarize(previous_text, messages, provider)
+        except Exception as e:
+            print(f"Couldn't summarize the conversation, will retry next turn: {e}")
+            return
+        if text:
+            conversation.set_summary(Summary(Message("user", SUMMARY_PREFIX + text), covered), epoch)
+
+    async def summarize(self, previous: str, messages: Sequence[Message], provider: Provider) -> str:
+        """The previous summary updated with messages, from the summary model."""
+        transcript = "\n\n".join(f"{m.role.capitalize()}: {_clip(m.text)}" for m in messages)
+        prompt = f"Current summary:\n{previous or '(none yet)'}\n\nNew messages:\n{transcript}"
+        events = provider.stream(
+            model=self.model,
+            max_tokens=self.max_tokens,
+            system=_INSTRUCTIONS,
+            messages=[{"role": "user", "content": prompt}],
+        )
+        return "".join([text async for text in text_deltas(events)]).strip()
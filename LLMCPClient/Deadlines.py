@@ -0,0 +1,113 @@
+"""
+Per-turn deadlines, passed down to every model and tool call of the turn.
+
+    with within(TURN_TIMEOUT):
+        ...  # code awaited here, and tasks started from here, see the deadline
+
+The deadline rides in a context variable, like the Scheduler's work tags, so it
+reaches tool-call tasks and the providers without changing their signatures. Each
+stage bounds itself by what is left: MCPClient runs model streams under bounded() and
+tool calls under bounded(ANSWER_RESERVE), which keeps time for a last answer after slow
+tools, and the providers cap the SDK's request timeout at remaining(). A nested
+within() can only tighten the deadline.
+
+Code that yields while it streams can't hold a timeout across the yield; it wraps the
+stream in until() instead.
+"""
+
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import AsyncIterator, Optional
+
+TURN_TIMEOUT = float(os.getenv("CHATGENIE_TURN_TIMEOUT", "120"))
+# Seconds of a turn's budget that tool calls leave for the model's answer
+ANSWER_RESERVE = float(os.getenv("CHATGENIE_ANSWER_RESERVE", "15"))
+CUT_OFF = "[The turn ran out of time; this answer may be incomplete]"
+
+
+class DeadlineExceeded(TimeoutError):
+    """The turn's deadline passed before a stage finished."""
+
+
+@dataclass(frozen=True)
+class Deadline:
+    at: float  # time.monotonic()
+
+    @classmethod
+    def after(cls, seconds: float) -> "Deadline":
+        return cls(time.monotonic() + seconds)
+
+    def remaining(self) -> float:
+        return max(0.0, self.at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() >= self.at
+
+
+_deadline: ContextVar[Optional[Deadline]] = ContextVar("chatgenie_deadline", default=None)
+
+
+def current() -> Optional[Deadline]:
+    return _deadline.get()
+
+
+def remaining() -> Optional[float]:
+    """Seconds left until the current deadline, or None without one."""
+    deadline = _deadline.get()
+    return deadline.remaining() if deadline is not None else None
+
+
+@contextmanager
+def within(seconds: Optional[float] = TURN_TIMEOUT):
+    """Run the block under a deadline `seconds` from now, or the enclosing one if that is sooner."""
+    deadline = _deadline.get()
+    if seconds is not None:
+        own = Deadline.after(seconds)
+        if deadline is None or own.at < deadline.at:
+            deadline = own
+    token = _deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _deadline.reset(token)
+
+
+@asynccontextmanager
+async def bounded(reserve: float = 0.0, deadline: Optional[Deadline] = None):
+    """
+    Cancel the block `reserve` seconds before the deadline (the current one by default)
+    and raise DeadlineExceeded; no limit without a deadline.
+    """
+    deadline = deadline or _deadline.get()
+    if deadline is None:
+        yield
+        return
+    budget = deadline.remaining() - reserve
+    if budget <= 0:
+        raise DeadlineExceeded("No time left in the turn")
+    try:
+        async with asyncio.timeout(budget) as timeout:
+            yield
+    except TimeoutError:
+        if timeout.expired():
+            raise DeadlineExceeded(f"Gave up after {budget:.1f}s, the rest of the turn's time") from None
+        raise
+
+
+async def until(events: AsyncIterator, deadline: Optional[Deadline] = None) -> AsyncIterator:
+    """Yield from events until the deadline, then close them and raise DeadlineExceeded."""
+    try:
+        while True:
+            async with bounded(deadline=deadline):
+                try:
+                    event = await anext(events)
+                except StopAsyncIteration:
+                    return
+            yield event
+    finally:
+        await events.aclose()
@@ -0,0 +1,235 @@
+"""
+Headless HTTP gateway in front of MCPClient.
+
+    uvicorn LLMCPClient.Gateway:app --workers 4
+    python -m LLMCPClient.Gateway --workers 4 --port 8080
+
+Endpoints:
+    POST /chat          {"message": "...", "history": [{"role": ..., "content": ...}]}
+                        -> {"response": "..."}
+    POST /chat/stream   same body, answered as Server-Sent Events: "delta" events with
+                        the text as it is generated, "progress" events from running
+                        tools, then "done" (or "error").
+    GET  /healthz       readiness (503 while warming up or draining), request coalescing,
+                        scheduler, token calibration and hedging metrics.
+
+Every worker process owns its own SessionPool of connected MCP clients, so the
+service scales out by adding workers or nodes behind a load balancer. On start-up the
+worker connects its first MCP client and the model API before reporting ready (for at
+most WARMUP_TIMEOUT seconds, see LLMCPClient.Warmup). On shutdown
+the worker stops accepting chats, waits for in-flight ones to finish (up to
+GATEWAY_DRAIN_TIMEOUT seconds) and then closes its MCP sessions.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+from contextlib import asynccontextmanager
+from dataclasses import asdict
+from typing import Optional
+
+from sse_starlette.sse import EventSourceResponse
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+from LLMCPClient import Attachments
+from LLMCPClient.Deadlines import TURN_TIMEOUT, within
+from LLMCPClient.HTTPClient import ToolProgress
+from LLMCPClient.Messages import Message
+from LLMCPClient.Providers import HedgedProvider, get_router
+from LLMCPClient.Scheduler import Scheduler
+from LLMCPClient.Tokens import Calibration
+from LLMCPClient.Warmup import WARMUP_TIMEOUT
+from LLMCPClient.SessionPool import SessionPool
+from LLMCPClient.SingleFlight import SingleFlight, request_key
+
+MCP_ENDPOINT = os.getenv("MCP_ENDPOINT", "http://localhost:8000/mcp")
+POOL_SIZE = int(os.getenv("GATEWAY_POOL_SIZE", "4"))
+DRAIN_TIMEOUT = float(os.getenv("GATEWAY_DRAIN_TIMEOUT", "30"))
+
+
+class Gateway:
+    """Per-worker state: the MCP session pool and in-flight request accounting."""
+
+    def __init__(self, endpoint: str = MCP_ENDPOINT, pool_size: int = POOL_SIZE):
+        self.pool = SessionPool(endpoint, size=pool_size)
+        self.flights = SingleFlight()
+        self.draining = False
+        # Start-up warm-up; /healthz reports not ready until it is over
+        self.warming: Optional[asyncio.Task] = None
+        self.in_flight = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    @asynccontextmanager
+    async def lifespan(self, app):
+        await self.pool.start()
+        self.warming = asyncio.create_task(self.warm())
+        try:
+            yield
+        finally:
+            self.warming.cancel()
+            await self.drain()
+            await self.pool.close()
+
+    async def warm(self):
+        """Wait for the first pooled MCP client while opening the model API connections."""
+        async def first_client():
+            async with self.pool.client():
+                pass
+
+        results = await asyncio.gather(
+            asyncio.wait_for(first_client(), WARMUP_TIMEOUT),
+            asyncio.wait_for(get_router().warm(), WARMUP_TIMEOUT),
+            return_exceptions=True,
+        )
+        for name, result in zip(("MCP session pool", "model API"), results):
+            if isinstance(result, Exception):
+                print(f"Gateway: warm-up of the {name} failed: {result!r}")
+
+    async def drain(self, timeout: float = DRAIN_TIMEOUT):
+        """Refuse new chats and wait for the running ones to finish."""
+        self.draining = True
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            print(f"Gateway: drain timed out with {self.in_flight} chats still running")
+
+    @asynccontextmanager
+    async def tracked(self):
+        self.in_flight += 1
+        self._idle.clear()
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            if self.in_flight == 0:
+                self._idle.set()
+
+    async def parse(self, request: Request):
+        """Return (query, history) from a chat request body, or a 400 response."""
+        try:
+            body = await request.json()
+            query = body["message"]
+            # Clients can't upload attachments here, and a known hash would read another user's file
+            history = list(Attachments.checked(
+                (Message(m["role"], m["content"]) for m in body.get("history", [])), references=False
+            ))
+        except (ValueError, KeyError, TypeError) as e:
+            return JSONResponse({"error": f"Invalid request body: {e}"}, status_code=400)
+        if not isinstance(query, str) or not query.strip():
+            return JSONResponse({"error": "'message' must be a non-empty string"}, status_code=400)
+        return query, history
+
+    def key(self, query, history):
+        return request_key(self.pool.endpoint, [m.payload for m in history], query)
+
+    def unavailable(self):
+        return JSONResponse({"error": "Gateway is draining"}, status_code=503)
+
+    async def chat(self, request: Request):
+        if self.draining:
+            return self.unavailable()
+        parsed = await self.parse(request)
+        if isinstance(parsed, JSONResponse):
+            return parsed
+        query, history = parsed
+
+        async def run():
+            # One deadline for the turn, including the wait for a pooled client
+            with within(TURN_TIMEOUT):
+                async with self.pool.client() as client:
+                    return await client.process_query(query, history)
+
+        async with self.tracked():
+            try:
+                response = await self.flights.do(self.key(query, history), run)
+            except Exception as e:
+                return JSONResponse({"error": str(e)}, status_code=502)
+        return JSONResponse({"response": response})
+
+    async def chat_stream(self, request: Request):
+        if self.draining:
+            return self.unavailable()
+        parsed = await self.parse(request)
+        if isinstance(parsed, JSONResponse):
+            return parsed
+        query, history = parsed
+
+        async def deltas():
+            with within(TURN_TIMEOUT):
+                async with self.pool.client() as client:
+                    async for delta in client.stream_query(query, history):
+                        yield delta
+
+        async def events():
+            # A client disconnect cancels this generator; once no identical stream is
+            # listening any more, that closes stream_query and with it the model stream
+            # and any pending tool calls
+            async with self.tracked():
+                try:
+                    async for delta in self.flights.stream(self.key(query, history), deltas):
+                        if isinstance(delta, ToolProgress):
+                            yield {"event": "progress", "data": json.dumps(asdict(delta))}
+                        else:
+                            yield {"event": "delta", "data": json.dumps(delta)}
+                except Exception as e:
+                    yield {"event": "error", "data": json.dumps(str(e))}
+                    return
+            yield {"event": "done", "data": "{}"}
+
+        return EventSourceResponse(events())
+
+    async def healthz(self, request: Request):
+        warming = self.warming is None or not self.warming.done()
+        status = {
+            "status": "draining" if self.draining else "warming" if warming else "ok",
+            "in_flight": self.in_flight,
+            "coalescing": self.flights.metrics(),
+        }
+        status["scheduler"] = {name: Scheduler.get(name).metrics() for name in ("model", "tools")}
+        status["token_calibration"] = Calibration.get().metrics()
+        provider = get_router().inner
+        if isinstance(provider, HedgedProvider):
+            status["hedging"] = provider.metrics()
+        return JSONResponse(status, status_code=503 if self.draining or warming else 200)
+
+
+def create_app(endpoint: str = MCP_ENDPOINT, pool_size: int = POOL_SIZE) -> Starlette:
+    gateway = Gateway(endpoint, pool_size)
+    return Starlette(
+        routes=[
+            Route("/chat", gateway.chat, methods=["POST"]),
+            Route("/chat/stream", gateway.chat_stream, methods=["POST"]),
+            Route("/healthz", gateway.healthz, methods=["GET"]),
+        ],
+        lifespan=gateway.lifespan,
+    )
+
+
+app = create_app()
+
+
+def run():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Chat Genie HTTP gateway")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    uvicorn.run(
+        "LLMCPClient.Gateway:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        timeout_graceful_shutdown=int(DRAIN_TIMEOUT),
+    )
+
+
+if __name__ == "__main__":
+    run()
@@ -1,23 +1,126 @@
 import asyncio
-from typing import Optional
+import json
+from typing import AsyncIterator, Callable, Optional, Sequence, Union
 from contextlib import AsyncExitStack
+from dataclasses import dataclass
 
 from mcp import ClientSession
 from mcp import StdioServerParameters
 from mcp.client.stdio import stdio_client
-from mcp.client.streamable_http import streamablehttp_client
+from mcp.types import (
+    CallToolResult,
+    EmbeddedResource,
+    ImageContent,
+    InitializeResult,
+    ListResourcesResult,
+    LoggingMessageNotificationParams,
+    Prompt,
+    PromptListChangedNotification,
+    Resource,
+    ResourceListChangedNotification,
+    ResourceUpdatedNotification,
+    ServerCapabilities,
+    ServerNotification,
+    TextContent,
+    TextResourceContents,
+    Tool,
+    ToolListChangedNotification,
+)
+from pydantic import AnyUrl
 
-from anthropic import Anthropic
 from dotenv import load_dotenv
 
+from LLMCPClient.Attachments import Attachment
+from LLMCPClient.Cassette import Cassette
+from LLMCPClient.Deadlines import ANSWER_RESERVE, CUT_OFF, TURN_TIMEOUT, DeadlineExceeded, bounded, within
+from LLMCPClient.HealthMonitor import CircuitOpenError, HealthMonitor
+from LLMCPClient.Messages import Message
+from LLMCPClient.Providers import Provider, get_router
+from LLMCPClient.ResourceCache import ResourceCache
+from LLMCPClient.ResumableSession import ResumableSession
+from LLMCPClient.Scheduler import Scheduler
+from LLMCPClient.ToolSchemas import ToolCatalog
+
 load_dotenv()  # load environment variables from .env
 
+MODEL = "claude-3-5-sonnet-20241022"
+MAX_TOOL_ROUNDS = 5  # model calls per query, so a tool-happy model can't loop forever
+
+class Transcript:
+    """
+    The text of one response, assembled from streamed deltas.
+
+    Parts (text blocks, tool call notes) are joined with newlines in the final text;
+    every delta, including those separators, is also passed to on_text as it arrives.
+    """
+
+    def __init__(self, on_text: Optional[Callable[[str], None]] = None):
+        self.parts: list[list[str]] = []
+        self.on_text = on_text
+
+    def start_part(self):
+        if self.parts and self.on_text is not None:
+            self.on_text("\n")
+        self.parts.append([])
+
+    def write(self, text: str):
+        self.parts[-1].append(text)
+        if self.on_text is not None:
+            self.on_text(text)
+
+    def add(self, text: str):
+        self.start_part()
+        self.write(text)
+
+    def text(self) -> str:
+        return "\n".join("".join(part) for part in self.parts)
+
+
+@dataclass(frozen=True)
+class ToolProgress:
+    """A progress notification or log message from a running tool call."""
+
+    tool: str
+    call_id: str
+    progress: Optional[float] = None
+    total: Optional[float] = None
+    message: Optional[str] = None
+    done: bool = False
+
+    def __str__(self) -> str:
+        if self.done:
+            return f"{self.tool} finished"
+        text = f"Running {self.tool}"
+        if self.progress is not None:
+            text += f" ({self.progress:g}/{self.total:g})" if self.total else f" ({self.progress:g})"
+        if self.message:
+            text += f": {self.message}"
+        return text
+
+
 class MCPClient:
-    def __init__(self):
+    def __init__(self, provider: Optional[Provider] = None):
         # Initialize session and client objects
         self.session: Optional[ClientSession] = None
+        self.endpoint = ""
         self.exit_stack = AsyncExitStack()
-        self.anthropic = Anthropic()
+        # CHATGENIE_CASSETTE records or replays all model and tool traffic (see LLMCPClient.Cassette)
+        self.cassette = Cassette.from_env()
+        # Model calls go through the shared provider layer: pooled clients, OpenAI failover
+        self.provider = provider or get_router()
+        # Progress callback of the query being processed, and its running tool calls
+        self._on_progress: Optional[Callable[[ToolProgress], None]] = None
+        self._running_tools: dict[str, str] = {}
+        # Catalogs prefetched when the session is initialized
+        self.capabilities: Optional[ServerCapabilities] = None
+        self.tools: Optional[list[Tool]] = None
+        self.resources: list[Resource] = []
+        self.prompts: list[Prompt] = []
+        # Compiled input validators of the server's tools, rebuilt when the tool list changes
+        self._catalog: Optional[ToolCatalog] = None
+        # Resources this session is subscribed to, and catalogs the server said changed
+        self._subscriptions: set[str] = set()
+        self._changed: set[str] = set()
 
    # ---------- new Streamable-HTTP transport ----------
     async def connect_to_http_server(self, endpoint: str):
@@ -28,117 +131,434 @@ class MCPClient:
             endpoint: Full URL of the MCP endpoint, e.g. 'http://localhost:8000/mcp'
             
         """
-        # The helper takes the endpoint and an optional flag for the extra SSE GET.
-        stream_transport = await self.exit_stack.enter_async_context(
-            streamablehttp_client(endpoint)
-        )
-        read_stream = stream_transport[0]
-        write_stream = stream_transport[1]
-        print()
-        print ("Connected to server:", endpoint)
-        print("Streamable HTTP transport established.")
-        print (stream_transport)
-        print()
-        await self._initialize_session(read_stream, write_stream)
-        
-    # ---------- shared helpers ----------
-    async def _initialize_session(self, read_stream, write_stream):
-
-        """Initialize the MCP session with the given read and write streams."""
-
-
-        self.session = await self.exit_stack.enter_async_context(
-            ClientSession(read_stream, write_stream)
-        )
+        self.endpoint = endpoint
+        if self.cassette is not None and self.cassette.replaying:
+            # Tool traffic is served from the cassette; no server needed
+            self.session = self.cassette.session(endpoint)
+            await self._initialize_session(await self.session.open())
+            return
 
-        print("\nConnected - session created. Now initializing...")
-        print()
+        # Fail fast instead of paying a connect timeout against a server known to be down
+        breaker = HealthMonitor.get().breaker(endpoint)
+        if not breaker.allow_request():
+            raise CircuitOpenError(f"MCP server {endpoint} is unavailable (circuit {breaker.state})")
 
         try:
-            # Initialize the session
-            await self.session.initialize()
-        except Exception as e:
-            print(f"Error initializing session: {e}")
-            return
+            # The session reconnects by itself after connection drops (see LLMCPClient.ResumableSession)
+            session = ResumableSession(endpoint, self._client_session, self._reconnected)
+            if self.cassette is not None:
+                # Wrapped before the handshake, so the prefetched catalogs are recorded too
+                session = self.cassette.session(endpoint, session)
+            init_result = await session.open()
+            self.exit_stack.push_async_callback(session.close)
+            print()
+            print ("Connected to server:", endpoint)
+            print("Streamable HTTP transport established, session:", session.session_id)
+            print()
+            self.session = session
+            await self._initialize_session(init_result)
+        except Exception:
+            breaker.record_failure()
+            raise
+        except BaseException:
+            # Cancelled mid-handshake: says nothing about the server's health
+            breaker.release()
+            raise
+        breaker.record_success()
         
+    # ---------- shared helpers ----------
+    def _client_session(self, read_stream, write_stream) -> ClientSession:
+        """The ClientSession for each connection of the session."""
+        return ClientSession(read_stream, write_stream, logging_callback=self._on_log, message_handler=self._on_message)
+
+    async def _initialize_session(self, init_result: InitializeResult):
+        """Set up the initialized MCP session and prefetch its catalogs."""
+        await self._set_up(self.session, init_result)
 
         print()
         print("\nConnected - session initialized.")
         print()
 
-        tools = (await self.session.list_tools()).tools
-        print("\nConnected - tools available:", [t.name for t in tools])
+        await self.prefetch_catalogs()
+        print("\nConnected - tools available:", [t.name for t in self.tools])
+
+    async def _set_up(self, session, init_result: InitializeResult):
+        self.capabilities = init_result.capabilities
+        if init_result.capabilities.logging is not None:
+            # Server logs are passed on as tool progress while a tool runs
+            try:
+                await session.set_logging_level("info")
+            except Exception as e:
+                print(f"Error setting log level: {e}")
+
+    async def _reconnected(self, session: ClientSession, init_result: Optional[InitializeResult]):
+        """The connection was restored: to the same session, or to a new one if init_result is given."""
+        if init_result is not None:
+            await self._set_up(session, init_result)
+        else:
+            # A rejoined connection gets no resource updates (see LLMCPClient.ResumableSession)
+            await asyncio.gather(
+                *(session.unsubscribe_resource(AnyUrl(uri)) for uri in self._subscriptions),
+                return_exceptions=True,
+            )
+        # The subscriptions ended with the old session or connection
+        ResourceCache.get().unsubscribed(self.endpoint, self._subscriptions)
+        self._subscriptions.clear()
+        # Change notifications sent while disconnected were missed
+        self._changed.update(("tools", "resources", "prompts"))
+        ResourceCache.get().invalidate(self.endpoint)
+        ResourceCache.get().invalidate_prompts(self.endpoint)
+
+    @property
+    def _notified(self) -> bool:
+        """Whether the session's connection receives the server's change notifications."""
+        return getattr(self.session, "notifications", True)
+
+    def _stale(self, catalog: str) -> bool:
+        """Whether a catalog has to be listed again: the server said it changed, or can't say."""
+        stale = catalog in self._changed or not self._notified
+        self._changed.discard(catalog)
+        # Servers that don't offer resources or prompts aren't asked for them
+        return stale and (catalog == "tools" or getattr(self.capabilities, catalog, None) is not None)
+
+    async def prefetch_catalogs(self):
+        """Fetch the tool, resource and prompt lists the server offers, concurrently."""
+        capabilities = self.capabilities
+        listings = [self.session.list_tools()]
+        if capabilities is not None and capabilities.resources is not None:
+            listings.append(self.session.list_resources())
+        if capabilities is not None and capabilities.prompts is not None:
+            listings.append(self.session.list_prompts())
+        results = await asyncio.gather(*listings)
+        self.tools = results[0].tools
+        self._catalog = ToolCatalog(self.tools)
+        for result in results[1:]:
+            if isinstance(result, ListResourcesResult):
+                self.resources = result.resources
+            else:
+                self.prompts = result.prompts
+
+    async def _list_tools(self) -> list[Tool]:
+        """The server's tools: the prefetched list, until the server says it changed."""
+        if self._stale("tools") or self.tools is None:
+            self.tools = (await self.session.list_tools()).tools
+        return self.tools
+
+    async def list_resources(self) -> list[Resource]:
+        """The server's resources: the prefetched list, until the server says it changed."""
+        if self._stale("resources"):
+            self.resources = (await self.session.list_resources()).resources
+        return self.resources
+
+    async def list_prompts(self) -> list[Prompt]:
+        """The server's prompts: the prefetched list, until the server says it changed."""
+        if self._stale("prompts"):
+            self.prompts = (await self.session.list_prompts()).prompts
+        return self.prompts
+
+    async def read_resource(self, uri: str) -> tuple[Attachment, ...]:
+        """
+        A resource's contents, stored as attachments (see LLMCPClient.ResourceCache).
+
+        Served from the process-wide cache while it is fresh; otherwise read from the
+        server, which is then asked for updates of it if it supports subscriptions.
+        """
+        uri = str(AnyUrl(uri))
+        attachments = await ResourceCache.get().read(self.endpoint, uri, lambda: self.session.read_resource(AnyUrl(uri)))
+        resources = self.capabilities.resources if self.capabilities is not None else None
+        if resources is not None and resources.subscribe and self._notified and uri not in self._subscriptions:
+            try:
+                await self.session.subscribe_resource(AnyUrl(uri))
+            except Exception as e:
+                print(f"Couldn't subscribe to {uri}: {e}")
+            else:
+                self._subscriptions.add(uri)
+                ResourceCache.get().subscribed(self.endpoint, uri)
+        return attachments
+
+    async def resource_blocks(self, uri: str) -> list[dict]:
+        """Content blocks referring to a resource, to put in a message like an uploaded document."""
+        return [attachment.reference() for attachment in await self.read_resource(uri)]
+
+    async def get_prompt(self, name: str, arguments: Optional[dict[str, str]] = None) -> list[Message]:
+        """A server prompt's messages for the arguments, cached across sessions (see LLMCPClient.ResourceCache)."""
+        prompts = self.capabilities.prompts if self.capabilities is not None else None
+        result = await ResourceCache.get().prompt(
+            self.endpoint, name, arguments,
+            lambda: self.session.get_prompt(name, arguments),
+            trusted=prompts is not None and bool(prompts.listChanged) and self._notified,
+        )
+        return [Message(m.role, self._content_blocks([m.content])) for m in result.messages]
+
 
+    async def process_query(
+        self,
+        query: str,
+        history: Sequence[Message] = (),
+        on_text: Optional[Callable[[str], None]] = None,
+        on_progress: Optional[Callable[[ToolProgress], None]] = None,
+        timeout: Optional[float] = TURN_TIMEOUT,
+    ) -> str:
+        """
+        Process a query using Claude and available tools
+
+        Args:
+            query: The user's message for this turn: text, or content blocks (e.g. with
+                attachment references, see LLMCPClient.Attachments)
+            history: Earlier messages of the conversation (e.g. Conversation.window()),
+                sent ahead of the query; their cached payload dicts are reused as-is.
+            on_text: Called with each piece of the response text as it streams in.
+            on_progress: Called with each ToolProgress of the tools it runs: progress
+                notifications, server log messages and a final done update per call.
+            timeout: Seconds the whole turn may take (see LLMCPClient.Deadlines); tools
+                still running near the end are skipped and a model response still
+                streaming at the end is cut off, so the answer so far is returned.
+        """
+        with within(timeout):
+            return await self._process_query(query, history, on_text, on_progress)
 
-    async def process_query(self, query: str) -> str:
-        """Process a query using Claude and available tools"""
+    async def _process_query(self, query, history, on_text, on_progress) -> str:
         messages = [
             {
                 "role": "assistant",
                 "content": "today is {now}. Your role is to provide direct response of the tool. Do not add anything additional. Only when there is no need for tools, just be a helpful assistant."
             },
+            *(message.payload for message in history),
               {
                 "role": "user",
                 "content": query
             }
         ]
 
-        response = await self.session.list_tools()
+        async with bounded():
+            tools = await self._list_tools()
         available_tools = [{ 
             "name": tool.name,
             "description": tool.description,
             "input_schema": tool.inputSchema
-        } for tool in response.tools]
+        } for tool in tools]
+        if self._catalog is None or self._catalog.fingerprint != ToolCatalog.fingerprint_of(tools):
+            self._catalog = ToolCatalog(tools)
         
 
         print("\nAvailable tools:", available_tools)
 
 
-        # Initial Claude API call
-        response = self.anthropic.messages.create(
-            model="claude-3-5-sonnet-20241022",
-            max_tokens=1000,
-            messages=messages,
-            tools=available_tools
+        transcript = Transcript(on_text)
+        self._on_progress = on_progress
+        try:
+            return await self._tool_rounds(transcript, messages, available_tools)
+        finally:
+            self._on_progress = None
+
+    async def _tool_rounds(self, transcript: Transcript, messages: list, available_tools: list) -> str:
+        """Alternate model responses and tool calls until the model stops calling tools."""
+        # Each round streams one Claude response. Tool calls are started while the
+        # response is still streaming; their results go back in the next round.
+        # Past the turn's deadline the answer so far is returned, marked as cut off.
+        for _ in range(MAX_TOOL_ROUNDS):
+            pending = []
+            try:
+                try:
+                    async with bounded():
+                        content = await self._stream_response(
+                            transcript,
+                            pending,
+                            model=MODEL,
+                            max_tokens=1000,
+                            messages=messages,
+                            tools=available_tools
+                        )
+                except DeadlineExceeded:
+                    transcript.add(CUT_OFF)
+                    break
+                tool_results = [self._tool_result(tool_use_id, await task) for tool_use_id, task in pending]
+            finally:
+                # Don't leave tool calls running if the turn failed or was cancelled
+                for _, task in pending:
+                    task.cancel()
+
+            messages.append({"role": "assistant", "content": content})
+            if not tool_results:
+                break
+            messages.append({"role": "user", "content": tool_results})
+
+        return transcript.text()
+
+    async def stream_query(
+        self, query: str, history: Sequence[Message] = ()
+    ) -> AsyncIterator[Union[str, ToolProgress]]:
+        """
+        Like process_query, but yield the response text as it is generated, interleaved
+        with the ToolProgress updates of running tools.
+
+        Closing the generator early (e.g. the HTTP client went away) cancels the query.
+        """
+        deltas = asyncio.Queue()
+        task = asyncio.create_task(
+            self.process_query(query, history, on_text=deltas.put_nowait, on_progress=deltas.put_nowait)
         )
+        task.add_done_callback(lambda _: deltas.put_nowait(None))
+        try:
+            while (delta := await deltas.get()) is not None:
+                yield delta
+            await task
+        finally:
+            task.cancel()
+
+    async def _stream_response(self, transcript: Transcript, pending: list, **params) -> list[dict]:
+        """
+        Stream one Claude response, dispatching tool calls as soon as their input is complete.
 
-        # Process response and handle tool calls
-        tool_results = []
-        final_text = []
+        Text deltas go to the transcript as they arrive. Tool input arrives as
+        input_json_delta fragments; once a tool_use block stops, its input is parsed and
+        session.call_tool is started as a task, overlapping the tool's latency with the
+        rest of the generation; (tool_use_id, task) pairs are appended to pending.
 
-        for content in response.content:
-            if content.type == 'text':
-                final_text.append(content.text)
-            elif content.type == 'tool_use':
-                tool_name = content.name
-                tool_args = content.input
-                
-                # Execute tool call
-                result = await self.session.call_tool(tool_name, tool_args)
-                tool_results.append({"call": tool_name, "result": result})
-                final_text.append(f"[Calling tool {tool_name} with args {tool_args}]")
-
-                # Continue conversation with tool results
-                if hasattr(content, 'text') and content.text:
-                    messages.append({
-                      "role": "assistant",
-                      "content": content.text
+        Returns the response's content blocks.
+        """
+        content = []
+        blocks = {}
+        fragments = {}
+
+        async for event in self._model_events(**params):
+            event_type = event["type"]
+            if event_type == "content_block_start":
+                block = event["content_block"]
+                blocks[event["index"]] = block
+                fragments[event["index"]] = []
+                if block["type"] == "text":
+                    transcript.start_part()
+            elif event_type == "content_block_delta":
+                delta = event["delta"]
+                if delta["type"] == "text_delta":
+                    fragments[event["index"]].append(delta["text"])
+                    transcript.write(delta["text"])
+                elif delta["type"] == "input_json_delta":
+                    fragments[event["index"]].append(delta["partial_json"])
+            elif event_type == "content_block_stop":
+                block = blocks.pop(event["index"])
+                text = "".join(fragments.pop(event["index"]))
+                if block["type"] == "text" and text:
+                    content.append({"type": "text", "text": text})
+                elif block["type"] == "tool_use":
+                    tool_name = block["name"]
+                    try:
+                        tool_args = json.loads(text) if text else {}
+                    except ValueError:
+                        # Passed on as text, for _call_tool to answer with a corrective error
+                        tool_args = text
+                    content.append({
+                        "type": "tool_use", "id": block["id"], "name": tool_name,
+                        "input": tool_args if isinstance(tool_args, dict) else {},
                     })
-                messages.append({
-                    "role": "user", 
-                    "content": result.content
-                })
 
-                # Get next response from Claude
-                response = self.anthropic.messages.create(
-                    model="claude-3-5-sonnet-20241022",
-                    max_tokens=1000,
-                    messages=messages,
-                )
+                    # Execute tool call
+                    transcript.add(f"[Calling tool {tool_name} with args {tool_args}]")
+                    pending.append((block["id"], asyncio.create_task(self._call_tool(tool_name, tool_args, block["id"]))))
+
+        return content
+
+    async def _model_events(self, **params) -> AsyncIterator[dict]:
+        """
+        Call the model over a streaming connection and yield its raw stream events as dicts.
+
+        Streaming keeps the HTTP response open for the whole generation, so cancelling
+        the task consuming this (see LLMCPClient.Cancellation) closes the stream and stops
+        the request server-side instead of waiting for a complete response.
+        """
+        async for event in self.provider.stream(**params):
+            yield event
 
-                final_text.append(response.content[0].text)
+    async def _call_tool(self, tool_name: str, tool_args: Union[dict, str], call_id: str = "") -> CallToolResult:
+        """
+        Call a tool, turning failures into an error result the model can see.
+
+        Arguments are checked against the tool's inputSchema first (see
+        LLMCPClient.ToolSchemas); invalid ones are answered locally without calling the server.
+        """
+        if self._catalog is not None:
+            tool_args, problem = self._catalog.check(tool_name, tool_args)
+            if problem is not None:
+                return CallToolResult(content=[TextContent(type="text", text=problem)], isError=True)
+
+        report = self._on_progress
+        kwargs = {}
+        if report is not None:
+            async def on_progress(progress: float, total: Optional[float], message: Optional[str]):
+                report(ToolProgress(tool_name, call_id, progress, total, message))
+
+            # Passing a progress callback makes the session send a progress token with the call
+            kwargs["progress_callback"] = on_progress
+            self._running_tools[call_id] = tool_name
+            report(ToolProgress(tool_name, call_id))
+        try:
+            # Tool calls queue by priority with every other session's (see LLMCPClient.Scheduler),
+            # and have to be done in time for the model to answer with their results
+            async with bounded(ANSWER_RESERVE):
+                async with Scheduler.get("tools").slot():
+                    return await self.session.call_tool(tool_name, tool_args, **kwargs)
+        except DeadlineExceeded:
+            text = f"Skipped: {tool_name} didn't finish within the time left for this turn. Answer without its result."
+            return CallToolResult(content=[TextContent(type="text", text=text)], isError=True)
+        except Exception as e:
+            return CallToolResult(content=[TextContent(type="text", text=f"Error: {e}")], isError=True)
+        finally:
+            if report is not None:
+                del self._running_tools[call_id]
+                report(ToolProgress(tool_name, call_id, done=True))
+
+    async def _on_log(self, params: LoggingMessageNotificationParams):
+        """Pass server log messages on as progress of the running tool."""
+        report = self._on_progress
+        if report is None or not self._running_tools:
+            return
+        message = params.data if isinstance(params.data, str) else json.dumps(params.data, default=str)
+        # Log messages aren't tied to a request; only attribute them when one tool is running
+        if len(self._running_tools) == 1:
+            call_id, tool_name = next(iter(self._running_tools.items()))
+        else:
+            call_id, tool_name = "", "tools"
+        report(ToolProgress(tool_name, call_id, message=message))
+
+    async def _on_message(self, message):
+        """Act on the server's change notifications; runs in the session's receive loop, so never awaits a request."""
+        if not isinstance(message, ServerNotification):
+            return
+        notification = message.root
+        if isinstance(notification, ResourceUpdatedNotification):
+            ResourceCache.get().invalidate(self.endpoint, str(notification.params.uri))
+        elif isinstance(notification, ResourceListChangedNotification):
+            self._changed.add("resources")
+            ResourceCache.get().invalidate(self.endpoint)
+        elif isinstance(notification, PromptListChangedNotification):
+            self._changed.add("prompts")
+            ResourceCache.get().invalidate_prompts(self.endpoint)
+        elif isinstance(notification, ToolListChangedNotification):
+            self._changed.add("tools")
+
+    @staticmethod
+    def _content_blocks(items) -> list[dict]:
+        """Convert MCP content (of a tool result or prompt) into Messages API content blocks."""
+        blocks = []
+        for item in items:
+            if isinstance(item, TextContent):
+                blocks.append({"type": "text", "text": item.text})
+            elif isinstance(item, ImageContent):
+                blocks.append({
+                    "type": "image",
+                    "source": {"type": "base64", "media_type": item.mimeType, "data": item.data}
+                })
+            elif isinstance(item, EmbeddedResource) and isinstance(item.resource, TextResourceContents):
+                blocks.append({"type": "text", "text": item.resource.text})
+            else:
+                blocks.append({"type": "text", "text": item.model_dump_json()})
+        return blocks
 
-        return "\n".join(final_text)
+    @classmethod
+    def _tool_result(cls, tool_use_id: str, result: CallToolResult) -> dict:
+        """Convert an MCP tool result into a Messages API tool_result block."""
+        return {"type": "tool_result", "tool_use_id": tool_use_id, "content": cls._content_blocks(result.content), "is_error": result.isError}
 
     async def chat_loop(self):
         """Run an interactive chat loop"""
@@ -159,11 +579,11 @@ class MCPClient:
                 print(f"\nError: {str(e)}")
 
 
-    async def chat(self, query: str) -> str:
+    async def chat(self, query: str, history: Sequence[Message] = ()) -> str:
         """Process a query using the MCP server and print the response"""
 
         try:
-            response = await self.process_query(query)
+            response = await self.process_query(query, history)
             print("\n" + response)
             return response
                 
@@ -172,6 +592,9 @@ class MCPClient:
 
     async def cleanup(self):
         """Clean up resources"""
+        # Resources this session watched are only trusted for the TTL from now on
+        ResourceCache.get().unsubscribed(self.endpoint, self._subscriptions)
+        self._subscriptions.clear()
         await self.exit_stack.aclose()
 
 async def main():
@@ -0,0 +1,230 @@
+import asyncio
+import threading
+import time
+import uuid
+import weakref
+from dataclasses import dataclass
+from typing import Optional
+
+from mcp import ClientSession
+from mcp.client.streamable_http import streamable_http_client
+
+from LLMCPClient.BackgroundLoop import BackgroundLoop
+
+
+class CircuitOpenError(ConnectionError):
+    """Raised instead of connecting when an endpoint's circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Closed/open/half-open breaker for a single MCP endpoint.
+
+    After failure_threshold consecutive failures the breaker opens and requests fail
+    fast. Once reset_timeout has passed it goes half-open and lets a single trial
+    request through; that trial decides whether it closes again or re-opens.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+            self._trial_in_flight = False
+        return self._state
+
+    def allow_request(self) -> bool:
+        """Return True if a request may go to the endpoint now."""
+        with self._lock:
+            state = self._current_state()
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def release(self):
+        """Give back a half-open trial slot without recording an outcome (e.g. on cancel)."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+
+@dataclass
+class ServerStatus:
+    """Latest probe result for one endpoint, as shown in the sidebar."""
+
+    state: str
+    latency: Optional[float] = None
+    error: Optional[str] = None
+    checked_at: Optional[float] = None
+
+    @property
+    def active(self) -> bool:
+        return self.state == CircuitBreaker.CLOSED and self.latency is not None
+
+
+class HealthMonitor:
+    """
+    Process-wide health probes for MCP endpoints.
+
+    Every watched endpoint is probed on the background loop every `interval` seconds
+    with a full Streamable-HTTP handshake plus a ping, until its last watcher unwatches
+    it (see Watch for app sessions). Probe results (and the outcome of
+    real connections made by MCPClient) feed a CircuitBreaker per endpoint, so a dead
+    server is answered with CircuitOpenError instead of costing each user a timeout.
+    """
+
+    _instance = None
+    _lock = threading.Lock()
+
+    def __init__(self, interval: float = 15.0, timeout: float = 5.0):
+        self.interval = interval
+        self.timeout = timeout
+        self._breakers: dict[str, CircuitBreaker] = {}
+        self._status: dict[str, ServerStatus] = {}
+        # Owners watching each endpoint; probed while there is one
+        self._watchers: dict[str, set[str]] = {}
+        self._task = None
+        self._state_lock = threading.Lock()
+
+    @classmethod
+    def get(cls) -> "HealthMonitor":
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    def breaker(self, endpoint: str) -> CircuitBreaker:
+        with self._state_lock:
+            if endpoint not in self._breakers:
+                self._breakers[endpoint] = CircuitBreaker()
+            return self._breakers[endpoint]
+
+    def status(self, endpoint: str) -> ServerStatus:
+        with self._state_lock:
+            status = self._status.get(endpoint)
+        state = self.breaker(endpoint).state
+        if status is None:
+            return ServerStatus(state=state)
+        return ServerStatus(state, status.latency, status.error, status.checked_at)
+
+    def watch(self, endpoint: str, owner: str = "process"):
+        """Start probing an endpoint in the background for owner (no-op if it already watches it)."""
+        if not endpoint:
+            return
+        with self._state_lock:
+            self._watchers.setdefault(endpoint, set()).add(owner)
+            if self._task is None:
+                self._task = BackgroundLoop.get().submit(self._run())
+
+    def unwatch(self, endpoint: str, owner: str = "process"):
+        """Stop probing an endpoint for owner; probes stop when no owner is left."""
+        with self._state_lock:
+            owners = self._watchers.get(endpoint)
+            if owners is None:
+                return
+            owners.discard(owner)
+            if not owners:
+                del self._watchers[endpoint]
+                self._status.pop(endpoint, None)
+
+    def session_watch(self) -> "Watch":
+        """A Watch for one app session, kept in its session state."""
+        return Watch(self)
+
+    async def probe(self, endpoint: str) -> float:
+        """Connect, initialize and ping the endpoint once. Returns the latency in seconds."""
+        started = time.monotonic()
+        async with asyncio.timeout(self.timeout):
+            async with streamable_http_client(endpoint) as (read_stream, write_stream, _):
+                async with ClientSession(read_stream, write_stream) as session:
+                    await session.initialize()
+                    await session.send_ping()
+        return time.monotonic() - started
+
+    async def check(self, endpoint: str):
+        """Probe one endpoint and record the result on its breaker."""
+        breaker = self.breaker(endpoint)
+        try:
+            latency = await self.probe(endpoint)
+        except Exception as e:
+            breaker.record_failure()
+            self._record(endpoint, ServerStatus(breaker.state, None, str(e) or type(e).__name__, time.time()))
+        else:
+            breaker.record_success()
+            self._record(endpoint, ServerStatus(breaker.state, latency, None, time.time()))
+
+    def _record(self, endpoint: str, status: ServerStatus):
+        with self._state_lock:
+            # Unwatched while the probe ran
+            if endpoint in self._watchers:
+                self._status[endpoint] = status
+
+    async def _run(self):
+        while True:
+            with self._state_lock:
+                endpoints = list(self._watchers)
+            await asyncio.gather(*(self.check(endpoint) for endpoint in endpoints))
+            await asyncio.sleep(self.interval)
+
+
+def _unwatch_all(monitor: HealthMonitor, owner: str, endpoints: set[str]):
+    for endpoint in list(endpoints):
+        monitor.unwatch(endpoint, owner)
+
+
+class Watch:
+    """
+    The endpoints one app session has under probes.
+
+    update() is called on every rerun with the session's current servers, so edited and
+    deleted ones are unwatched right away; the rest are unwatched once the session's
+    state, which holds the Watch, is dropped.
+    """
+
+    def __init__(self, monitor: HealthMonitor):
+        self._monitor = monitor
+        self._owner = uuid.uuid4().hex
+        self._endpoints: set[str] = set()
+        weakref.finalize(self, _unwatch_all, monitor, self._owner, self._endpoints)
+
+    def update(self, endpoints):
+        """Watch exactly these endpoints for the session."""
+        endpoints = {endpoint for endpoint in endpoints if endpoint}
+        for endpoint in self._endpoints - endpoints:
+            self._monitor.unwatch(endpoint, self._owner)
+        for endpoint in endpoints - self._endpoints:
+            self._monitor.watch(endpoint, self._owner)
+        self._endpoints.clear()
+        self._endpoints.update(endpoints)
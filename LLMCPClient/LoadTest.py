@@ -0,0 +1,337 @@
+"""
+Headless load test of the Streamlit apps against local mock backends.
+
+    python -m LLMCPClient.LoadTest --sessions 1 5 10 20 --turns 5
+    python -m LLMCPClient.LoadTest --app chatbot_app_mcp.py:mcp --sessions 10
+
+Starts a mock model API (Anthropic Messages and OpenAI chat completions, streaming a
+fixed-length answer at --token-delay per token) and a mock MCP server with an echo tool,
+both in-process on free ports, and points the apps at them. Each simulated user is a
+Streamlit AppTest session driven from its own thread, so N sessions share one process
+the way N browser tabs share one `streamlit run`. For every app and session count it
+measures:
+
+    turn       time of the rerun that sends a message, including the streamed answer
+    render     time of a rerun without input, i.e. re-rendering the history
+    memory     memory retained per session (traced in a separate, sequential pass)
+    throughput turns per second across all sessions
+
+and reports the capacity: the largest session count whose turn p95 stays within --target
+seconds without errors. A turn that raises, shows an st.error or gets the apps' fallback
+reply instead of the answer counts as an error. An app is given as path[:mode]; the mode of chatbot_app_mcp.py
+is "standalone" (default) or "mcp".
+
+AppTest keeps some state in module globals, so concurrent sessions now and then print a
+"Runtime hasn't been created!" traceback from a script thread; it doesn't affect the
+measurements.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import socket
+import statistics
+import tempfile
+import threading
+import time
+import tracemalloc
+from dataclasses import dataclass, field
+
+from streamlit import config as st_config
+
+from LLMCPClient.HealthMonitor import HealthMonitor
+
+DEFAULT_APPS = ("chatbot_app_mcp.py", "chatbot_app_mcp.py:mcp", "chatbot_app_pro.py", "streamlit_app.py", "chatbot_app.py")
+SECRETS = {"ANTHROPIC_API_KEY": "mock", "openai_api_key": "mock"}
+# What the apps answer in place of a reply when the turn failed
+FALLBACK_REPLY = "I'm having trouble connecting"
+
+_WORDS = "the quick brown fox jumps over a lazy dog while streaming tokens".split()
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _sse(data: dict, event: str = None) -> str:
+    return (f"event: {event}\n" if event else "") + f"data: {json.dumps(data)}\n\n"
+
+
+def _mock_api(tokens: int, token_delay: float):
+    """A Starlette app answering the Anthropic and OpenAI streaming endpoints."""
+    from starlette.applications import Starlette
+    from starlette.responses import JSONResponse, StreamingResponse
+    from starlette.routing import Route
+
+    def answer():
+        return [_WORDS[i % len(_WORDS)] + " " for i in range(tokens)]
+
+    async def anthropic(request):
+        body = await request.json()
+        last = body["messages"][-1]["content"]
+        # With tools, call the echo tool once per question, then answer
+        call_tool = bool(body.get("tools")) and isinstance(last, str)
+
+        async def events():
+            message = {"id": "msg_mock", "type": "message", "role": "assistant", "model": body["model"], "content": [],
+                       "stop_reason": None, "stop_sequence": None, "usage": {"input_tokens": 10, "output_tokens": 0}}
+            yield _sse({"type": "message_start", "message": message}, "message_start")
+            if call_tool:
+                block = {"type": "tool_use", "id": "toolu_mock", "name": "echo", "input": {}}
+                yield _sse({"type": "content_block_start", "index": 0, "content_block": block}, "content_block_start")
+                delta = {"type": "input_json_delta", "partial_json": json.dumps({"text": last})}
+                yield _sse({"type": "content_block_delta", "index": 0, "delta": delta}, "content_block_delta")
+            else:
+                block = {"type": "text", "text": ""}
+                yield _sse({"type": "content_block_start", "index": 0, "content_block": block}, "content_block_start")
+                for text in answer():
+                    await asyncio.sleep(token_delay)
+                    delta = {"type": "text_delta", "text": text}
+                    yield _sse({"type": "content_block_delta", "index": 0, "delta": delta}, "content_block_delta")
+            yield _sse({"type": "content_block_stop", "index": 0}, "content_block_stop")
+            stop = "tool_use" if call_tool else "end_turn"
+            yield _sse({"type": "message_delta", "delta": {"stop_reason": stop, "stop_sequence": None},
+                        "usage": {"output_tokens": tokens}}, "message_delta")
+            yield _sse({"type": "message_stop"}, "message_stop")
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    async def openai(request):
+        body = await request.json()
+
+        async def chunks():
+            base = {"id": "chatcmpl-mock", "object": "chat.completion.chunk", "created": 0, "model": body["model"]}
+            for text in answer():
+                await asyncio.sleep(token_delay)
+                yield f"data: {json.dumps(dict(base, choices=[{'index': 0, 'delta': {'content': text}, 'finish_reason': None}]))}\n\n"
+            yield f"data: {json.dumps(dict(base, choices=[{'index': 0, 'delta': {}, 'finish_reason': 'stop'}]))}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(chunks(), media_type="text/event-stream")
+
+    async def models(request):
+        return JSONResponse({"object": "list", "data": [], "has_more": False, "first_id": None, "last_id": None})
+
+    return Starlette(routes=[
+        Route("/v1/messages", anthropic, methods=["POST"]),
+        Route("/v1/chat/completions", openai, methods=["POST"]),
+        Route("/v1/models", models),
+    ])
+
+
+def _mock_mcp():
+    from mcp.server.fastmcp import FastMCP
+
+    server = FastMCP("load-test")
+
+    @server.tool()
+    def echo(text: str) -> str:
+        """Echo the text back."""
+        return text
+
+    return server.streamable_http_app()
+
+
+def _serve(app, port: int):
+    """Run an ASGI app with uvicorn on a daemon thread until the process exits."""
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_config=None, access_log=False))
+    threading.Thread(target=server.run, name=f"mock-{port}", daemon=True).start()
+    deadline = time.monotonic() + 10
+    while not server.started:
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"Mock server on port {port} didn't start")
+        time.sleep(0.05)
+
+
+def start_mocks(tokens: int = 50, token_delay: float = 0.005) -> str:
+    """Start the mock backends and point the apps at them; returns the mock MCP endpoint."""
+    api_port, mcp_port = _free_port(), _free_port()
+    _serve(_mock_api(tokens, token_delay), api_port)
+    _serve(_mock_mcp(), mcp_port)
+    endpoint = f"http://127.0.0.1:{mcp_port}/mcp"
+
+    os.environ["ANTHROPIC_BASE_URL"] = f"http://127.0.0.1:{api_port}"
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{api_port}/v1"
+    os.environ.pop("CHATGENIE_CASSETTE", None)
+    # The shared server list of chatbot_app_mcp.py (see LLMCPClient.ServerConfig)
+    config = tempfile.NamedTemporaryFile("w", suffix=".toml", delete=False)
+    config.write(f'[MCP_SERVERS.mock]\nendpoint = "{endpoint}"\n')
+    config.close()
+    os.environ["CHATGENIE_CONFIG"] = config.name
+    # Process-wide secrets: AppTest.secrets swaps the global st.secrets on every run, which
+    # races between concurrent sessions
+    secrets = tempfile.NamedTemporaryFile("w", suffix=".toml", delete=False)
+    secrets.write("".join(f'{key} = "{value}"\n' for key, value in SECRETS.items()))
+    secrets.close()
+    st_config.set_option("secrets.files", [secrets.name])
+
+    # The server selectbox label carries the health status, and AppTest can't follow a
+    # label that changes between reruns: settle the first probe before any session opens
+    monitor = HealthMonitor.get()
+    monitor.watch(endpoint)
+    deadline = time.monotonic() + 10
+    while monitor.status(endpoint).checked_at is None and time.monotonic() < deadline:
+        time.sleep(0.05)
+    return endpoint
+
+
+# ---------- sessions ----------
+
+@dataclass
+class SessionResult:
+    turns: list[float] = field(default_factory=list)
+    renders: list[float] = field(default_factory=list)
+    errors: list[str] = field(default_factory=list)
+
+
+def _open(app: str, mode: str, timeout: float):
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(os.path.abspath(app), default_timeout=timeout)
+    at.run()
+    if mode:
+        next(box for box in at.selectbox if box.label == "Run Mode:").set_value(mode).run()
+    return at
+
+
+def _errors(at) -> list[str]:
+    return [e.message for e in at.exception] + [e.value for e in at.error]
+
+
+def _turn_errors(at) -> list[str]:
+    """Errors of the rerun that sent a message, including a fallback in place of the reply."""
+    errors = _errors(at)
+    replies = [message for message in at.chat_message if message.name == "assistant"]
+    if replies and any(FALLBACK_REPLY in markdown.value for markdown in replies[-1].markdown):
+        errors.append(f"Fallback reply: {replies[-1].markdown[-1].value}")
+    return errors
+
+
+def _drive(at, turns: int, result: SessionResult, start: threading.Barrier = None):
+    if start is not None:
+        start.wait()
+    for i in range(turns):
+        try:
+            started = time.perf_counter()
+            at.chat_input[0].set_value(f"Message {i}: tell me about {_WORDS[i % len(_WORDS)]}").run()
+            result.turns.append(time.perf_counter() - started)
+            # Before the next rerun, which clears the turn's st.error
+            result.errors.extend(_turn_errors(at))
+            started = time.perf_counter()
+            at.run()
+            result.renders.append(time.perf_counter() - started)
+        except Exception as e:
+            # A session that breaks down (or times out) is out of the test from here on
+            result.errors.append(f"{type(e).__name__}: {e}")
+            return
+        result.errors.extend(_errors(at))
+
+
+def _percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))] if values else float("nan")
+
+
+def run_step(app: str, mode: str, sessions: int, turns: int, timeout: float) -> dict:
+    """Drive `sessions` concurrent sessions through `turns` turns each."""
+    tests = [_open(app, mode, timeout) for _ in range(sessions)]
+    results = [SessionResult() for _ in tests]
+    start = threading.Barrier(sessions + 1)
+    threads = [
+        threading.Thread(target=_drive, args=(at, turns, result, start), daemon=True)
+        for at, result in zip(tests, results)
+    ]
+    for thread in threads:
+        thread.start()
+    start.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    turn_times = [t for r in results for t in r.turns]
+    render_times = [t for r in results for t in r.renders]
+    errors = [e for r in results for e in r.errors]
+    return {
+        "sessions": sessions,
+        "turn_p50": statistics.median(turn_times) if turn_times else float("nan"),
+        "turn_p95": _percentile(turn_times, 0.95),
+        "render_p50": statistics.median(render_times) if render_times else float("nan"),
+        "render_p95": _percentile(render_times, 0.95),
+        "throughput": len(turn_times) / elapsed,
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+    }
+
+
+def session_memory(app: str, mode: str, turns: int, timeout: float, sessions: int = 3) -> float:
+    """Bytes retained per session after `turns` turns, traced over a few sequential sessions."""
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        tests = []
+        for _ in range(sessions):
+            at = _open(app, mode, timeout)
+            _drive(at, turns, SessionResult())
+            tests.append(at)
+        retained = tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+    return retained / sessions
+
+
+def report(app: str, steps: list[dict], memory: float, target: float):
+    capacity = max((s["sessions"] for s in steps if s["turn_p95"] <= target and not s["errors"]), default=0)
+    print(f"\n{app}")
+    print(f"{'sessions':>9}{'turn p50':>10}{'turn p95':>10}{'render p50':>12}{'render p95':>12}{'turns/s':>9}{'errors':>8}")
+    for s in steps:
+        print(
+            f"{s['sessions']:>9}{s['turn_p50']:>10.3f}{s['turn_p95']:>10.3f}{s['render_p50']:>12.3f}"
+            f"{s['render_p95']:>12.3f}{s['throughput']:>9.1f}{s['errors']:>8}"
+        )
+        if s["first_error"]:
+            print(f"{'':>9}first error: {s['first_error'][:100]}")
+    print(f"memory per session: {memory / 1e6:.2f} MB")
+    print(f"capacity: {capacity} concurrent sessions with turn p95 <= {target:.1f}s")
+
+
+def run():
+    parser = argparse.ArgumentParser(description="Load test the Streamlit apps against mock backends")
+    parser.add_argument("--app", nargs="+", default=list(DEFAULT_APPS), help="app scripts as path[:mode]")
+    parser.add_argument("--sessions", nargs="+", type=int, default=[1, 5, 10, 20], help="concurrent session counts to try")
+    parser.add_argument("--turns", type=int, default=5, help="messages sent by every session")
+    parser.add_argument("--tokens", type=int, default=50, help="tokens in every mock answer")
+    parser.add_argument("--token-delay", type=float, default=0.005, help="seconds between mock tokens")
+    parser.add_argument("--target", type=float, default=2.0, help="turn p95 (seconds) a session count must meet")
+    parser.add_argument("--timeout", type=float, default=60.0, help="seconds a single rerun may take")
+    parser.add_argument("--json", metavar="PATH", help="also write the results as JSON")
+    args = parser.parse_args()
+
+    # Per-request logging would swamp the report (and cost time the apps don't spend);
+    # Streamlit resets the uvicorn loggers to its own level when its config loads
+    st_config.set_option("logger.level", "error")
+    for name in ("httpx", "mcp", "uvicorn", "streamlit.runtime.scriptrunner_utils.script_run_context"):
+        logging.getLogger(name).setLevel(logging.ERROR)
+    start_mocks(args.tokens, args.token_delay)
+    results = {}
+    for spec in args.app:
+        app, _, mode = spec.partition(":")
+        steps = []
+        for sessions in args.sessions:
+            steps.append(run_step(app, mode, sessions, args.turns, args.timeout))
+        memory = session_memory(app, mode, args.turns, args.timeout)
+        report(spec, steps, memory, args.target)
+        results[spec] = {"steps": steps, "memory_per_session": memory}
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,281 @@
+import json
+import os
+import sys
+import threading
+from dataclasses import dataclass
+from typing import Iterator, Optional, Sequence
+
+from LLMCPClient import Tokens
+
+_MESSAGE_BYTES = 256  # the object, its slots and the payload dict
+
+
+class Message:
+    """
+    One immutable chat message.
+
+    Roles are interned so every message shares the same two or three role strings, and
+    the API payload dict, its JSON encoding and the token estimate are computed at most
+    once per message instead of being rebuilt on every turn. The cached payload dict is
+    shared between turns: treat it as read-only.
+    """
+
+    __slots__ = ("_role", "_content", "_payload", "_json", "_tokens", "_size")
+
+    def __init__(self, role: str, content):
+        self._role = sys.intern(role)
+        # Block lists are frozen so the cached payload/JSON can never go stale
+        self._content = tuple(content) if isinstance(content, list) else content
+        self._payload = None
+        self._json = None
+        self._tokens = None
+        self._size = None
+
+    @property
+    def role(self) -> str:
+        return self._role
+
+    @property
+    def content(self):
+        return self._content
+
+    @property
+    def text(self) -> str:
+        """The content for display: its text, with a 📎 line per attached document."""
+        if isinstance(self._content, str):
+            return self._content
+        parts = []
+        for block in self._content:
+            if block.get("type") == "text":
+                parts.append(block["text"])
+            elif block.get("type") == "document":
+                parts.append(f"📎 {block.get('title') or 'document'}")
+        return "\n\n".join(parts)
+
+    @property
+    def payload(self) -> dict:
+        """The message in Messages API form, e.g. {"role": "user", "content": "hi"}."""
+        if self._payload is None:
+            self._payload = {"role": self._role, "content": self._content}
+        return self._payload
+
+    @property
+    def json(self) -> str:
+        if self._json is None:
+            self._json = json.dumps(self.payload, ensure_ascii=False, separators=(",", ":"))
+        return self._json
+
+    @property
+    def token_count(self) -> int:
+        """Approximate, uncalibrated token count including role overhead (see LLMCPClient.Tokens)."""
+        if self._tokens is None:
+            self._tokens = Tokens.MESSAGE_OVERHEAD + Tokens.count_content(self._content)
+        return self._tokens
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate bytes held by the message, its cached payload and JSON included."""
+        if self._size is None:
+            content = self._content
+            if isinstance(content, str):
+                size = sys.getsizeof(content)
+            else:
+                size = sys.getsizeof(content) + sum(len(str(block)) for block in content)
+            # The cached payload and JSON roughly double what the content takes
+            self._size = _MESSAGE_BYTES + 2 * size
+        return self._size
+
+    def __repr__(self):
+        return f"Message({self._role!r}, {self._content!r})"
+
+    def __getstate__(self):
+        return (self._role, self._content)
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+
+@dataclass(frozen=True)
+class Summary:
+    """A rolling summary of a conversation's first `covered` messages (see LLMCPClient.Compaction)."""
+
+    message: Message
+    covered: int
+
+
+class Conversation:
+    """
+    Chat history as a list of Message records.
+
+    Replaces the list-of-dicts history the apps kept in st.session_state.messages.
+    Building a request payload reuses each message's cached dict/JSON, so a turn only
+    allocates the outer list.
+
+    May carry a Summary of its older messages, set from the background loop; it is
+    replaced as a whole, so readers never see it half-updated. The messages of an idle
+    conversation can be spilled to disk and are read back on first use (see
+    LLMCPClient.SessionMemory).
+    """
+
+    __slots__ = ("_messages", "_summary", "_epoch", "_nbytes", "_spilled", "_lock", "__weakref__")
+
+    CHAT_ROLES = ("user", "assistant")
+
+    def __init__(self, messages: Sequence[Message] = ()):
+        self._messages: Optional[list[Message]] = list(messages)
+        self._summary: Optional[Summary] = None
+        # Bumped by clear(), so a summary of the old history is never attached to the new one
+        self._epoch = 0
+        self._nbytes = sum(m.nbytes for m in self._messages)
+        # (path, length) while the messages are on disk, see spill()
+        self._spilled: Optional[tuple[str, int]] = None
+        self._lock = threading.Lock()
+
+    def _loaded(self) -> list[Message]:
+        """The message list, read back from disk first if it was spilled."""
+        messages = self._messages
+        if messages is None:
+            with self._lock:
+                if self._messages is None:
+                    self._load()
+                messages = self._messages
+        return messages
+
+    def _load(self):
+        from LLMCPClient import Archive
+
+        path, _ = self._spilled
+        with open(path, "rb") as f:
+            self._messages = list(Archive.import_conversation(f))
+        self._nbytes = sum(m.nbytes for m in self._messages)
+        self._spilled = None
+        os.remove(path)
+
+    def spill(self, path: str) -> int:
+        """
+        Move the messages to a file at path until they are next used, and return the
+        bytes freed (see nbytes).
+
+        Any later access reads them back and removes the file, so callers never see the
+        difference except in latency. The summary stays in memory.
+        """
+        from LLMCPClient import Archive
+
+        with self._lock:
+            if not self._messages:
+                return 0
+            with open(path, "wb") as f:
+                Archive.export_conversation(self._messages, f)
+            self._spilled = (path, len(self._messages))
+            self._messages = None
+            freed, self._nbytes = self._nbytes, 0
+        return freed
+
+    @property
+    def spilled(self) -> bool:
+        return self._spilled is not None
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate bytes held in memory by the messages (0 while they are spilled)."""
+        return self._nbytes
+
+    def append(self, role: str, content) -> Message:
+        message = Message(role, content)
+        with self._lock:
+            if self._messages is None:
+                self._load()
+            self._messages.append(message)
+            self._nbytes += message.nbytes
+        return message
+
+    def clear(self):
+        with self._lock:
+            if self._spilled is not None:
+                os.remove(self._spilled[0])
+                self._spilled = None
+            self._messages = []
+            self._nbytes = 0
+            self._summary = None
+            self._epoch += 1
+
+    @property
+    def summary(self) -> Optional[Summary]:
+        return self._summary
+
+    @property
+    def epoch(self) -> int:
+        return self._epoch
+
+    def set_summary(self, summary: Summary, epoch: int) -> bool:
+        """Attach a summary made for this epoch, unless one covering more is already attached."""
+        current = self._summary
+        if epoch != self._epoch or summary.covered > len(self):
+            return False
+        if current is not None and current.covered >= summary.covered:
+            return False
+        self._summary = summary
+        return True
+
+    def __len__(self) -> int:
+        spilled = self._spilled
+        return spilled[1] if spilled is not None else len(self._loaded())
+
+    def __iter__(self) -> Iterator[Message]:
+        return iter(self._loaded())
+
+    def __getitem__(self, index):
+        return self._loaded()[index]
+
+    def window(self, last: Optional[int] = None, max_tokens: Optional[int] = None, model: Optional[str] = None) -> list[Message]:
+        """
+        The last `last` user/assistant messages (all of them if last is None).
+
+        With max_tokens, older messages are dropped until the window's estimated tokens
+        (calibrated for model, see LLMCPClient.Tokens) fit; the newest message is always kept.
+        """
+        messages = self._loaded()
+        messages = messages if last is None else messages[-last:]
+        window = [m for m in messages if m.role in self.CHAT_ROLES]
+        if max_tokens is None:
+            return window
+        budget = max_tokens / Tokens.Calibration.get().ratio(model)
+        start = len(window) - 1
+        total = window[start].token_count if window else 0
+        while start > 0 and total + window[start - 1].token_count <= budget:
+            start -= 1
+            total += window[start].token_count
+        return window[max(start, 0):]
+
+    def context(self, keep: int, max_tokens: Optional[int] = None, model: Optional[str] = None) -> list[Message]:
+        """
+        The messages for a request: the last `keep`, preceded by the summary of the ones
+        before them when there is one.
+
+        Messages the summary doesn't cover yet (it is made in the background and may lag a
+        turn or two) are kept as well, up to another `keep`. max_tokens applies to the
+        whole, summary included, as in window().
+        """
+        summary = self._summary
+        covered = summary.covered if summary is not None else 0
+        messages = self._loaded()
+        start = max(len(messages) - keep, 0)
+        start = max(min(start, covered), start - keep, 0)
+        recent = Conversation(messages[start:])
+        if summary is None or covered == 0:
+            return recent.window(max_tokens=max_tokens, model=model)
+        if max_tokens is not None:
+            max_tokens -= Tokens.Calibration.get().tokens(summary.message.token_count, model)
+        return [summary.message, *recent.window(max_tokens=max_tokens, model=model)]
+
+    def payload(self, last: Optional[int] = None) -> list[dict]:
+        """Messages API payload for the window; the dicts are shared, not copied."""
+        return [m.payload for m in self.window(last)]
+
+    def to_json(self, last: Optional[int] = None) -> str:
+        """JSON array of the window, assembled from each message's cached encoding."""
+        return "[" + ",".join(m.json for m in self.window(last)) + "]"
+
+    def token_count(self, last: Optional[int] = None, model: Optional[str] = None) -> int:
+        estimate = sum(m.token_count for m in self.window(last))
+        return Tokens.Calibration.get().tokens(estimate, model)
@@ -0,0 +1,202 @@
+"""
+On-demand sampling profiler for single chat turns.
+
+Enable with CHATGENIE_PROFILE=1 (or the "Profile requests" sidebar toggle). Every
+profiled turn writes two files to CHATGENIE_PROFILE_DIR (default "profiles/"):
+
+    <time>-<name>.speedscope.json   open at https://www.speedscope.app
+    <time>-<name>.folded            collapsed stacks for flamegraph.pl / inferno
+
+and refreshes hot_paths.txt, an aggregate of the hottest functions and stacks over all
+turns profiled by this process.
+
+Sampling is done from a helper thread with sys._current_frames(), so it sees the
+Streamlit script thread, the background event loop thread (where the async MCP and
+Anthropic code runs, including idle time spent in the selector) and the server's
+main thread in one profile, with no dependencies and no tracing overhead.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Iterable, Optional
+
+from LLMCPClient.BackgroundLoop import BackgroundLoop
+
+PROFILE_DIR = os.getenv("CHATGENIE_PROFILE_DIR", "profiles")
+
+
+def enabled_by_env() -> bool:
+    return os.getenv("CHATGENIE_PROFILE", "").lower() in ("1", "true", "yes", "on")
+
+
+def _frame_name(code) -> str:
+    return f"{code.co_qualname} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """Records the stacks of the given threads every `interval` seconds while running."""
+
+    def __init__(self, thread_ids: Iterable[int], interval: float = 0.005):
+        self.thread_ids = set(thread_ids)
+        self.interval = interval
+        # thread id -> Counter of root-first stacks -> seconds
+        self.stacks: dict[int, Counter] = {tid: Counter() for tid in self.thread_ids}
+        self.thread_names: dict[int, str] = {}
+        self.duration = 0.0
+        self._started = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        names = {t.ident: t.name for t in threading.enumerate()}
+        self.thread_names = {tid: names.get(tid, str(tid)) for tid in self.thread_ids}
+        self._started = time.perf_counter()
+        self._thread = threading.Thread(target=self._sample, name="chat-genie-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.duration = time.perf_counter() - self._started
+
+    def _sample(self):
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter()
+            weight, last = now - last, now
+            frames = sys._current_frames()
+            for tid in self.thread_ids:
+                frame = frames.get(tid)
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_name(frame.f_code))
+                    frame = frame.f_back
+                if stack:
+                    stack.reverse()
+                    self.stacks[tid][tuple(stack)] += weight
+
+    def folded(self) -> str:
+        """Collapsed stacks ("thread;outer;inner <microseconds>"), one per line."""
+        lines = []
+        for tid, stacks in self.stacks.items():
+            root = self.thread_names[tid].replace(";", "_")
+            for stack, seconds in stacks.items():
+                lines.append(f"{';'.join((root, *stack))} {round(seconds * 1e6)}")
+        return "\n".join(lines) + "\n"
+
+    def speedscope(self, name: str) -> dict:
+        """The samples in speedscope's file format, one sampled profile per thread."""
+        frames: list[dict] = []
+        index: dict[str, int] = {}
+
+        def frame_index(frame_name: str) -> int:
+            if frame_name not in index:
+                index[frame_name] = len(frames)
+                frames.append({"name": frame_name})
+            return index[frame_name]
+
+        profiles = []
+        for tid, stacks in self.stacks.items():
+            samples = [[frame_index(f) for f in stack] for stack in stacks]
+            weights = list(stacks.values())
+            profiles.append({
+                "type": "sampled",
+                "name": self.thread_names[tid],
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": sum(weights),
+                "samples": samples,
+                "weights": weights,
+            })
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "chat-genie",
+            "shared": {"frames": frames},
+            "profiles": profiles,
+        }
+
+
+class HotPathReport:
+    """Aggregates profiled turns into self/inclusive time per function and top stacks."""
+
+    def __init__(self):
+        self.turns = 0
+        self.total = 0.0
+        self.self_time: Counter = Counter()
+        self.inclusive_time: Counter = Counter()
+        self.stack_time: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def add(self, profiler: SamplingProfiler):
+        with self._lock:
+            self.turns += 1
+            self.total += profiler.duration
+            for tid, stacks in profiler.stacks.items():
+                thread = profiler.thread_names[tid]
+                for stack, seconds in stacks.items():
+                    self.self_time[stack[-1]] += seconds
+                    for frame_name in set(stack):
+                        self.inclusive_time[frame_name] += seconds
+                    self.stack_time[(thread, *stack[-6:])] += seconds
+
+    def render(self, top: int = 25) -> str:
+        with self._lock:
+            if not self.turns:
+                return "No profiled turns yet.\n"
+            per_turn = self.total / self.turns
+            lines = [f"Hot paths over {self.turns} profiled turns ({per_turn:.2f}s wall per turn)", ""]
+            for title, counter in (("Self time", self.self_time), ("Inclusive time", self.inclusive_time)):
+                lines.append(f"{title} (seconds per turn, summed over sampled threads):")
+                for frame_name, seconds in counter.most_common(top):
+                    lines.append(f"  {seconds / self.turns:8.3f}  {frame_name}")
+                lines.append("")
+            lines.append("Hottest stacks (innermost 6 frames):")
+            for stack, seconds in self.stack_time.most_common(top // 2):
+                lines.append(f"  {seconds / self.turns:8.3f}  {' -> '.join(stack)}")
+            return "\n".join(lines) + "\n"
+
+
+aggregate = HotPathReport()
+
+
+@contextmanager
+def profile_turn(name: str = "turn", enabled: Optional[bool] = None, directory: str = PROFILE_DIR):
+    """
+    Profile the enclosed block if enabled (default: CHATGENIE_PROFILE).
+
+    Yields a dict that is filled in with the written file paths on exit, or None
+    when profiling is off.
+    """
+    if enabled is None:
+        enabled = enabled_by_env()
+    if not enabled:
+        yield None
+        return
+
+    threads = {threading.get_ident(), threading.main_thread().ident, BackgroundLoop.get().thread_ident}
+    profiler = SamplingProfiler(threads)
+    result = {}
+    profiler.start()
+    try:
+        yield result
+    finally:
+        profiler.stop()
+        aggregate.add(profiler)
+
+        os.makedirs(directory, exist_ok=True)
+        stem = os.path.join(directory, f"{time.strftime('%Y%m%d-%H%M%S')}-{int(time.time() * 1000) % 1000:03d}-{name}")
+        result["speedscope"] = stem + ".speedscope.json"
+        result["folded"] = stem + ".folded"
+        result["hot_paths"] = os.path.join(directory, "hot_paths.txt")
+        with open(result["speedscope"], "w") as f:
+            json.dump(profiler.speedscope(name), f)
+        with open(result["folded"], "w") as f:
+            f.write(profiler.folded())
+        with open(result["hot_paths"], "w") as f:
+            f.write(aggregate.render())
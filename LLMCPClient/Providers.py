@@ -0,0 +1,543 @@
+"""
+One async interface over the Anthropic and OpenAI APIs.
+
+Every provider exposes stream(**params), taking Messages API parameters (model,
+max_tokens, messages, tools, system) and yielding Messages API stream events as dicts
+(message_start, content_block_start/delta/stop, message_delta, message_stop). The
+OpenAI provider translates both directions, including tool calls, so callers such as
+MCPClient's tool loop work unchanged on either backend.
+
+Clients are pooled: each provider keeps one SDK client (and so one HTTP connection
+pool) per event loop, shared by every session in the process. FailoverRouter puts a
+primary and a backup provider behind the same interface and routes around the
+primary when it errors or is slow to start streaming. With CHATGENIE_HEDGE=1,
+HedgedProvider additionally duplicates requests that are slow to produce their first
+event and keeps whichever copy starts first.
+"""
+
+import asyncio
+import json
+import os
+import threading
+import time
+import weakref
+from collections import deque
+from typing import AsyncIterator, Optional
+
+import httpx
+
+from LLMCPClient import Attachments, Deadlines, Tokens
+from LLMCPClient.Cassette import Cassette
+from LLMCPClient.Scheduler import Scheduler
+
+ANTHROPIC_BACKUP_MODEL = os.getenv("ANTHROPIC_BACKUP_MODEL", "claude-3-haiku-20240307")
+OPENAI_BACKUP_MODEL = os.getenv("OPENAI_BACKUP_MODEL", "gpt-4o-mini")
+# Model for hedge requests (a faster one, on the primary's backend); unset = same model
+HEDGE_MODEL = os.getenv("CHATGENIE_HEDGE_MODEL") or None
+
+_STOP_REASONS = {"stop": "end_turn", "length": "max_tokens", "tool_calls": "tool_use", "function_call": "tool_use"}
+
+
+def _request_options() -> dict:
+    """SDK request options: the timeout, capped at what is left of the turn (see LLMCPClient.Deadlines)."""
+    left = Deadlines.remaining()
+    return {} if left is None else {"timeout": max(left, 1.0)}
+
+
+class Provider:
+    """
+    Base class: a pooled SDK client per event loop plus the common stream() interface.
+
+    model, if set, replaces the model requested by the caller (used for backups, which
+    can't serve the primary's model names).
+    """
+
+    name = "provider"
+
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        model: Optional[str] = None,
+        max_connections: int = 50,
+        max_retries: int = 2,
+    ):
+        self.api_key = api_key
+        self.model = model
+        self.max_connections = max_connections
+        self.max_retries = max_retries
+        self._clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, object]" = weakref.WeakKeyDictionary()
+
+    def client(self):
+        """The SDK client for the running event loop (HTTP connections are loop-bound)."""
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            client = self._clients[loop] = self._make_client()
+        return client
+
+    def _http_client(self) -> httpx.AsyncClient:
+        limits = httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections)
+        cassette = Cassette.from_env()
+        if cassette is not None:
+            return cassette.http_client(limits=limits, timeout=600.0)
+        return httpx.AsyncClient(limits=limits, timeout=600.0)
+
+    def _make_client(self):
+        raise NotImplementedError
+
+    def stream(self, **params) -> AsyncIterator[dict]:
+        raise NotImplementedError
+
+    async def warm(self):
+        """Open a pooled connection (and check the key) ahead of the first request on this loop."""
+        try:
+            await self.client().models.list()
+        except Exception as e:
+            response = getattr(e, "response", None)
+            if not isinstance(response, httpx.Response) or response.status_code == 401:
+                raise
+            # Any other answer (e.g. from a proxy that doesn't pass the models endpoint)
+            # still leaves a warm connection in the pool
+
+
+class AnthropicProvider(Provider):
+    name = "anthropic"
+
+    def _make_client(self):
+        from anthropic import AsyncAnthropic
+
+        api_key = self.api_key
+        cassette = Cassette.from_env()
+        if api_key is None and cassette is not None and cassette.replaying:
+            api_key = os.getenv("ANTHROPIC_API_KEY", "replay")
+        return AsyncAnthropic(api_key=api_key, http_client=self._http_client(), max_retries=self.max_retries)
+
+    async def stream(self, **params) -> AsyncIterator[dict]:
+        if self.model:
+            params["model"] = self.model
+        estimate = Tokens.count_request(params["messages"], params.get("system"), params.get("tools"))
+        params["messages"] = await Attachments.resolve(params["messages"])
+        stream = await self.client().messages.create(stream=True, **params, **_request_options())
+        async with stream:
+            async for event in stream:
+                event = event.model_dump()
+                if event["type"] == "message_start":
+                    usage = event["message"].get("usage") or {}
+                    actual = sum(usage.get(field) or 0 for field in ("input_tokens", "cache_creation_input_tokens", "cache_read_input_tokens"))
+                    Tokens.Calibration.get().observe(params["model"], estimate, actual)
+                yield event
+
+
+def _text_of(content) -> str:
+    if isinstance(content, str):
+        return content
+    return "\n".join(block.get("text", "") for block in content if block.get("type") == "text")
+
+
+def _openai_messages(messages, system=None) -> list[dict]:
+    """Convert Messages API messages (including tool_use/tool_result blocks) to chat completions."""
+    converted = [{"role": "system", "content": system}] if system else []
+    for message in messages:
+        content = message["content"]
+        if isinstance(content, str):
+            converted.append({"role": message["role"], "content": content})
+        elif message["role"] == "assistant":
+            reply = {"role": "assistant", "content": _text_of(content) or None}
+            calls = [
+                {"id": b["id"], "type": "function", "function": {"name": b["name"], "arguments": json.dumps(b["input"])}}
+                for b in content if b.get("type") == "tool_use"
+            ]
+            if calls:
+                reply["tool_calls"] = calls
+            converted.append(reply)
+        else:
+            for block in content:
+                if block.get("type") == "tool_result":
+                    converted.append({"role": "tool", "tool_call_id": block["tool_use_id"], "content": _text_of(block["content"])})
+            text = _text_of(content)
+            if text:
+                converted.append({"role": "user", "content": text})
+    return converted
+
+
+class OpenAIProvider(Provider):
+    name = "openai"
+
+    def _make_client(self):
+        from openai import AsyncOpenAI
+
+        return AsyncOpenAI(api_key=self.api_key, http_client=self._http_client(), max_retries=self.max_retries)
+
+    async def stream(self, model, max_tokens, messages, tools=None, system=None, **_) -> AsyncIterator[dict]:
+        model = self.model or model
+        estimate = Tokens.count_request(messages, system, tools)
+        request = {
+            "model": model,
+            "max_tokens": max_tokens,
+            "messages": _openai_messages(await Attachments.resolve(messages, documents=False), system),
+            "stream": True,
+            # Adds a final chunk with the usage, for token estimate calibration
+            "stream_options": {"include_usage": True},
+        }
+        if tools:
+            request["tools"] = [
+                {"type": "function", "function": {"name": t["name"], "description": t.get("description") or "", "parameters": t["input_schema"]}}
+                for t in tools
+            ]
+
+        stream = await self.client().chat.completions.create(**request, **_request_options())
+        yield {"type": "message_start", "message": {"role": "assistant", "model": model, "content": []}}
+        next_index = 0
+        open_index = None  # index of the block currently streaming
+        tool_indexes = {}  # OpenAI tool call index -> our block index
+        finish_reason = None
+        async with stream:
+            async for chunk in stream:
+                if chunk.usage is not None:
+                    Tokens.Calibration.get().observe(model, estimate, chunk.usage.prompt_tokens)
+                if not chunk.choices:
+                    continue
+                choice = chunk.choices[0]
+                delta = choice.delta
+                if delta.content:
+                    if open_index is None:
+                        open_index, next_index = next_index, next_index + 1
+                        yield {"type": "content_block_start", "index": open_index, "content_block": {"type": "text", "text": ""}}
+                    yield {"type": "content_block_delta", "index": open_index, "delta": {"type": "text_delta", "text": delta.content}}
+                for call in delta.tool_calls or ():
+                    if call.index not in tool_indexes:
+                        # A new call means the previous block is complete: stop it so the
+                        # caller can dispatch it right away
+                        if open_index is not None:
+                            yield {"type": "content_block_stop", "index": open_index}
+                        open_index, next_index = next_index, next_index + 1
+                        tool_indexes[call.index] = open_index
+                        block = {"type": "tool_use", "id": call.id, "name": call.function.name, "input": {}}
+                        yield {"type": "content_block_start", "index": open_index, "content_block": block}
+                    if call.function and call.function.arguments:
+                        yield {
+                            "type": "content_block_delta",
+                            "index": tool_indexes[call.index],
+                            "delta": {"type": "input_json_delta", "partial_json": call.function.arguments},
+                        }
+                if choice.finish_reason:
+                    finish_reason = choice.finish_reason
+        if open_index is not None:
+            yield {"type": "content_block_stop", "index": open_index}
+        yield {"type": "message_delta", "delta": {"stop_reason": _STOP_REASONS.get(finish_reason, finish_reason)}}
+        yield {"type": "message_stop"}
+
+
+async def text_deltas(events: AsyncIterator[dict]) -> AsyncIterator[str]:
+    """Just the text of a provider event stream."""
+    async for event in events:
+        if event["type"] == "content_block_delta" and event["delta"]["type"] == "text_delta":
+            yield event["delta"]["text"]
+
+
+class ProviderStats:
+    """Rolling error rate and smoothed time-to-first-event for one provider."""
+
+    def __init__(self, window: int = 20, alpha: float = 0.2):
+        self.outcomes: deque = deque(maxlen=window)
+        self.alpha = alpha
+        self.first_event: Optional[float] = None
+
+    def record(self, ok: bool, first_event: Optional[float] = None):
+        self.outcomes.append(ok)
+        if first_event is not None:
+            if self.first_event is None:
+                self.first_event = first_event
+            else:
+                self.first_event += self.alpha * (first_event - self.first_event)
+
+    @property
+    def error_rate(self) -> float:
+        return self.outcomes.count(False) / len(self.outcomes) if self.outcomes else 0.0
+
+
+def _should_fail_over(error: Exception) -> bool:
+    # Malformed requests would fail the same way on the backup
+    status = getattr(error, "status_code", None)
+    return status is None or status >= 500 or status in (408, 409, 429)
+
+
+class FailoverRouter(Provider):
+    """
+    Primary provider with an optional backup, behind the same stream() interface.
+
+    A request fails over to the backup when the primary errors or sends nothing within
+    first_event_timeout, as long as nothing has been yielded yet. While the primary's
+    recent error rate exceeds max_error_rate or its smoothed time to first event exceeds
+    max_first_event, requests go to the backup first; every probe_every-th request
+    still tries the primary so recovery is noticed.
+    """
+
+    name = "router"
+
+    def __init__(
+        self,
+        primary: Provider,
+        backup: Optional[Provider] = None,
+        first_event_timeout: float = 15.0,
+        max_error_rate: float = 0.5,
+        max_first_event: float = 8.0,
+        probe_every: int = 10,
+    ):
+        super().__init__()
+        self.primary = primary
+        self.backup = backup
+        self.first_event_timeout = first_event_timeout
+        self.max_error_rate = max_error_rate
+        self.max_first_event = max_first_event
+        self.probe_every = probe_every
+        self.stats = {id(primary): ProviderStats()}
+        if backup is not None:
+            self.stats[id(backup)] = ProviderStats()
+        self._requests = 0
+
+    def degraded(self) -> bool:
+        stats = self.stats[id(self.primary)]
+        slow = stats.first_event is not None and stats.first_event > self.max_first_event
+        return stats.error_rate > self.max_error_rate or slow
+
+    def order(self) -> list[Provider]:
+        self._requests += 1
+        if self.backup is None:
+            return [self.primary]
+        if self.degraded() and self._requests % self.probe_every:
+            return [self.backup, self.primary]
+        return [self.primary, self.backup]
+
+    async def warm(self):
+        """Warm both providers; fails only if none of them could be reached."""
+        providers = [p for p in (self.primary, self.backup) if p is not None]
+        results = await asyncio.gather(*(p.warm() for p in providers), return_exceptions=True)
+        errors = [r for r in results if isinstance(r, Exception)]
+        for provider, result in zip(providers, results):
+            if isinstance(result, Exception):
+                print(f"Warm-up of {provider.name} failed: {result}")
+        if len(errors) == len(results):
+            raise errors[0]
+
+    async def stream(self, **params) -> AsyncIterator[dict]:
+        error = None
+        for provider in self.order():
+            stats = self.stats[id(provider)]
+            events = provider.stream(**params)
+            started = time.monotonic()
+            try:
+                first = await asyncio.wait_for(anext(events), self.first_event_timeout)
+            except StopAsyncIteration:
+                stats.record(True, time.monotonic() - started)
+                return
+            except Exception as e:
+                await events.aclose()
+                deadline = Deadlines.current()
+                if deadline is not None and deadline.expired:
+                    # The turn ran out of time, not the provider: the backup wouldn't have any either
+                    raise Deadlines.DeadlineExceeded(f"No time left in the turn for {provider.name}") from e
+                stats.record(False)
+                error = e
+                if isinstance(e, asyncio.TimeoutError) or _should_fail_over(e):
+                    continue
+                raise
+            stats.record(True, time.monotonic() - started)
+
+            yield first
+            try:
+                async for event in events:
+                    yield event
+            except Exception:
+                # Too late to switch providers without repeating output
+                stats.record(False)
+                raise
+            return
+        raise error
+
+
+def hedging_enabled() -> bool:
+    return os.getenv("CHATGENIE_HEDGE", "").lower() in ("1", "true", "yes", "on")
+
+
+_END = object()
+
+
+class HedgedProvider(Provider):
+    """
+    Duplicates a request that is slow to start streaming and keeps whichever copy starts first.
+
+    If no event has arrived after the `percentile` of recent times to first event
+    (default_delay until min_samples are known), a second copy is sent, on hedge_model
+    if given. The first copy to produce an event wins and the other is cancelled, which
+    closes its connection. A copy that fails while the other is still pending is
+    ignored. At most max_hedge_rate of the last `window` requests are hedged, so a
+    struggling backend is never sent much more than its normal traffic.
+    """
+
+    name = "hedged"
+
+    def __init__(
+        self,
+        inner: Provider,
+        hedge_model: Optional[str] = None,
+        percentile: float = 0.95,
+        default_delay: float = 3.0,
+        min_delay: float = 0.25,
+        min_samples: int = 20,
+        max_hedge_rate: float = 0.1,
+        window: int = 200,
+    ):
+        super().__init__()
+        self.inner = inner
+        self.hedge_model = hedge_model
+        self.percentile = percentile
+        self.default_delay = default_delay
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self.max_hedge_rate = max_hedge_rate
+        self.first_events: deque = deque(maxlen=window)
+        self.recent: deque = deque(maxlen=window)  # whether each recent request was hedged
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    async def warm(self):
+        await self.inner.warm()
+
+    def delay(self) -> float:
+        """Seconds to wait for a first event before hedging."""
+        if len(self.first_events) < self.min_samples:
+            return self.default_delay
+        ordered = sorted(self.first_events)
+        return max(self.min_delay, ordered[min(len(ordered) - 1, int(self.percentile * len(ordered)))])
+
+    def may_hedge(self) -> bool:
+        # A budget of max_hedge_rate per recent request, plus one so a cold start can hedge
+        return sum(self.recent) < self.max_hedge_rate * len(self.recent) + 1
+
+    def metrics(self) -> dict:
+        return {"hedge_delay": round(self.delay(), 3), "hedges": self.hedges, "hedge_wins": self.hedge_wins}
+
+    @staticmethod
+    async def _pump(copy: int, events: AsyncIterator[dict], queue: asyncio.Queue):
+        # Each copy's stream is driven by its own task, so the loser can be cancelled
+        try:
+            async for event in events:
+                queue.put_nowait((copy, event))
+        except Exception as e:
+            queue.put_nowait((copy, e))
+        else:
+            queue.put_nowait((copy, _END))
+
+    async def stream(self, **params) -> AsyncIterator[dict]:
+        queue: asyncio.Queue = asyncio.Queue()
+        started = time.monotonic()
+        deadline = started + self.delay()
+        copies = [asyncio.create_task(self._pump(0, self.inner.stream(**params), queue))]
+        decided = False
+        failed = 0
+        try:
+            # Race the copies to their first event
+            while True:
+                timeout = None if decided else max(0.0, deadline - time.monotonic())
+                try:
+                    copy, item = await asyncio.wait_for(queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    decided = True
+                    if self.may_hedge():
+                        self.hedges += 1
+                        hedge_params = dict(params, model=self.hedge_model) if self.hedge_model else params
+                        copies.append(asyncio.create_task(self._pump(1, self.inner.stream(**hedge_params), queue)))
+                    continue
+                if isinstance(item, Exception):
+                    failed += 1
+                    if failed < len(copies):
+                        continue
+                    self.recent.append(len(copies) > 1)
+                    raise item
+                break
+
+            winner = copy
+            self.recent.append(len(copies) > 1)
+            self.first_events.append(time.monotonic() - started)
+            if winner:
+                self.hedge_wins += 1
+            for task in copies[:winner] + copies[winner + 1:]:
+                task.cancel()
+
+            while item is not _END:
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+                copy, item = await queue.get()
+                while copy != winner:
+                    copy, item = await queue.get()
+        finally:
+            for task in copies:
+                task.cancel()
+
+
+class ScheduledProvider(Provider):
+    """
+    Streams through another provider inside a slot of a Scheduler (see LLMCPClient.Scheduler).
+
+    Requests are charged by their estimated input tokens, so fair queuing shares tokens,
+    not request counts, between sessions.
+    """
+
+    name = "scheduled"
+
+    def __init__(self, inner: Provider, scheduler: Scheduler):
+        super().__init__()
+        self.inner = inner
+        self.scheduler = scheduler
+
+    async def warm(self):
+        await self.inner.warm()
+
+    async def stream(self, **params) -> AsyncIterator[dict]:
+        tokens = Tokens.count_request(params["messages"], params.get("system"), params.get("tools"))
+        async with self.scheduler.slot(cost=max(1.0, tokens / 1000)):
+            async for event in self.inner.stream(**params):
+                yield event
+
+
+_routers: dict = {}
+_routers_lock = threading.Lock()
+
+
+def get_router(
+    primary: str = "anthropic",
+    anthropic_api_key: Optional[str] = None,
+    openai_api_key: Optional[str] = None,
+    hedge: Optional[bool] = None,
+) -> Provider:
+    """
+    The process-wide router for this primary and set of keys.
+
+    Keys default to the ANTHROPIC_API_KEY / OPENAI_API_KEY environment variables; the
+    other provider is added as backup (with a model of its own) when it has a key.
+    With hedge (default: CHATGENIE_HEDGE) the router is wrapped in a HedgedProvider.
+    Every request waits for a slot of the process-wide "model" Scheduler.
+    """
+    anthropic_api_key = anthropic_api_key or os.getenv("ANTHROPIC_API_KEY")
+    openai_api_key = openai_api_key or os.getenv("OPENAI_API_KEY")
+    if hedge is None:
+        hedge = hedging_enabled()
+    key = (primary, anthropic_api_key, openai_api_key, hedge)
+    with _routers_lock:
+        if key not in _routers:
+            if primary == "anthropic":
+                backup = OpenAIProvider(openai_api_key, model=OPENAI_BACKUP_MODEL) if openai_api_key else None
+                # With a backup, failing over beats the SDK's own retries with backoff
+                main = AnthropicProvider(anthropic_api_key, max_retries=0 if backup else 2)
+            elif primary == "openai":
+                backup = AnthropicProvider(anthropic_api_key, model=ANTHROPIC_BACKUP_MODEL) if anthropic_api_key else None
+                main = OpenAIProvider(openai_api_key, max_retries=0 if backup else 2)
+            else:
+                raise ValueError(f"Unknown provider {primary!r}")
+            router = FailoverRouter(main, backup)
+            if hedge:
+                router = HedgedProvider(router, HEDGE_MODEL)
+            _routers[key] = ScheduledProvider(router, Scheduler.get("model"))
+        return _routers[key]
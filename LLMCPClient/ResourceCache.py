@@ -0,0 +1,211 @@
+"""
+Process-wide cache of MCP resource contents and prompt results.
+
+Resource contents are stored in the AttachmentStore under their SHA-256. A resource read
+by any session, through any client of the same server, is fetched once and stored
+once. It goes to the model as an attachment reference, which the providers expand from a
+memory map (and mark for prompt caching) like an uploaded document.
+
+A cached resource is used until one of these happens:
+
+    - the server sends notifications/resources/updated for it (MCPClient subscribes to
+      the resources it reads when the server supports subscriptions),
+    - the server sends notifications/resources/list_changed,
+    - CHATGENIE_RESOURCE_TTL seconds pass and no client is subscribed to it.
+
+MCP has no conditional reads, so a stale resource is read again in full. Its content
+is only stored again, and its references only change, if its hash differs. Messages that
+already refer to it, and the provider's prompt cache, stay valid when nothing changed.
+
+Prompt results (prompts/get) are cached by name and arguments. They are dropped when the
+server's prompt list changes, or after the TTL for servers that don't announce changes.
+"""
+
+import asyncio
+import base64
+import io
+import json
+import os
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Optional
+
+from mcp.types import BlobResourceContents, GetPromptResult, ReadResourceResult
+
+from LLMCPClient.Attachments import Attachment, AttachmentStore
+from LLMCPClient.SingleFlight import SingleFlight, request_key
+
+RESOURCE_TTL = float(os.getenv("CHATGENIE_RESOURCE_TTL", "300"))
+
+
+@dataclass
+class _Entry:
+    attachments: tuple[Attachment, ...]
+    fetched: float
+    stale: bool = False
+    subscribers: int = 0
+
+
+@dataclass
+class _PromptEntry:
+    result: GetPromptResult
+    fetched: float
+    trusted: bool  # the server announces prompt list changes
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    reads: int = 0
+    unchanged: int = 0  # re-reads whose content turned out the same
+    bytes_read: int = 0
+    prompt_hits: int = 0
+    prompt_reads: int = 0
+
+
+def _name(uri: str) -> str:
+    return uri.rstrip("/").rsplit("/", 1)[-1] or uri
+
+
+class ResourceCache:
+    """Resource contents and prompt results shared by every MCP client in the process."""
+
+    _instance = None
+    _lock = threading.Lock()
+
+    def __init__(self, ttl: float = RESOURCE_TTL, max_prompts: int = 256):
+        self.ttl = ttl
+        self.max_prompts = max_prompts
+        self._entries: dict[tuple[str, str], _Entry] = {}
+        self._prompts: "OrderedDict[tuple, _PromptEntry]" = OrderedDict()
+        self._state = threading.Lock()
+        # SingleFlight isn't thread-safe: one per event loop reading resources
+        self._flights: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, SingleFlight]" = weakref.WeakKeyDictionary()
+        self.stats = CacheStats()
+
+    @classmethod
+    def get(cls) -> "ResourceCache":
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    def _fresh(self, entry: Optional[_Entry]) -> bool:
+        if entry is None or entry.stale:
+            return False
+        return entry.subscribers > 0 or time.monotonic() - entry.fetched < self.ttl
+
+    def _flight(self) -> SingleFlight:
+        loop = asyncio.get_running_loop()
+        with self._state:
+            flights = self._flights.get(loop)
+            if flights is None:
+                flights = self._flights[loop] = SingleFlight()
+            return flights
+
+    async def read(
+        self, endpoint: str, uri: str, fetch: Callable[[], Awaitable[ReadResourceResult]]
+    ) -> tuple[Attachment, ...]:
+        """The stored contents of a resource, calling fetch() only when the cached ones are stale."""
+        with self._state:
+            entry = self._entries.get((endpoint, uri))
+            if self._fresh(entry):
+                self.stats.hits += 1
+                return entry.attachments
+        # Sessions asking for the same resource at the same time share one read
+        return await self._flight().do(request_key("resource", endpoint, uri), lambda: self._fetch(endpoint, uri, fetch))
+
+    async def _fetch(self, endpoint: str, uri: str, fetch) -> tuple[Attachment, ...]:
+        result = await fetch()
+        attachments = await asyncio.to_thread(self._store, result)
+        with self._state:
+            self.stats.reads += 1
+            self.stats.bytes_read += sum(a.size for a in attachments)
+            previous = self._entries.get((endpoint, uri))
+            if previous is not None and previous.attachments == attachments:
+                self.stats.unchanged += 1
+            subscribers = previous.subscribers if previous is not None else 0
+            self._entries[(endpoint, uri)] = _Entry(attachments, time.monotonic(), subscribers=subscribers)
+        return attachments
+
+    @staticmethod
+    def _store(result: ReadResourceResult) -> tuple[Attachment, ...]:
+        store = AttachmentStore.get()
+        attachments = []
+        for contents in result.contents:
+            if isinstance(contents, BlobResourceContents):
+                data = base64.b64decode(contents.blob)
+                media_type = contents.mimeType or "application/octet-stream"
+            else:
+                data = contents.text.encode("utf-8")
+                media_type = contents.mimeType or "text/plain"
+            attachments.append(store.add(io.BytesIO(data), _name(str(contents.uri)), media_type))
+        return tuple(attachments)
+
+    def subscribed(self, endpoint: str, uri: str):
+        """A client is now subscribed to updates of the resource: trust it past the TTL."""
+        with self._state:
+            entry = self._entries.get((endpoint, uri))
+            if entry is not None:
+                entry.subscribers += 1
+
+    def unsubscribed(self, endpoint: str, uris):
+        """The client subscribed to these resources is gone."""
+        with self._state:
+            for uri in uris:
+                entry = self._entries.get((endpoint, uri))
+                if entry is not None and entry.subscribers > 0:
+                    entry.subscribers -= 1
+
+    def invalidate(self, endpoint: str, uri: Optional[str] = None):
+        """Mark a resource (every resource of the endpoint if uri is None) to be read again."""
+        with self._state:
+            for (entry_endpoint, entry_uri), entry in self._entries.items():
+                if entry_endpoint == endpoint and uri in (None, entry_uri):
+                    entry.stale = True
+
+    async def prompt(
+        self,
+        endpoint: str,
+        name: str,
+        arguments: Optional[dict],
+        fetch: Callable[[], Awaitable[GetPromptResult]],
+        trusted: bool = False,
+    ) -> GetPromptResult:
+        """A prompt's messages for these arguments, cached as described in the module docstring."""
+        key = (endpoint, name, json.dumps(arguments or {}, sort_keys=True))
+        with self._state:
+            entry = self._prompts.get(key)
+            if entry is not None and (entry.trusted or time.monotonic() - entry.fetched < self.ttl):
+                self._prompts.move_to_end(key)
+                self.stats.prompt_hits += 1
+                return entry.result
+        result = await fetch()
+        with self._state:
+            self.stats.prompt_reads += 1
+            self._prompts[key] = _PromptEntry(result, time.monotonic(), trusted)
+            while len(self._prompts) > self.max_prompts:
+                self._prompts.popitem(last=False)
+        return result
+
+    def invalidate_prompts(self, endpoint: str):
+        with self._state:
+            for key in [key for key in self._prompts if key[0] == endpoint]:
+                del self._prompts[key]
+
+    def metrics(self) -> dict:
+        with self._state:
+            stats = self.stats
+            return {
+                "resources": len(self._entries),
+                "hits": stats.hits,
+                "reads": stats.reads,
+                "unchanged_rereads": stats.unchanged,
+                "bytes_read": stats.bytes_read,
+                "prompts": len(self._prompts),
+                "prompt_hits": stats.prompt_hits,
+                "prompt_reads": stats.prompt_reads,
+            }
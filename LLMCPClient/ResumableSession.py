@@ -0,0 +1,354 @@
+"""
+An MCP session over Streamable HTTP that survives dropped connections.
+
+    session = ResumableSession(endpoint, make_session, on_reconnected)
+    init_result = await session.open()
+    ...  # used like the ClientSession it wraps
+    await session.close()
+
+The SDK's transport already resumes an interrupted SSE response by itself, with a GET
+carrying Last-Event-ID. A request that can't reach the server at all is a different
+story: it crashes the transport's task group, which takes the ClientSession, and the
+task that entered them, down with it. Here the transport and the ClientSession belong
+to a holder task (like SessionPool's clients), so a crash only ends that connection. The
+holder then reconnects with the same mcp-session-id and protocol version, sent as headers
+of the connection's httpx client. It checks the session with a ping instead of
+initializing again. If the server no longer knows the session (it answers 404, e.g.
+after a restart), a new one is initialized.
+
+The transport only opens the GET stream for server notifications after an initialize,
+so a rejoined connection doesn't get any: resource updates and list changes are missed
+until the session is initialized again. notifications tells whether the current
+connection receives them; MCPClient doesn't rely on subscriptions and change
+notifications while it doesn't. The transport doesn't end the session when a connection
+closes, since the session outlives it; close() ends it with a DELETE.
+
+Requests wait for the reconnect (within the turn's deadline, see LLMCPClient.Deadlines).
+They are sent again on the restored connection when that is safe:
+
+    - requests that never left the client, or that the server refused because it
+      no longer knew the session, so it didn't process them,
+    - catalog listings, resource reads, prompts, subscriptions and pings,
+    - calls of tools the server annotates readOnlyHint or idempotentHint.
+
+Other tool calls cut off by a drop fail, since the server may have run them. Failed
+reconnect attempts count against the endpoint's circuit breaker (see
+LLMCPClient.HealthMonitor). After CHATGENIE_MCP_RECONNECT_ATTEMPTS of them in a row, the
+session is given up and its requests raise SessionLost.
+"""
+
+import asyncio
+import os
+from contextlib import suppress
+from typing import Awaitable, Callable, Optional
+
+import anyio
+import httpx
+from mcp import ClientSession
+from mcp.client.streamable_http import MCP_PROTOCOL_VERSION, MCP_SESSION_ID, streamable_http_client
+from mcp.shared.exceptions import McpError
+from mcp.types import CONNECTION_CLOSED, InitializeResult
+
+from LLMCPClient.Deadlines import bounded
+from LLMCPClient.HealthMonitor import CircuitOpenError, HealthMonitor
+
+RECONNECT_ATTEMPTS = int(os.getenv("CHATGENIE_MCP_RECONNECT_ATTEMPTS", "4"))
+RECONNECT_DELAY = 0.5  # seconds before the second attempt, doubled for each one after
+CONNECT_RETRIES = 2  # httpx retries a refused or timed-out connect before the request fails
+
+# Errors after which a connection is assumed dead
+CONNECTION_ERRORS = (
+    anyio.ClosedResourceError,
+    anyio.BrokenResourceError,
+    ConnectionError,
+    httpx.TransportError,
+)
+
+
+class SessionLost(ConnectionError):
+    """The session's connection dropped and couldn't be restored."""
+
+
+def _unsent(e: Exception) -> bool:
+    """The request failed before it reached the server."""
+    if isinstance(e, (anyio.ClosedResourceError, anyio.BrokenResourceError)):
+        # The transport's write stream was already gone
+        return True
+    # The transport answers a 404 for the session id with this error
+    return isinstance(e, McpError) and e.error.message == "Session terminated"
+
+
+def _cause(e: Exception) -> Exception:
+    """The error inside the exception groups of the transport's task groups."""
+    while isinstance(e, ExceptionGroup) and len(e.exceptions) == 1:
+        e = e.exceptions[0]
+    return e
+
+
+def _describe(e: Exception) -> str:
+    return str(e) or type(e).__name__
+
+
+def _dropped(e: Exception) -> bool:
+    """The connection dropped while the request was out."""
+    if isinstance(e, McpError):
+        return e.error.code == CONNECTION_CLOSED
+    return isinstance(e, CONNECTION_ERRORS)
+
+
+class ResumableSession:
+    """A ClientSession stand-in that reconnects to the same MCP session after connection drops."""
+
+    def __init__(
+        self,
+        endpoint: str,
+        make_session: Callable[..., ClientSession],
+        on_reconnected: Optional[Callable[[ClientSession, Optional[InitializeResult]], Awaitable[None]]] = None,
+        reconnect_attempts: int = RECONNECT_ATTEMPTS,
+    ):
+        self.endpoint = endpoint
+        # Called with the read and write streams of each connection
+        self._make_session = make_session
+        # Called before a restored connection is used: with None if it rejoined the
+        # session, with the InitializeResult if it had to start a new one
+        self._on_reconnected = on_reconnected
+        self.reconnect_attempts = reconnect_attempts
+        # The server's session, kept across connections
+        self.session_id: Optional[str] = None
+        self.protocol_version: Optional[str] = None
+        # Whether the current connection receives server notifications (see above)
+        self.notifications = False
+        self.rejoins = 0
+        self.reinitializations = 0
+        self._session: Optional[ClientSession] = None
+        self._connected = asyncio.Event()  # also set once the session is given up
+        self._retire = asyncio.Event()
+        self._closing = False
+        self._error: Optional[Exception] = None
+        self._holder: Optional[asyncio.Task] = None
+        self._idempotent_tools: set[str] = set()
+        # Requests out on each connection, cut off when it ends: the ClientSession can't
+        # always tell them itself, as it's cancelled along with a crashed transport
+        self._requests: dict[ClientSession, set[asyncio.Timeout]] = {}
+
+    async def open(self) -> InitializeResult:
+        """Connect and initialize the session; raises what the first attempt raised."""
+        first = asyncio.get_running_loop().create_future()
+        self._holder = asyncio.create_task(self._hold(first))
+        try:
+            return await first
+        except BaseException:
+            await self.close()
+            raise
+
+    async def close(self):
+        """End the session on the server and close the connection."""
+        self._closing = True
+        self._retire.set()
+        if self._holder is not None:
+            await asyncio.gather(self._holder, return_exceptions=True)
+
+    async def _hold(self, first: asyncio.Future):
+        breaker = HealthMonitor.get().breaker(self.endpoint)
+        failures = 0
+        while not self._closing:
+            if failures:
+                if failures > self.reconnect_attempts:
+                    break
+                # Sleep, unless close() is called meanwhile
+                with suppress(TimeoutError):
+                    await asyncio.wait_for(self._retire.wait(), RECONNECT_DELAY * 2 ** (failures - 1))
+                if self._closing:
+                    break
+            if first.done() and not breaker.allow_request():
+                self._error = CircuitOpenError(f"MCP server {self.endpoint} is unavailable (circuit {breaker.state})")
+                failures += 1
+                continue
+            self._retire.clear()
+            try:
+                await self._connect(first)
+            except Exception as e:
+                e = _cause(e)
+                if not first.done():
+                    # The first connection is the caller's to retry (see MCPClient.connect_to_http_server)
+                    first.set_exception(e)
+                    return
+                if self._error is None:
+                    # A connection that worked dropped: try again right away
+                    print(f"MCP connection to {self.endpoint} dropped ({_describe(e)}), reconnecting")
+                    self._error = e
+                    continue
+                print(f"Reconnecting to {self.endpoint} failed: {_describe(e)}")
+                self._error = e
+                breaker.record_failure()
+                failures += 1
+            except BaseException:
+                breaker.release()
+                raise
+            else:
+                failures = 0
+        self._session = None
+        if self._closing and self.session_id is not None:
+            await self._terminate()
+        if not self._closing:
+            print(f"Gave up reconnecting to {self.endpoint} after {failures - 1} attempts")
+        self._error = SessionLost(f"Lost the connection to MCP server {self.endpoint}: {_describe(self._error)}")
+        self._connected.set()  # wake requests waiting for a connection
+        if not first.done():
+            first.set_exception(self._error)
+
+    async def _connect(self, first: asyncio.Future):
+        """Hold one connection of the session, from connecting until it's retired or drops."""
+        rejoining = self.session_id is not None
+        async with (
+            self._http_client(self._session_headers() if rejoining else None) as client,
+            streamable_http_client(self.endpoint, http_client=client, terminate_on_close=False) as (
+                read_stream,
+                write_stream,
+                get_session_id,
+            ),
+        ):
+            async with self._make_session(read_stream, write_stream) as session:
+                init_result = None
+                if rejoining:
+                    try:
+                        await session.send_ping()
+                    except McpError as e:
+                        if not _unsent(e):
+                            raise
+                        # The server no longer knows the session: start a new one
+                        print(f"MCP session {self.session_id} on {self.endpoint} ended on the server")
+                        self.session_id = self.protocol_version = None
+                        return
+                else:
+                    init_result = await session.initialize()
+                    self.session_id = get_session_id()
+                    self.protocol_version = str(init_result.protocolVersion)
+
+                if first.done():
+                    if rejoining:
+                        self.rejoins += 1
+                    else:
+                        self.reinitializations += 1
+                    if self._on_reconnected is not None:
+                        await self._on_reconnected(session, init_result)
+                    HealthMonitor.get().breaker(self.endpoint).record_success()
+                self._session = session
+                self.notifications = not rejoining
+                self._error = None
+                self._connected.set()
+                if not first.done():
+                    first.set_result(init_result)
+                try:
+                    await self._retire.wait()
+                finally:
+                    self._connected.clear()
+                    self._session = None
+                    self.notifications = False
+                    now = asyncio.get_running_loop().time()
+                    for request in self._requests.pop(session, ()):
+                        request.reschedule(now)
+
+    def _http_client(self, headers: Optional[dict[str, str]] = None) -> httpx.AsyncClient:
+        transport = httpx.AsyncHTTPTransport(retries=CONNECT_RETRIES)
+        return httpx.AsyncClient(
+            transport=transport, headers=headers, timeout=httpx.Timeout(30, read=300), follow_redirects=True
+        )
+
+    def _session_headers(self) -> dict[str, str]:
+        return {MCP_SESSION_ID: self.session_id, MCP_PROTOCOL_VERSION: self.protocol_version}
+
+    async def _terminate(self):
+        """End the session on the server; servers that don't allow it answer 405."""
+        async with self._http_client() as client:
+            with suppress(TimeoutError, httpx.HTTPError):
+                async with asyncio.timeout(5):
+                    await client.delete(self.endpoint, headers=self._session_headers())
+
+    def _reconnect(self, session: ClientSession, expired: bool = False):
+        """Retire the connection of session, if it's still the current one; expired starts a new session."""
+        if session is self._session:
+            if expired:
+                self.session_id = self.protocol_version = None
+            self._session = None
+            self._connected.clear()
+            self._retire.set()
+
+    async def _current(self) -> ClientSession:
+        if not self._connected.is_set():
+            # Waits for a reconnect, within the turn's deadline
+            async with bounded():
+                await self._connected.wait()
+        if self._session is None:
+            raise self._error or SessionLost(f"MCP session with {self.endpoint} is closed")
+        return self._session
+
+    async def _request(self, what: str, call: Callable[[ClientSession], Awaitable], retry: bool = True):
+        """Run call on the current connection, and again on a restored one when the rules above allow."""
+        for attempt in range(self.reconnect_attempts + 1):
+            session = await self._current()
+            try:
+                async with asyncio.timeout(None) as request:
+                    requests = self._requests.setdefault(session, set())
+                    requests.add(request)
+                    try:
+                        return await call(session)
+                    finally:
+                        requests.discard(request)
+            except Exception as e:
+                if isinstance(e, TimeoutError) and request.expired():
+                    e = SessionLost(f"The connection to MCP server {self.endpoint} dropped")
+                unsent = _unsent(e)
+                if not unsent and not _dropped(e):
+                    raise
+                self._reconnect(session, expired=isinstance(e, McpError))
+                if not (unsent or retry) or attempt == self.reconnect_attempts:
+                    raise e
+                print(f"MCP connection to {self.endpoint} dropped during {what}, retrying")
+
+    def __getattr__(self, name):
+        # Everything not wrapped below goes to the current ClientSession as it is
+        session = self.__dict__.get("_session")
+        if session is None:
+            raise AttributeError(f"{name} (MCP session with {self.endpoint} is not connected)")
+        return getattr(session, name)
+
+    async def list_tools(self, *args, **kwargs):
+        result = await self._request("tools/list", lambda session: session.list_tools(*args, **kwargs))
+        self._idempotent_tools = {
+            tool.name
+            for tool in result.tools
+            if tool.annotations is not None and (tool.annotations.readOnlyHint or tool.annotations.idempotentHint)
+        }
+        return result
+
+    async def call_tool(self, name: str, arguments: Optional[dict] = None, *args, **kwargs):
+        return await self._request(
+            f"tool {name}",
+            lambda session: session.call_tool(name, arguments, *args, **kwargs),
+            retry=name in self._idempotent_tools,
+        )
+
+    async def list_resources(self, *args, **kwargs):
+        return await self._request("resources/list", lambda session: session.list_resources(*args, **kwargs))
+
+    async def list_prompts(self, *args, **kwargs):
+        return await self._request("prompts/list", lambda session: session.list_prompts(*args, **kwargs))
+
+    async def read_resource(self, uri):
+        return await self._request(f"resource {uri}", lambda session: session.read_resource(uri))
+
+    async def subscribe_resource(self, uri):
+        return await self._request("resources/subscribe", lambda session: session.subscribe_resource(uri))
+
+    async def unsubscribe_resource(self, uri):
+        return await self._request("resources/unsubscribe", lambda session: session.unsubscribe_resource(uri))
+
+    async def get_prompt(self, name: str, arguments: Optional[dict] = None):
+        return await self._request(f"prompt {name}", lambda session: session.get_prompt(name, arguments))
+
+    async def set_logging_level(self, level):
+        return await self._request("logging/setLevel", lambda session: session.set_logging_level(level))
+
+    async def send_ping(self):
+        return await self._request("ping", lambda session: session.send_ping())
@@ -0,0 +1,232 @@
+"""
+Priority scheduling for model calls and tool calls.
+
+Work is tagged with a priority class and the session it belongs to through a context
+variable, so the tag follows a turn through every coroutine and task it starts:
+
+    with work(BACKGROUND, session_id):
+        await summarize(...)
+
+    Turn(run_as(coro, INTERACTIVE, session_id))   # coro runs on the background loop
+
+Untagged work counts as interactive.
+
+Each Scheduler (one per resource: "model" and "tools") admits at most `capacity`
+concurrent calls. Waiting calls are served strictly by class (interactive, then batch,
+then background) and, within a class, by weighted fair queuing across sessions, so one
+session queueing many calls can't starve the others. `reserved` slots are only ever
+given to interactive work, which keeps chat latency low while batch and background
+jobs saturate the rest. When the queue is full, a new call preempts the most recently
+queued call of a lower class (which fails with Overloaded); otherwise it is rejected.
+Queue depth, wait times and preemptions are reported by metrics().
+"""
+
+import asyncio
+import contextvars
+import heapq
+import itertools
+import os
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass
+
+INTERACTIVE = 0
+BATCH = 1
+BACKGROUND = 2
+CLASS_NAMES = ("interactive", "batch", "background")
+
+
+class Overloaded(RuntimeError):
+    """The scheduler's queue is full, or this queued call was preempted by more urgent work."""
+
+
+@dataclass(frozen=True)
+class Work:
+    priority: int = INTERACTIVE
+    session: str = ""
+    weight: float = 1.0
+
+
+_current = contextvars.ContextVar("chat_genie_work", default=Work())
+
+
+@contextmanager
+def work(priority: int, session: str = "", weight: float = 1.0):
+    """Tag every model and tool call made inside the block."""
+    token = _current.set(Work(priority, session, weight))
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+async def run_as(coro, priority: int, session: str = "", weight: float = 1.0):
+    """Await coro with its calls tagged; for coroutines handed to another thread's loop."""
+    with work(priority, session, weight):
+        return await coro
+
+
+class _Waiter:
+    __slots__ = ("work", "loop", "future", "enqueued", "granted", "cancelled", "preempted")
+
+    def __init__(self, work: Work, loop: asyncio.AbstractEventLoop):
+        self.work = work
+        self.loop = loop
+        self.future = loop.create_future()
+        self.enqueued = time.monotonic()
+        self.granted = False
+        self.cancelled = False
+        self.preempted = False
+
+
+def _resolve(future: asyncio.Future, error: Exception = None):
+    if not future.done():
+        if error is None:
+            future.set_result(None)
+        else:
+            future.set_exception(error)
+
+
+class Scheduler:
+    """Admission control for one resource; see the module docstring."""
+
+    _instances: dict = {}
+    _lock = threading.Lock()
+
+    def __init__(self, name: str, capacity: int = 16, reserved: int = 2, max_queued: int = 256):
+        self.name = name
+        self.capacity = capacity
+        self.reserved = min(reserved, capacity - 1)
+        self.max_queued = max_queued
+        self._state = threading.Lock()
+        self._running = [0, 0, 0]
+        self._queued = [0, 0, 0]
+        # Per class: heap of (finish tag, sequence, waiter); cancelled waiters are skipped lazily
+        self._queues: list[list] = [[], [], []]
+        self._virtual_time = [0.0, 0.0, 0.0]
+        self._last_tag: dict[tuple[int, str], float] = {}
+        self._sequence = itertools.count()
+        self._waits = [deque(maxlen=500) for _ in CLASS_NAMES]
+        self._served = [0, 0, 0]
+        self._preempted = 0
+        self._rejected = 0
+
+    @classmethod
+    def get(cls, name: str) -> "Scheduler":
+        """The process-wide scheduler for a resource; capacity from CHATGENIE_<NAME>_CONCURRENCY."""
+        with cls._lock:
+            if name not in cls._instances:
+                capacity = int(os.getenv(f"CHATGENIE_{name.upper()}_CONCURRENCY", "16"))
+                cls._instances[name] = cls(name, capacity)
+            return cls._instances[name]
+
+    @asynccontextmanager
+    async def slot(self, cost: float = 1.0):
+        """
+        Hold one of the scheduler's slots, waiting in line if none is free.
+
+        cost is what fair queuing charges the session for the call (e.g. thousands of tokens).
+        """
+        priority = await self._acquire(_current.get(), cost)
+        try:
+            yield
+        finally:
+            with self._state:
+                self._running[priority] -= 1
+                self._dispatch()
+
+    def _admits(self, priority: int) -> bool:
+        limit = self.capacity if priority == INTERACTIVE else self.capacity - self.reserved
+        return sum(self._running) < limit
+
+    async def _acquire(self, work: Work, cost: float) -> int:
+        priority = work.priority
+        with self._state:
+            if not any(self._queued[: priority + 1]) and self._admits(priority):
+                self._running[priority] += 1
+                self._served[priority] += 1
+                self._waits[priority].append(0.0)
+                return priority
+            waiter = self._enqueue(work, cost)
+
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            with self._state:
+                if waiter.granted:
+                    # Granted just as we were cancelled: give the slot back
+                    self._running[priority] -= 1
+                    self._dispatch()
+                elif not waiter.preempted and not waiter.cancelled:
+                    waiter.cancelled = True
+                    self._queued[priority] -= 1
+            raise
+        return priority
+
+    def _enqueue(self, work: Work, cost: float) -> _Waiter:
+        if sum(self._queued) >= self.max_queued:
+            self._preempt_for(work.priority)
+        waiter = _Waiter(work, asyncio.get_running_loop())
+        key = (work.priority, work.session)
+        tag = max(self._virtual_time[work.priority], self._last_tag.get(key, 0.0)) + cost / work.weight
+        self._last_tag[key] = tag
+        heapq.heappush(self._queues[work.priority], (tag, next(self._sequence), waiter))
+        self._queued[work.priority] += 1
+        return waiter
+
+    def _preempt_for(self, priority: int):
+        for lower in range(len(CLASS_NAMES) - 1, priority, -1):
+            queued = [entry for entry in self._queues[lower] if not (entry[2].cancelled or entry[2].preempted)]
+            if queued:
+                _, _, victim = max(queued, key=lambda entry: entry[1])
+                victim.preempted = True
+                self._queued[lower] -= 1
+                self._preempted += 1
+                error = Overloaded(f"{CLASS_NAMES[lower]} {self.name} call preempted by {CLASS_NAMES[priority]} work")
+                victim.loop.call_soon_threadsafe(_resolve, victim.future, error)
+                return
+        self._rejected += 1
+        raise Overloaded(f"{self.name} queue is full ({self.max_queued} waiting)")
+
+    def _dispatch(self):
+        """Grant free slots to waiting calls, most urgent class first. Called with _state held."""
+        for priority, queue in enumerate(self._queues):
+            while queue and self._admits(priority):
+                tag, _, waiter = heapq.heappop(queue)
+                if waiter.cancelled or waiter.preempted:
+                    continue
+                waiter.granted = True
+                self._queued[priority] -= 1
+                self._running[priority] += 1
+                self._served[priority] += 1
+                self._virtual_time[priority] = tag
+                self._waits[priority].append(time.monotonic() - waiter.enqueued)
+                waiter.loop.call_soon_threadsafe(_resolve, waiter.future)
+            if self._queued[priority]:
+                # Lower classes wait while a more urgent one can't be admitted
+                break
+        if len(self._last_tag) > 4096:
+            # Drop sessions with nothing queued ahead of the current virtual time
+            self._last_tag = {k: t for k, t in self._last_tag.items() if t > self._virtual_time[k[0]]}
+
+    def metrics(self) -> dict:
+        with self._state:
+            classes = {}
+            for priority, name in enumerate(CLASS_NAMES):
+                waits = sorted(self._waits[priority])
+                classes[name] = {
+                    "running": self._running[priority],
+                    "queued": self._queued[priority],
+                    "served": self._served[priority],
+                    "wait_p50": round(waits[len(waits) // 2], 4) if waits else None,
+                    "wait_p95": round(waits[int(len(waits) * 0.95)], 4) if waits else None,
+                }
+            return {
+                "capacity": self.capacity,
+                "reserved": self.reserved,
+                "classes": classes,
+                "preempted": self._preempted,
+                "rejected": self._rejected,
+            }
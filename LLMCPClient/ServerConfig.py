@@ -0,0 +1,165 @@
+"""
+Process-wide MCP server and model configuration, validated once and hot-reloaded.
+
+Read from CHATGENIE_CONFIG (default .streamlit/secrets.toml, where the apps already
+keep their secrets):
+
+    [MCP_SERVERS.local]
+    endpoint = "http://localhost:8000/mcp"
+    api_key = ""
+
+    [MODELS]                       # optional, replaces the app's built-in model list
+    "claude-3-haiku-20240307" = "Claude 3 Haiku (Fast)"
+
+Every session reads the same immutable ServerConfig instead of parsing secrets itself.
+The file is polled from the background loop and re-read when it changes. Invalid
+entries are skipped and reported in ServerConfig.errors; a file that doesn't parse
+leaves the previous configuration in place. Servers that appear are put under health
+probes and checked straight away, and get a warm session pool (see LLMCPClient.Warmup),
+so their first user doesn't pay for a cold connection or find out the hard way that
+the endpoint is down.
+"""
+
+import asyncio
+import os
+import threading
+import time
+import tomllib
+from dataclasses import dataclass, field, replace
+from types import MappingProxyType
+from typing import Mapping
+from urllib.parse import urlparse
+
+from LLMCPClient.BackgroundLoop import BackgroundLoop
+from LLMCPClient.HealthMonitor import HealthMonitor
+from LLMCPClient.Warmup import Warmup
+
+CONFIG_PATH = os.getenv("CHATGENIE_CONFIG", os.path.join(".streamlit", "secrets.toml"))
+
+
+@dataclass(frozen=True)
+class ServerEntry:
+    name: str
+    endpoint: str
+    api_key: str = ""
+
+    def as_dict(self) -> dict:
+        """A fresh dict in the shape the apps use for servers, marked as shared."""
+        return {"name": self.name, "endpoint": self.endpoint, "api_key": self.api_key, "shared": True}
+
+
+@dataclass(frozen=True)
+class ServerConfig:
+    servers: tuple[ServerEntry, ...] = ()
+    models: Mapping[str, str] = field(default_factory=lambda: MappingProxyType({}))
+    version: int = 0
+    errors: tuple[str, ...] = ()
+    loaded_at: float = 0.0
+
+
+def validate(data: dict) -> tuple[tuple[ServerEntry, ...], dict, list[str]]:
+    """Servers and models from parsed config, plus a message for every entry skipped."""
+    errors = []
+    servers = []
+    endpoints = set()
+    configured = data.get("MCP_SERVERS", {})
+    if not isinstance(configured, dict):
+        errors.append("MCP_SERVERS must be a table of servers")
+        configured = {}
+    for name, entry in configured.items():
+        if not isinstance(entry, dict):
+            errors.append(f"MCP_SERVERS.{name}: expected a table with an endpoint")
+            continue
+        endpoint = str(entry.get("endpoint", "")).strip()
+        url = urlparse(endpoint)
+        if url.scheme not in ("http", "https") or not url.netloc:
+            errors.append(f"MCP_SERVERS.{name}: endpoint {endpoint!r} is not an http(s) URL")
+            continue
+        if endpoint in endpoints:
+            errors.append(f"MCP_SERVERS.{name}: endpoint {endpoint} is already configured")
+            continue
+        api_key = entry.get("api_key", "")
+        if not isinstance(api_key, str):
+            errors.append(f"MCP_SERVERS.{name}: api_key must be a string")
+            continue
+        endpoints.add(endpoint)
+        servers.append(ServerEntry(str(name), endpoint, api_key))
+
+    models = data.get("MODELS", {})
+    if not isinstance(models, dict) or not all(isinstance(label, str) for label in models.values()):
+        errors.append("MODELS must map model ids to display names")
+        models = {}
+    return tuple(servers), models, errors
+
+
+class ServerRegistry:
+    """The current ServerConfig of the process, kept in sync with the config file."""
+
+    _instance = None
+    _lock = threading.Lock()
+
+    def __init__(self, path: str = CONFIG_PATH, poll_interval: float = 2.0):
+        self.path = path
+        self.poll_interval = poll_interval
+        # Replaced as a whole on reload; readers never see a half-updated config
+        self.config = ServerConfig()
+        self._stamp = None
+        self._reload_lock = threading.Lock()
+        self.reload()
+        self._task = BackgroundLoop.get().submit(self._watch())
+
+    @classmethod
+    def get(cls) -> "ServerRegistry":
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    def _file_stamp(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def reload(self) -> ServerConfig:
+        """Re-read the config file now."""
+        with self._reload_lock:
+            self._stamp = self._file_stamp()
+            previous = self.config
+            data = {}
+            if self._stamp is not None:
+                try:
+                    with open(self.path, "rb") as f:
+                        data = tomllib.load(f)
+                except (OSError, tomllib.TOMLDecodeError) as e:
+                    print(f"Keeping previous server configuration, {self.path} is invalid: {e}")
+                    self.config = replace(previous, errors=(f"{self.path}: {e}",))
+                    return self.config
+
+            servers, models, errors = validate(data)
+            for error in errors:
+                print(f"Server configuration: {error}")
+            self.config = ServerConfig(servers, MappingProxyType(models), previous.version + 1, tuple(errors), time.time())
+            self._prewarm(previous, self.config)
+            return self.config
+
+    def _prewarm(self, previous: ServerConfig, config: ServerConfig):
+        monitor = HealthMonitor.get()
+        warmup = Warmup.get()
+        loop = BackgroundLoop.get()
+        known = {server.endpoint for server in previous.servers}
+        current = {server.endpoint for server in config.servers}
+        for endpoint in current - known:
+            monitor.watch(endpoint)
+            loop.submit(monitor.check(endpoint))
+            loop.submit(warmup.warm_server(endpoint))
+        for endpoint in known - current:
+            monitor.unwatch(endpoint)
+            loop.submit(warmup.close_server(endpoint))
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            if self._file_stamp() != self._stamp:
+                await asyncio.to_thread(self.reload)
@@ -0,0 +1,163 @@
+"""
+Per-session memory accounting, with idle histories spilled to disk.
+
+Every app session registers its Conversation on each rerun:
+
+    SessionMemory.get().track(st.session_state.session_id, st.session_state.messages)
+
+The governor keeps the sessions in least-recently-used order with the approximate
+bytes their histories hold (Conversation.nbytes). A sweep on the background loop, every
+`interval` seconds and right away when the ceiling is crossed, spills to
+CHATGENIE_SPILL_DIR the history of every session idle for CHATGENIE_SESSION_IDLE_SECONDS,
+then more, least recently used first, until the tracked total is back under
+CHATGENIE_SESSION_MEMORY_MB. A spilled history is read back the next time its session
+touches it, so the process stays flat however many tabs are left open. The MCP clients
+are not per session (see LLMCPClient.Warmup), so histories are what grows.
+"""
+
+import asyncio
+import os
+import tempfile
+import threading
+import time
+import uuid
+import weakref
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from LLMCPClient.BackgroundLoop import BackgroundLoop
+from LLMCPClient.Messages import Conversation
+
+MEMORY_CEILING = int(float(os.getenv("CHATGENIE_SESSION_MEMORY_MB", "256")) * (1 << 20))
+IDLE_SECONDS = float(os.getenv("CHATGENIE_SESSION_IDLE_SECONDS", "900"))
+SPILL_DIR = os.getenv("CHATGENIE_SPILL_DIR") or os.path.join(tempfile.gettempdir(), "chat-genie-sessions")
+MIN_SPILL_BYTES = 16 << 10  # idle histories smaller than this aren't worth a file
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+@dataclass
+class _Session:
+    conversation: "weakref.ref[Conversation]"
+    path: str
+    used: float
+
+
+class SessionMemory:
+    """The memory governor for every session's history in the process."""
+
+    _instance = None
+    _lock = threading.Lock()
+
+    def __init__(
+        self,
+        ceiling: int = MEMORY_CEILING,
+        idle: float = IDLE_SECONDS,
+        directory: str = SPILL_DIR,
+        interval: float = 60.0,
+    ):
+        self.ceiling = ceiling
+        self.idle = idle
+        self.directory = directory
+        self.interval = interval
+        os.makedirs(directory, exist_ok=True)
+        # Least recently used first
+        self._sessions: "OrderedDict[str, _Session]" = OrderedDict()
+        self._state = threading.Lock()
+        self._task = None
+        self._sweeping = None
+        self._spills = 0
+        self._spilled_bytes = 0
+
+    @classmethod
+    def get(cls) -> "SessionMemory":
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    def track(self, session: str, conversation: Conversation):
+        """Mark the session as just used; sweeps in the background if the ceiling is crossed."""
+        with self._state:
+            entry = self._sessions.get(session)
+            if entry is None or entry.conversation() is not conversation:
+                # A new session, or one that replaced its history (e.g. by importing one)
+                path = os.path.join(self.directory, f"{uuid.uuid4().hex}.chat.zst")
+                # Removes the spilled file, if any, once the history is gone
+                weakref.finalize(conversation, _remove, path)
+                entry = self._sessions[session] = _Session(weakref.ref(conversation), path, 0.0)
+            entry.used = time.monotonic()
+            self._sessions.move_to_end(session)
+            if self._task is None:
+                self._task = BackgroundLoop.get().submit(self._run())
+        if self.total() > self.ceiling:
+            self._sweep_soon()
+
+    def _live(self) -> list[tuple[str, _Session, Conversation]]:
+        """Tracked sessions whose history still exists, least recently used first."""
+        with self._state:
+            for session in [s for s, e in self._sessions.items() if e.conversation() is None]:
+                del self._sessions[session]
+            return [(s, e, e.conversation()) for s, e in self._sessions.items()]
+
+    def total(self) -> int:
+        """Approximate bytes held by every tracked history."""
+        return sum(c.nbytes for _, _, c in self._live() if c is not None)
+
+    def sweep(self) -> int:
+        """Spill idle histories, then the least recently used ones while over the ceiling; returns bytes freed."""
+        sessions = self._live()
+        total = sum(c.nbytes for _, _, c in sessions if c is not None)
+        now = time.monotonic()
+        freed = 0
+        for index, (session, entry, conversation) in enumerate(sessions):
+            if conversation is None or conversation.spilled:
+                continue
+            idle = now - entry.used >= self.idle and conversation.nbytes >= MIN_SPILL_BYTES
+            # Never the most recently used session: it is the one making the process grow
+            over = total - freed > self.ceiling and index < len(sessions) - 1
+            if not idle and not over:
+                continue
+            try:
+                released = conversation.spill(entry.path)
+            except OSError as e:
+                print(f"Couldn't spill the history of session {session}: {e}")
+                continue
+            freed += released
+            with self._state:
+                self._spills += 1
+                self._spilled_bytes += released
+        return freed
+
+    def _sweep_soon(self):
+        with self._state:
+            if self._sweeping is not None and not self._sweeping.done():
+                return
+            self._sweeping = BackgroundLoop.get().submit(asyncio.to_thread(self.sweep))
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await asyncio.to_thread(self.sweep)
+            except Exception as e:
+                print(f"Session memory sweep failed: {e}")
+
+    def metrics(self) -> dict:
+        sessions = self._live()
+        live = [c for _, _, c in sessions if c is not None]
+        with self._state:
+            spills, spilled_bytes = self._spills, self._spilled_bytes
+        return {
+            "sessions": len(live),
+            "spilled_sessions": sum(c.spilled for c in live),
+            "bytes": sum(c.nbytes for c in live),
+            "ceiling": self.ceiling,
+            "spills": spills,
+            "spilled_bytes": spilled_bytes,
+        }
@@ -0,0 +1,102 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+from LLMCPClient.Deadlines import bounded
+from LLMCPClient.HealthMonitor import CircuitBreaker, CircuitOpenError, HealthMonitor
+from LLMCPClient.HTTPClient import MCPClient
+from LLMCPClient.ResumableSession import CONNECTION_ERRORS
+
+
+class SessionPool:
+    """
+    A fixed number of connected MCPClients for one endpoint, reused across requests.
+
+    The Streamable-HTTP transport is built on anyio task groups, which must be entered
+    and exited by the same task. Each pooled client is therefore owned by a long-lived
+    holder task that connects it, parks it in the idle queue and, once the client is
+    retired (pool closing or connection broken), cleans it up and connects a fresh one.
+    The pool belongs to the event loop it was started on.
+    """
+
+    def __init__(self, endpoint: str, size: int = 4, retry_delay: float = 2.0):
+        self.endpoint = endpoint
+        self.size = size
+        self.retry_delay = retry_delay
+        self._idle: asyncio.Queue = asyncio.Queue()
+        self._holders: list[asyncio.Task] = []
+        self._closed = False
+
+    async def start(self):
+        """Spawn the holder tasks. Connections are made in the background."""
+        self._holders = [asyncio.create_task(self._hold()) for _ in range(self.size)]
+
+    async def _hold(self):
+        while not self._closed:
+            client = MCPClient()
+            retire = asyncio.Event()
+            try:
+                await client.connect_to_http_server(self.endpoint)
+            except Exception as e:
+                print(f"SessionPool: connecting to {self.endpoint} failed: {e}")
+                await client.cleanup()
+                await asyncio.sleep(self.retry_delay)
+                continue
+            if self._closed:
+                await client.cleanup()
+                return
+
+            self._idle.put_nowait((client, retire))
+            try:
+                await retire.wait()
+            finally:
+                await client.cleanup()
+
+    async def _borrow(self) -> tuple[MCPClient, asyncio.Event]:
+        breaker = HealthMonitor.get().breaker(self.endpoint)
+        async with bounded():
+            while True:
+                if self._idle.empty() and breaker.state == CircuitBreaker.OPEN:
+                    # The holders can't connect a client until the circuit closes again
+                    raise CircuitOpenError(f"MCP server {self.endpoint} is unavailable (circuit {breaker.state})")
+                try:
+                    # Look at the breaker again now and then while waiting
+                    async with asyncio.timeout(self.retry_delay):
+                        client, retire = await self._idle.get()
+                except TimeoutError:
+                    continue
+                # Skip clients retired while they sat in the queue
+                if not retire.is_set():
+                    return client, retire
+
+    @asynccontextmanager
+    async def client(self) -> AsyncIterator[MCPClient]:
+        """
+        Borrow a connected client for the duration of the block.
+
+        Waits for one within the current deadline (see LLMCPClient.Deadlines), and raises
+        CircuitOpenError instead of waiting while none is idle and the endpoint is down.
+        """
+        if self._closed:
+            raise RuntimeError("SessionPool is closed")
+        client, retire = await self._borrow()
+        try:
+            yield client
+        except CONNECTION_ERRORS:
+            # Clients reconnect by themselves; one that raises this couldn't, so it's replaced
+            retire.set()
+            raise
+        finally:
+            if self._closed:
+                retire.set()
+            elif not retire.is_set():
+                self._idle.put_nowait((client, retire))
+
+    async def close(self):
+        """Retire every client and wait for the holders to clean them up."""
+        self._closed = True
+        # Idle clients are retired now; busy ones are retired when they are released
+        while not self._idle.empty():
+            _, retire = self._idle.get_nowait()
+            retire.set()
+        await asyncio.gather(*self._holders, return_exceptions=True)
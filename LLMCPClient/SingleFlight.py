@@ -0,0 +1,147 @@
+import asyncio
+import hashlib
+import json
+import re
+import threading
+from typing import AsyncIterator, Awaitable, Callable, TypeVar
+
+T = TypeVar("T")
+
+_END = object()
+_WHITESPACE = re.compile(r"\s+")
+
+
+def _normalize(value):
+    if isinstance(value, str):
+        return _WHITESPACE.sub(" ", value).strip()
+    if isinstance(value, dict):
+        return {k: _normalize(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    return value
+
+
+def request_key(*parts) -> str:
+    """
+    Key for coalescing: a hash of the request parts with whitespace normalized.
+
+    Pass everything that influences the answer, e.g.
+    request_key("direct", model, conversation.payload()).
+    """
+    encoded = json.dumps(_normalize(parts), sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+class _Flight:
+    __slots__ = ("task", "waiters", "deltas", "listeners")
+
+    def __init__(self):
+        self.task = None
+        self.waiters = 0
+        self.deltas: list = []
+        self.listeners: set[asyncio.Queue] = set()
+
+
+class SingleFlight:
+    """
+    Lets concurrent identical requests share one in-flight call.
+
+    The first caller for a key starts the call as its own task; callers arriving while
+    it runs wait on that task instead of starting another. The shared call is only
+    cancelled once every waiter has gone away, so one user's Stop doesn't cancel
+    anyone else's answer. Completed results are not cached.
+
+    Not thread-safe: use one instance per event loop (SingleFlight.get() is the one
+    on the Streamlit background loop).
+    """
+
+    _instance = None
+    _lock = threading.Lock()
+
+    def __init__(self):
+        self._calls: dict[str, _Flight] = {}
+        self._streams: dict[str, _Flight] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    @classmethod
+    def get(cls) -> "SingleFlight":
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    def metrics(self) -> dict:
+        total = self.leaders + self.coalesced
+        return {
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "coalesced_ratio": self.coalesced / total if total else 0.0,
+            "in_flight": len(self._calls) + len(self._streams),
+        }
+
+    def _join(self, flights: dict, key: str, start: Callable[[_Flight], Awaitable]) -> _Flight:
+        flight = flights.get(key)
+        if flight is None:
+            flight = _Flight()
+            flight.task = asyncio.create_task(start(flight))
+            flight.task.add_done_callback(lambda _: flights.pop(key, None) if flights.get(key) is flight else None)
+            flights[key] = flight
+            self.leaders += 1
+        else:
+            self.coalesced += 1
+        flight.waiters += 1
+        return flight
+
+    def _leave(self, flight: _Flight):
+        flight.waiters -= 1
+        if flight.waiters == 0 and not flight.task.done():
+            flight.task.cancel()
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        """Await fn(), or the identical call already in flight for key."""
+        flight = self._join(self._calls, key, lambda _: fn())
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            self._leave(flight)
+
+    async def stream(self, key: str, fn: Callable[[], AsyncIterator[T]]) -> AsyncIterator[T]:
+        """
+        Iterate fn()'s deltas, or fan out the identical stream already in flight for key.
+
+        Deltas are passed on as they are: text, or events such as tool progress.
+        Callers that join late first get the deltas produced so far, then the live ones.
+        """
+        flight = self._join(self._streams, key, lambda flight: self._pump(flight, fn()))
+        listener = asyncio.Queue()
+        # No await between the snapshot and subscribing, so no delta can slip between
+        buffered = list(flight.deltas)
+        flight.listeners.add(listener)
+        if flight.task.done():
+            # Joined after the pump finished but before the flight was unregistered
+            listener.put_nowait(_END)
+        try:
+            for delta in buffered:
+                yield delta
+            while (delta := await listener.get()) is not _END:
+                yield delta
+            # Re-raise the shared call's error, if any
+            await asyncio.shield(flight.task)
+        finally:
+            flight.listeners.discard(listener)
+            self._leave(flight)
+
+    async def _pump(self, flight: _Flight, deltas: AsyncIterator):
+        try:
+            async for delta in deltas:
+                flight.deltas.append(delta)
+                for listener in flight.listeners:
+                    listener.put_nowait(delta)
+        finally:
+            for listener in flight.listeners:
+                listener.put_nowait(_END)
+            # Close the source promptly when the last waiter left mid-stream
+            aclose = getattr(deltas, "aclose", None)
+            if aclose is not None:
+                await aclose()
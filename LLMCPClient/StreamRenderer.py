@@ -0,0 +1,111 @@
+import time
+from collections import deque
+from typing import AsyncIterator, Optional
+
+FENCE = "```"
+
+
+class StreamRenderer:
+    """
+    Paints a streamed response into a Streamlit container at a fixed frame rate.
+
+    push() may be called from any thread (it is the on_text callback of a turn running
+    on the background loop) and only appends to a buffer. tick(), called from the
+    script thread, drains the buffer at most `fps` times a second. Finished paragraphs
+    (outside code fences) are written once into their own markdown element and never
+    touched again; only the paragraph still being written is repainted. Each update
+    therefore costs the size of one paragraph, not of the whole response.
+    """
+
+    def __init__(self, container, fps: float = 10.0, cursor: str = "▌"):
+        self.frame_interval = 1.0 / fps
+        self.cursor = cursor
+        self.text_length = 0
+        self._container = container
+        # The status line sits above the text so new paragraphs are appended below it
+        self._status = container.empty()
+        self._tail = container.empty()
+        self._pending: deque = deque()
+        self._open = ""
+        self._scan = 0
+        self._last_flush = 0.0
+        # Status updates (e.g. tool progress) by id, written from the background loop
+        self._activities: dict = {}
+
+    def push(self, delta: str):
+        """Queue a text delta. Thread-safe: deque appends are atomic."""
+        self._pending.append(delta)
+
+    async def consume(self, deltas: AsyncIterator) -> str:
+        """
+        Push every text delta of an async iterator and return the complete text.
+
+        Any other item (e.g. an MCPClient ToolProgress) is a status update: its text
+        replaces the status line until an update with the same call_id and done set.
+        """
+        parts = []
+        async for delta in deltas:
+            if isinstance(delta, str):
+                parts.append(delta)
+                self.push(delta)
+            else:
+                self.activity(delta)
+        return "".join(parts)
+
+    def activity(self, update):
+        key = getattr(update, "call_id", None)
+        if getattr(update, "done", False):
+            self._activities.pop(key, None)
+        else:
+            self._activities[key] = str(update)
+
+    def tick(self, elapsed: float, status: Optional[str] = None):
+        """
+        Per-frame update from the script thread.
+
+        The status line is rewritten on every tick: each Streamlit update is also where
+        a Stop click or a new message interrupts the script, so it must not go quiet
+        while a tool call produces no text.
+        """
+        activities = list(self._activities.values())
+        if activities:
+            status = activities[-1]
+        if status is not None:
+            self._status.caption(f"{status} {elapsed:.0f}s")
+        now = time.monotonic()
+        if now - self._last_flush >= self.frame_interval:
+            self._last_flush = now
+            self._flush(self.cursor)
+
+    def finish(self, text: Optional[str] = None):
+        """Render whatever is left without the cursor; show `text` if nothing streamed."""
+        self._flush("")
+        self._status.empty()
+        if self.text_length:
+            self._tail.markdown(self._open)
+        elif text is not None:
+            self._tail.markdown(text)
+
+    def _flush(self, cursor: str):
+        if not self._pending:
+            return
+        chunks = []
+        while self._pending:
+            chunks.append(self._pending.popleft())
+        new_text = "".join(chunks)
+        self.text_length += len(new_text)
+        self._open += new_text
+        self._seal_paragraphs()
+        self._tail.markdown(self._open + cursor)
+
+    def _seal_paragraphs(self):
+        while (end := self._open.find("\n\n", self._scan)) >= 0:
+            paragraph = self._open[:end]
+            if paragraph.count(FENCE) % 2:
+                # Blank line inside a code block: keep the block together
+                self._scan = end + 2
+                continue
+            self._tail.markdown(paragraph)
+            self._tail = self._container.empty()
+            self._open = self._open[end + 2:]
+            self._scan = 0
@@ -0,0 +1,164 @@
+"""
+Local token estimates for messages and requests, with no API calls.
+
+estimate_text() approximates a BPE tokenizer from the shape of the text: short words
+are one token, long words a token per few letters, numbers one per three digits, and
+punctuation and non-ASCII characters one each. It is rough by design (and errs high on
+code and non-Latin scripts); calibration corrects its bias per model.
+
+Counts are memoized: each Message caches its own (Message.token_count), and
+count_request() remembers the contents of recent requests, so a long history is only
+ever counted once. Calibration corrects for the estimator and for each model's
+tokenizer by comparing the estimates of sent requests with the input token count the
+API reports in `usage`; Calibration.get().tokens(estimate, model) gives the corrected
+figure.
+
+Used to trim history to a token budget (Conversation.window(max_tokens=...)) and to
+make the Scheduler's fair queuing share tokens, not requests, between sessions.
+"""
+
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Optional, Sequence
+
+# History budget per request for the apps' context trimming
+CONTEXT_TOKENS = int(os.getenv("CHATGENIE_CONTEXT_TOKENS", "50000"))
+
+MESSAGE_OVERHEAD = 4  # role and separators per message
+REQUEST_OVERHEAD = 8
+IMAGE_TOKENS = 1600  # an image of about 1.15 megapixels, the API's own downscaling limit
+TEXT_BYTES_PER_TOKEN = 4
+BINARY_BYTES_PER_TOKEN = 30  # rough, for PDFs; calibration absorbs the error over time
+
+_WORDS = re.compile(r"[A-Za-z]+")
+_LONG_WORDS = re.compile(r"[A-Za-z]{8,}")
+_NUMBERS = re.compile(r"\d{1,3}")
+_SYMBOLS = re.compile(r"[^\sA-Za-z\d]")  # punctuation and every non-ASCII character
+
+
+def estimate_text(text: str) -> int:
+    """Approximate token count of a string."""
+    tokens = len(_WORDS.findall(text)) + len(_NUMBERS.findall(text)) + len(_SYMBOLS.findall(text))
+    # Words of 8+ letters are split about every five letters
+    tokens += sum((len(word) - 3) // 5 for word in _LONG_WORDS.findall(text))
+    return tokens
+
+
+def _attachment_tokens(source: dict) -> int:
+    from LLMCPClient.Attachments import AttachmentStore, _is_text
+
+    try:
+        size = os.path.getsize(AttachmentStore.get().path(source["sha256"]))
+    except OSError:
+        return 0
+    return size // (TEXT_BYTES_PER_TOKEN if _is_text(source["media_type"]) else BINARY_BYTES_PER_TOKEN)
+
+
+def _block_tokens(block: dict) -> int:
+    kind = block.get("type")
+    if kind == "text":
+        return estimate_text(block["text"])
+    if kind == "image":
+        return IMAGE_TOKENS
+    if kind == "document":
+        source = block["source"]
+        if source["type"] == "attachment":
+            return _attachment_tokens(source)
+        if source["type"] == "text":
+            return estimate_text(source["data"])
+        if source["type"] == "base64":
+            return len(source["data"]) * 3 // 4 // BINARY_BYTES_PER_TOKEN
+        return 0
+    if kind == "tool_use":
+        return estimate_text(block["name"]) + estimate_text(json.dumps(block["input"]))
+    if kind == "tool_result":
+        return count_content(block.get("content") or "")
+    return estimate_text(json.dumps(block))
+
+
+def count_content(content) -> int:
+    """Approximate tokens of message content: a string or a sequence of content blocks."""
+    if isinstance(content, str):
+        return estimate_text(content)
+    return sum(_block_tokens(block) for block in content)
+
+
+# Contents counted by count_request, by identity. Message payloads share their content
+# object between turns, so a history is counted once, not on every request.
+_counted: OrderedDict = OrderedDict()
+_counted_lock = threading.Lock()
+_COUNTED_MAX = 4096
+
+
+def _count_cached(content) -> int:
+    key = id(content)
+    with _counted_lock:
+        entry = _counted.get(key)
+        if entry is not None and entry[0] is content:
+            _counted.move_to_end(key)
+            return entry[1]
+    count = count_content(content)
+    with _counted_lock:
+        _counted[key] = (content, count)
+        if len(_counted) > _COUNTED_MAX:
+            _counted.popitem(last=False)
+    return count
+
+
+def count_request(messages: Sequence[dict], system=None, tools: Optional[Sequence[dict]] = None) -> int:
+    """Approximate input tokens of a Messages API request (uncalibrated)."""
+    tokens = REQUEST_OVERHEAD + sum(MESSAGE_OVERHEAD + _count_cached(m["content"]) for m in messages)
+    if system:
+        tokens += count_content(system)
+    for tool in tools or ():
+        tokens += estimate_text(tool["name"]) + estimate_text(tool.get("description") or "")
+        tokens += estimate_text(json.dumps(tool.get("input_schema") or {}))
+    return tokens
+
+
+class Calibration:
+    """Per-model ratio of actual to estimated input tokens, learned from API usage reports."""
+
+    _instance = None
+    _lock = threading.Lock()
+
+    def __init__(self, smoothing: float = 0.2, min_tokens: int = 200, bounds: tuple = (0.5, 2.5)):
+        self.smoothing = smoothing
+        # Small requests are dominated by fixed overheads (e.g. the API's tool-use prompt)
+        self.min_tokens = min_tokens
+        self.bounds = bounds
+        self._ratios: dict[str, float] = {}
+        self._samples: dict[str, int] = {}
+        self._state = threading.Lock()
+
+    @classmethod
+    def get(cls) -> "Calibration":
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    def observe(self, model: str, estimated: int, actual: Optional[int]):
+        """Record the API's input token count for a request estimated locally."""
+        if not actual or estimated < self.min_tokens:
+            return
+        low, high = self.bounds
+        ratio = min(high, max(low, actual / estimated))
+        with self._state:
+            previous = self._ratios.get(model)
+            self._ratios[model] = ratio if previous is None else previous + self.smoothing * (ratio - previous)
+            self._samples[model] = self._samples.get(model, 0) + 1
+
+    def ratio(self, model: Optional[str]) -> float:
+        return self._ratios.get(model, 1.0)
+
+    def tokens(self, estimated: int, model: Optional[str] = None) -> int:
+        """An estimate corrected for the model (left as is until it has been calibrated)."""
+        return round(estimated * self.ratio(model))
+
+    def metrics(self) -> dict:
+        with self._state:
+            return {model: {"ratio": round(r, 3), "samples": self._samples[model]} for model, r in self._ratios.items()}
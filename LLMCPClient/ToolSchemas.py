@@ -0,0 +1,125 @@
+"""
+Local validation of tool arguments against the tools' inputSchema.
+
+A ToolCatalog is built from a server's list_tools() result and compiles one jsonschema
+validator per tool. Validators are cached process-wide by schema, so every session
+connected to the same server shares them, and a catalog is only rebuilt when the
+server's tool list changes (see ToolCatalog.fingerprint).
+
+check() coerces the common near-misses of model-generated arguments ("3" for an integer,
+"true" for a boolean, a JSON string for an object or array) and reports anything still
+invalid as a message meant for the model, so a malformed call is answered at once
+with a corrective tool_result instead of a round trip to the server.
+"""
+
+import hashlib
+import json
+from functools import lru_cache
+from typing import Optional, Sequence, Union
+
+from jsonschema import SchemaError
+from jsonschema.validators import validator_for
+
+MAX_ERRORS = 5  # reported per call; the first few are enough for the model to fix its input
+
+_BOOLEANS = {"true": True, "false": False}
+
+
+def _canonical(schema: dict) -> str:
+    return json.dumps(schema, sort_keys=True, separators=(",", ":"))
+
+
+@lru_cache(maxsize=512)
+def _compile(schema_json: str):
+    """A validator for a schema (as canonical JSON), or None if the schema itself is invalid."""
+    schema = json.loads(schema_json)
+    cls = validator_for(schema)
+    try:
+        cls.check_schema(schema)
+    except SchemaError as e:
+        print(f"Not validating tool input, its schema is invalid: {e.message}")
+        return None
+    return cls(schema)
+
+
+def _coerce(value, schema: dict):
+    """value with strings converted where the schema asks for a single other type."""
+    if not isinstance(schema, dict):
+        return value
+    expected = schema.get("type")
+    if isinstance(value, str) and isinstance(expected, str) and expected != "string":
+        text = value.strip()
+        try:
+            if expected == "integer":
+                value = int(text)
+            elif expected == "number":
+                number = float(text)
+                value = int(number) if number.is_integer() and "." not in text else number
+            elif expected == "boolean" and text.lower() in _BOOLEANS:
+                value = _BOOLEANS[text.lower()]
+            elif expected in ("object", "array"):
+                decoded = json.loads(text)
+                if isinstance(decoded, dict if expected == "object" else list):
+                    value = decoded
+        except ValueError:
+            pass  # left as is; validation reports it
+    if isinstance(value, dict):
+        properties = schema.get("properties", {})
+        return {key: _coerce(item, properties.get(key)) for key, item in value.items()}
+    if isinstance(value, list) and isinstance(schema.get("items"), dict):
+        return [_coerce(item, schema["items"]) for item in value]
+    return value
+
+
+def _location(path) -> str:
+    return "".join(f"[{p}]" if isinstance(p, int) else f".{p}" for p in path).lstrip(".") or "arguments"
+
+
+class ToolCatalog:
+    """The tools of one list_tools() result, with a compiled validator for each."""
+
+    def __init__(self, tools: Sequence):
+        self.fingerprint = self.fingerprint_of(tools)
+        self._schemas = {tool.name: tool.inputSchema for tool in tools}
+        self._validators = {tool.name: _compile(_canonical(tool.inputSchema)) for tool in tools}
+
+    @staticmethod
+    def fingerprint_of(tools: Sequence) -> str:
+        digest = hashlib.sha256()
+        for tool in tools:
+            digest.update(tool.name.encode())
+            digest.update(_canonical(tool.inputSchema).encode())
+        return digest.hexdigest()
+
+    def check(self, tool_name: str, arguments: Union[dict, str]) -> tuple[dict, Optional[str]]:
+        """
+        The (coerced) arguments for a call, and an error message for the model if they
+        are still invalid.
+
+        arguments may be the raw JSON text of the call when it didn't parse.
+        """
+        if tool_name not in self._schemas:
+            return {}, f"Error: there is no tool named {tool_name!r}. Available tools: {', '.join(self._schemas)}"
+        schema = self._schemas[tool_name]
+        if isinstance(arguments, str):
+            try:
+                arguments = json.loads(arguments)
+            except ValueError as e:
+                return {}, f"Error: the input for {tool_name} is not valid JSON ({e}), the tool was not called."
+        arguments = _coerce(arguments, schema)
+        if not isinstance(arguments, dict):
+            return {}, f"Error: the input for {tool_name} must be a JSON object. Expected schema: {_canonical(schema)}"
+
+        validator = self._validators[tool_name]
+        if validator is None:
+            return arguments, None
+        errors = sorted(validator.iter_errors(arguments), key=lambda e: list(e.absolute_path))
+        if not errors:
+            return arguments, None
+        problems = "\n".join(f"- {_location(e.absolute_path)}: {e.message}" for e in errors[:MAX_ERRORS])
+        if len(errors) > MAX_ERRORS:
+            problems += f"\n- ... and {len(errors) - MAX_ERRORS} more"
+        return arguments, (
+            f"Error: invalid input for {tool_name}, the tool was not called:\n{problems}\n"
+            f"Fix the input and call it again. Expected schema: {_canonical(schema)}"
+        )
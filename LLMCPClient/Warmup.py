@@ -0,0 +1,123 @@
+"""
+Process start-up warm-up, so the first request is served as fast as later ones.
+
+Warmup keeps a small SessionPool of connected, initialized MCP clients (with their tool,
+resource and prompt catalogs prefetched) for every configured server, on the
+background loop. ServerRegistry starts one for each server as soon as it appears in the
+config and closes it when the server is removed; the apps borrow clients from it
+instead of connecting for each turn. warm_models() opens the pooled connections to the
+model APIs (checking the keys on the way).
+
+All of it runs concurrently in the background; report() says what is ready.
+"""
+
+import asyncio
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from LLMCPClient.BackgroundLoop import BackgroundLoop
+from LLMCPClient.Providers import get_router
+from LLMCPClient.SessionPool import SessionPool
+
+POOL_SIZE = int(os.getenv("CHATGENIE_WARM_POOL_SIZE", "2"))
+WARMUP_TIMEOUT = 30.0
+
+
+@dataclass(frozen=True)
+class Readiness:
+    ready: bool
+    seconds: Optional[float] = None  # time it took to get ready
+    detail: str = ""  # what was prefetched, or the error
+
+
+class Warmup:
+    """Warm MCP session pools and model connections, shared by every session in the process."""
+
+    _instance = None
+    _lock = threading.Lock()
+
+    def __init__(self, pool_size: int = POOL_SIZE):
+        self.pool_size = pool_size
+        # Pools belong to the background loop and are only touched from it
+        self._pools: dict[str, SessionPool] = {}
+        self._models: set = set()
+        self._readiness: dict[str, Readiness] = {}
+        self._state = threading.Lock()
+
+    @classmethod
+    def get(cls) -> "Warmup":
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    def _record(self, name: str, readiness: Readiness):
+        with self._state:
+            self._readiness[name] = readiness
+
+    def report(self) -> dict[str, Readiness]:
+        """Readiness of every warmed server (by endpoint) and model router."""
+        with self._state:
+            return dict(self._readiness)
+
+    @property
+    def settled(self) -> bool:
+        """Whether every warm-up started so far has finished, successfully or not."""
+        with self._state:
+            return all(r.seconds is not None for r in self._readiness.values())
+
+    def pool(self, endpoint: str) -> Optional[SessionPool]:
+        """The warm pool for a configured server, if there is one."""
+        return self._pools.get(endpoint)
+
+    async def warm_server(self, endpoint: str):
+        """Start a pool for the endpoint and wait until its first client is connected."""
+        if endpoint in self._pools:
+            return
+        started = time.monotonic()
+        self._record(endpoint, Readiness(False, detail="connecting"))
+        pool = self._pools[endpoint] = SessionPool(endpoint, size=self.pool_size)
+        await pool.start()
+        try:
+            async with asyncio.timeout(WARMUP_TIMEOUT):
+                async with pool.client() as client:
+                    detail = f"{len(client.tools)} tools, {len(client.resources)} resources, {len(client.prompts)} prompts"
+        except TimeoutError:
+            # The pool keeps reconnecting in the background
+            detail = f"not connected after {WARMUP_TIMEOUT:.0f}s, still retrying"
+            self._record(endpoint, Readiness(False, time.monotonic() - started, detail))
+            return
+        except Exception as e:
+            self._record(endpoint, Readiness(False, time.monotonic() - started, str(e) or type(e).__name__))
+            return
+        self._record(endpoint, Readiness(True, time.monotonic() - started, detail))
+
+    async def close_server(self, endpoint: str):
+        pool = self._pools.pop(endpoint, None)
+        with self._state:
+            self._readiness.pop(endpoint, None)
+        if pool is not None:
+            await pool.close()
+
+    def warm_models(self, primary: str = "anthropic", anthropic_api_key: Optional[str] = None, openai_api_key: Optional[str] = None):
+        """Warm the router for these keys on the background loop, once per process."""
+        key = (primary, anthropic_api_key, openai_api_key)
+        with self._state:
+            if key in self._models:
+                return
+            self._models.add(key)
+        BackgroundLoop.get().submit(self._warm_router(primary, get_router(primary, anthropic_api_key, openai_api_key)))
+
+    async def _warm_router(self, primary: str, router):
+        name = f"model:{primary}"
+        started = time.monotonic()
+        self._record(name, Readiness(False, detail="connecting"))
+        try:
+            await asyncio.wait_for(router.warm(), WARMUP_TIMEOUT)
+        except Exception as e:
+            self._record(name, Readiness(False, time.monotonic() - started, str(e) or type(e).__name__))
+            return
+        self._record(name, Readiness(True, time.monotonic() - started, "connected"))
@@ -2,6 +2,8 @@ import streamlit as st
 import random
 import time
 
+from LLMCPClient.Messages import Conversation
+
 # Set page configuration
 st.set_page_config(
     page_title="Enhanced Chatbot",
@@ -35,9 +37,9 @@ st.markdown("<p style='text-align: center; margin-bottom: 30px;'>Ask me anything
 
 # Initialize chat history in session state if it doesn't exist
 if "messages" not in st.session_state:
-    st.session_state.messages = []
+    st.session_state.messages = Conversation()
     # Add a welcome message
-    st.session_state.messages.append({"role": "assistant", "content": "Hello! I'm your friendly chat assistant. How can I help you today?"})
+    st.session_state.messages.append("assistant", "Hello! I'm your friendly chat assistant. How can I help you today?")
 
 # Define enhanced chatbot responses
 bot_responses = {
@@ -76,13 +78,13 @@ def get_bot_response(user_message):
 
 # Display chat messages from history
 for message in st.session_state.messages:
-    with st.chat_message(message["role"], avatar="🧑‍💻" if message["role"] == "user" else "🤖"):
-        st.write(message["content"])
+    with st.chat_message(message.role, avatar="🧑‍💻" if message.role == "user" else "🤖"):
+        st.write(message.content)
 
 # User input with chat_input
 if prompt := st.chat_input("Type your message here..."):
     # Add user message to chat history
-    st.session_state.messages.append({"role": "user", "content": prompt})
+    st.session_state.messages.append("user", prompt)
     
     # Display user message in chat container
     with st.chat_message("user", avatar="🧑‍💻"):
@@ -106,7 +108,7 @@ if prompt := st.chat_input("Type your message here..."):
         message_placeholder.write(bot_response)
     
     # Add bot response to chat history
-    st.session_state.messages.append({"role": "assistant", "content": bot_response})
+    st.session_state.messages.append("assistant", bot_response)
 
 # Add a sidebar with information and controls
 with st.sidebar:
@@ -129,8 +131,8 @@ with st.sidebar:
     
     # Add a clear conversation button in the sidebar
     if st.button("Clear Conversation", key="clear_convo"):
-        st.session_state.messages = []
-        st.session_state.messages.append({"role": "assistant", "content": "Hello! I'm your friendly chat assistant. How can I help you today?"})
+        st.session_state.messages.clear()
+        st.session_state.messages.append("assistant", "Hello! I'm your friendly chat assistant. How can I help you today?")
         st.rerun()
         
     # Add some credits
@@ -1,11 +1,28 @@
 import streamlit as st
-import requests
+import httpx
+import io
 import json
 import time
 import os
+import uuid
 
 from LLMCPClient.HTTPClient import MCPClient  
-import asyncio
+from LLMCPClient import Profiling as profiling
+from LLMCPClient import Archive, Attachments
+from LLMCPClient.Attachments import AttachmentStore
+from LLMCPClient.Cancellation import Turn, TurnCancelled
+from LLMCPClient.Compaction import Compactor
+from LLMCPClient.Deadlines import CUT_OFF, TURN_TIMEOUT, Deadline, DeadlineExceeded, until, within
+from LLMCPClient.HealthMonitor import CircuitBreaker, HealthMonitor
+from LLMCPClient.Messages import Conversation
+from LLMCPClient.Providers import get_router, text_deltas
+from LLMCPClient.Scheduler import INTERACTIVE, run_as
+from LLMCPClient.SessionMemory import SessionMemory
+from LLMCPClient.ServerConfig import ServerRegistry
+from LLMCPClient.SingleFlight import SingleFlight, request_key
+from LLMCPClient.StreamRenderer import StreamRenderer
+from LLMCPClient.Tokens import CONTEXT_TOKENS
+from LLMCPClient.Warmup import Warmup
 
 # Set page configuration
 st.set_page_config(
@@ -77,30 +94,75 @@ st.markdown("<h1 style='text-align: center; margin-bottom: 30px;'>🤖 Claude-Po
 st.markdown("<p style='text-align: center; margin-bottom: 30px;'>Ask me anything! I'm powered by Anthropic's Claude AI.</p>", unsafe_allow_html=True)
 
 # Initialize session state variables
+if "session_id" not in st.session_state:
+    # Model and tool calls are queued fairly per session (see LLMCPClient.Scheduler)
+    st.session_state.session_id = uuid.uuid4().hex
+
 if "messages" not in st.session_state:
-    st.session_state.messages = []
+    st.session_state.messages = Conversation()
     # Add a welcome message
-    st.session_state.messages.append({
-        "role": "assistant", 
-        "content": "Hello! I'm a chat assistant powered by Anthropic's Claude. How can I help you today?"
-    })
+    st.session_state.messages.append(
+        "assistant",
+        "Hello! I'm a chat assistant powered by Anthropic's Claude. How can I help you today?"
+    )
+
+# Idle histories are spilled to disk and read back on use (see LLMCPClient.SessionMemory)
+SessionMemory.get().track(st.session_state.session_id, st.session_state.messages)
 
 if "run_mode" not in st.session_state:
     st.session_state.run_mode = "standalone"
 
+HISTORY_WINDOW = 10  # messages sent as they are; older ones are summarized
+
+# Shared across all sessions in this process. The registry warms up a session pool for
+# every configured server; the model API connections are warmed up here, once per process
+health_monitor = HealthMonitor.get()
+server_registry = ServerRegistry.get()
+Warmup.get().warm_models("anthropic", st.secrets.get("ANTHROPIC_API_KEY"), st.secrets.get("OPENAI_API_KEY"))
+
 # Function to call Claude API
-def get_claude_response(messages, run_mode="standalone"):
+def get_claude_response(messages, renderer, run_mode="standalone"):
+    """
+    Build the coroutine for one turn, streaming the response text into renderer.
+
+    Secrets and session state are only readable from the script thread, so configuration
+    is resolved here and the returned coroutine runs on the background loop as a Turn.
+    """
+    # Snapshot the window the turn works on; Message records are immutable, so only
+    # the list is copied. The last 10 messages, after a summary of the earlier ones (see
+    # compact_history), within the token budget keep the context window reasonable
+    messages = Conversation(messages.context(HISTORY_WINDOW, CONTEXT_TOKENS, st.session_state.selected_model))
+    # Identical requests in flight from other sessions share one call
+    flights = SingleFlight.get()
     if run_mode == "standalone":
-        return get_claude_direct(messages)
+        api_key = get_anthropic_api_key()
+        # An OpenAI key, if configured, makes OpenAI the failover backend
+        backup_api_key = st.secrets.get("OPENAI_API_KEY")
+        model = st.session_state.selected_model
+        key = request_key("direct", model, messages.payload())
+        return renderer.consume(flights.stream(key, lambda: get_claude_direct(messages, api_key, model, backup_api_key)))
     else:
-        return get_claude_via_mcp(messages)
+        selected_server = get_selected_mcp_server()
+        # Log server connection attempt (can be removed in production)
+        st.session_state.last_used_server = selected_server["name"]
+        endpoint = selected_server["endpoint"]
+        key = request_key("mcp", endpoint, messages.payload())
+        return renderer.consume(flights.stream(key, lambda: get_claude_via_mcp(messages, endpoint)))
 
-def get_claude_direct(messages):
-    url = "https://api.anthropic.com/v1/messages"
-    
+def compact_history():
+    """Summarize, in the background, messages that have left the window (used from the next turn)."""
+    Compactor.get().schedule(
+        st.session_state.messages,
+        HISTORY_WINDOW,
+        st.secrets.get("ANTHROPIC_API_KEY"),
+        st.secrets.get("OPENAI_API_KEY"),
+        st.session_state.session_id,
+    )
+
+def get_anthropic_api_key():
     # Get API key from secrets
     try:
-        api_key = st.secrets["ANTHROPIC_API_KEY"]
+        return st.secrets["ANTHROPIC_API_KEY"]
     except Exception as e:
         st.error("""
         Error: API key not found in secrets.
@@ -111,99 +173,109 @@ def get_claude_direct(messages):
         3. Restart the Streamlit app
         """)
         st.stop()
-    
-    # Convert Streamlit message format to Claude's format
-    claude_messages = []
-    for msg in messages[-10:]:  # Only use last 10 messages to keep context window reasonable
-        if msg["role"] == "user":
-            claude_messages.append({"role": "user", "content": msg["content"]})
-        elif msg["role"] == "assistant":
-            claude_messages.append({"role": "assistant", "content": msg["content"]})
-    
-    headers = {
-        "Content-Type": "application/json",
-        "x-api-key": api_key,
-        "anthropic-version": "2023-06-01"
-    }
-    
-    payload = {
-        "model": st.session_state.selected_model,
-        "max_tokens": 1000,
-        "messages": claude_messages
-    }
-    
+
+async def get_claude_direct(messages, api_key, model, backup_api_key=None):
+    """Yield Claude's response text as it streams in."""
+    # The process-wide router reuses pooled connections across turns and sessions, and
+    # fails over to the backup provider when Anthropic errors or stalls. Awaiting the
+    # stream lets a cancelled turn close the connection straight away.
+    router = get_router("anthropic", api_key, backup_api_key)
+    events = router.stream(model=model, max_tokens=1000, messages=messages.payload())
+    # A stalled stream is cut off at the turn's deadline, keeping what was said so far
     try:
-        response = requests.post(url, headers=headers, json=payload)
-        response.raise_for_status()
-        return response.json()["content"][0]["text"]
-    except Exception as e:
-        st.error(f"Error calling Claude API: {str(e)}")
-        if 'response' in locals() and hasattr(response, 'text'):
-            st.error(f"Response error: {response.text}")
-        return "I'm having trouble connecting to my AI backend. Please check the API key in your secrets file and try again."
+        async for text in until(text_deltas(events), Deadline.after(TURN_TIMEOUT)):
+            yield text
+    except DeadlineExceeded:
+        yield "\n\n" + CUT_OFF
 
-def get_claude_via_mcp(messages) -> str:
+def get_mcp_servers():
+    """The configured servers (shared, read-only) followed by this session's own."""
+    shared = [server.as_dict() for server in server_registry.config.servers]
+    return shared + st.session_state.get("custom_mcp_servers", [])
+
+def get_selected_mcp_server():
     # Get selected MCP server configuration
-    if not st.session_state.mcp_servers or st.session_state.selected_mcp_server_index >= len(st.session_state.mcp_servers):
+    mcp_servers = get_mcp_servers()
+    if not mcp_servers or st.session_state.selected_mcp_server_index >= len(mcp_servers):
         st.error("MCP server configuration is missing or invalid.")
         st.stop()
         
-    selected_server = st.session_state.mcp_servers[st.session_state.selected_mcp_server_index]
-    mcp_endpoint = selected_server["endpoint"]
-    #mcp_api_key = selected_server["api_key"]
+    selected_server = mcp_servers[st.session_state.selected_mcp_server_index]
     
     # Validate configuration
-    #if not mcp_endpoint or not mcp_api_key:
-    if not mcp_endpoint:
+    if not selected_server["endpoint"]:
         st.error(f"""
         Error: MCP configuration for '{selected_server['name']}' is incomplete.
         
         Please provide both the API Endpoint and API Key in the server configuration.
         """)
         st.stop()
-    
-    # Convert Streamlit message format to MCP format
-    mcp_payload = {
-        "model": st.session_state.selected_model,
-        "messages": [],
-        "max_tokens": 1000,
-        "project_id": st.session_state.mcp_project_id,
-        "stream": False
-    }
-    
-    for msg in messages[-10:]:
-        if msg["role"] in ["user", "assistant"]:
-            mcp_payload["messages"].append({
-                "role": msg["role"],
-                "content": msg["content"]
-            })
-    
-    headers = {
-        "Content-Type": "application/json"#,
-        #"Authorization": f"Bearer {mcp_api_key}"
-    }
-    
+    return selected_server
 
-    try:
-        # Log server connection attempt (can be removed in production)
-        st.session_state.last_used_server = selected_server["name"]
-        
-        # Initialize MCP client
-        client = MCPClient()
+async def get_claude_via_mcp(messages, mcp_endpoint):
+    """Yield the MCP client's response text as it streams in, with live tool progress."""
+    # Configured servers have a pool of clients connected at start-up (see Warmup)
+    pool = Warmup.get().pool(mcp_endpoint)
+    if pool is not None:
+        # One deadline for the turn, including the wait for a pooled client
+        with within(TURN_TIMEOUT):
+            async with pool.client() as client:
+                async for delta in client.stream_query(messages[-1].content, history=messages[:-1]):
+                    yield delta
+        return
 
-        asyncio.run(client.connect_to_http_server(mcp_endpoint))
+    # Initialize MCP client. Connect, chat and cleanup run in the same task so the
+    # transport's cancel scopes are entered and exited together, even when cancelled.
+    client = MCPClient()
+    try:
+        await client.connect_to_http_server(mcp_endpoint)
 
         # Call the tool with the user input
-        response = asyncio.run(client.chat(msg["content"]))
-        return response
-        
-    except Exception as e:
-        st.error(f"Error calling MCP API on server '{selected_server['name']}': {str(e)}")
-        return f"I'm having trouble connecting to the MCP server '{selected_server['name']}'. Please check your MCP configuration and try again."
-
+        async for delta in client.stream_query(messages[-1].content, history=messages[:-1]):
+            yield delta
     finally:
         # Cleanup MCP client
-        asyncio.run(client.cleanup())
+        await client.cleanup()
+
+def status_dot(endpoint):
+    """Plain-text status marker for the server selectbox (which can't render HTML)."""
+    if not endpoint:
+        return "⚪"
+    status = health_monitor.status(endpoint)
+    if status.active:
+        return "🟢"
+    if status.state == CircuitBreaker.HALF_OPEN:
+        return "🟡"
+    return "🔴" if status.checked_at is not None else "⚪"
+
+@st.fragment(run_every=health_monitor.interval)
+def server_status_line(endpoint):
+    """Live status dot and latency for the selected server, refreshed with the probes."""
+    if not endpoint:
+        return
+    status = health_monitor.status(endpoint)
+    css_class = "server-status-active" if status.active else "server-status-inactive"
+    if status.active:
+        detail = f"Online · {status.latency * 1000:.0f} ms"
+    elif status.checked_at is None:
+        detail = "Checking..."
+    else:
+        detail = f"Unavailable ({status.state})"
+    warm = Warmup.get().report().get(endpoint)
+    if warm is not None and warm.ready:
+        # Catalogs prefetched by the server's warm session pool
+        detail += f" · {warm.detail}"
+    st.markdown(
+        f"<div class='status-indicator'><span class='server-status {css_class}'></span>{detail}</div>",
+        unsafe_allow_html=True
+    )
+
+def cancel_active_turn():
+    """Cancel this session's in-flight turn, if any (e.g. superseded by a new message)."""
+    turn = st.session_state.get("active_turn")
+    if turn is not None and not turn.done():
+        turn.cancel()
+    st.session_state.active_turn = None
 
 # Initialize tracking for last used server info
 if "last_used_server" not in st.session_state:
@@ -231,104 +303,96 @@ with st.sidebar:
         st.markdown("<div class='sidebar-section'>", unsafe_allow_html=True)
         st.markdown("### MCP Settings")
         
-        # Initialize MCP settings in session state if not exist
-        if "mcp_servers" not in st.session_state:
-            # Default to empty list or load from secrets if available
-            try:
-                # Try to load predefined servers from secrets
-                mcp_servers_config = st.secrets.get("MCP_SERVERS", {})
-                st.session_state.mcp_servers = []
-                
-                # Convert dict config to list for dropdown
-                for name, config in mcp_servers_config.items():
-                    st.session_state.mcp_servers.append({
-                        "name": name,
-                        "endpoint": config.get("endpoint", ""),
-                        "api_key": config.get("api_key", ""),
-                    })
-                
-                # If no predefined servers, add an empty default
-                if not st.session_state.mcp_servers:
-                    st.session_state.mcp_servers = [{
-                        "name": "Default MCP",
-                        "endpoint": "",
-                        "api_key": "",
-                    }]
-            except Exception:
-                # Fallback to a single default entry
-                st.session_state.mcp_servers = [{
-                    "name": "Default MCP",
-                    "endpoint": "",
-                    "api_key": "",
-                }]
+        # Servers from the config file are shared by every session and read-only here;
+        # servers added in the sidebar belong to this session only
+        if "custom_mcp_servers" not in st.session_state:
+            st.session_state.custom_mcp_servers = []
+        for error in server_registry.config.errors:
+            st.warning(error)
+        mcp_servers = get_mcp_servers()
+        if not mcp_servers:
+            # No configured servers: start with an empty entry to fill in
+            st.session_state.custom_mcp_servers.append({
+                "name": "Default MCP",
+                "endpoint": "",
+                "api_key": "",
+            })
+            mcp_servers = get_mcp_servers()
                 
         if "selected_mcp_server_index" not in st.session_state:
             st.session_state.selected_mcp_server_index = 0
+        # A reload may have removed servers
+        if st.session_state.selected_mcp_server_index >= len(mcp_servers):
+            st.session_state.selected_mcp_server_index = 0
             
         if "mcp_project_id" not in st.session_state:
             st.session_state.mcp_project_id = ""
         
+        # Keep every server of this session under background health probes; edited and
+        # deleted ones are dropped, and all of them when the session ends
+        if "health_watch" not in st.session_state:
+            st.session_state.health_watch = health_monitor.session_watch()
+        st.session_state.health_watch.update(server["endpoint"] for server in mcp_servers)
+
         # Server selection and management
         col1, col2 = st.columns([3, 1])
         
         with col1:
-            server_names = [server["name"] for server in st.session_state.mcp_servers]
+            server_names = [server["name"] for server in mcp_servers]
             st.session_state.selected_mcp_server_index = st.selectbox(
                 "MCP Server:",
                 range(len(server_names)),
-                format_func=lambda i: server_names[i],
+                format_func=lambda i: f"{status_dot(mcp_servers[i]['endpoint'])} {server_names[i]}",
                 index=st.session_state.selected_mcp_server_index
             )
+            server_status_line(mcp_servers[st.session_state.selected_mcp_server_index]["endpoint"])
         
         with col2:
             if st.button("Add Server", key="add_mcp_server"):
                 # Add a new server configuration
-                st.session_state.mcp_servers.append({
-                    "name": f"MCP Server {len(st.session_state.mcp_servers) + 1}",
+                st.session_state.custom_mcp_servers.append({
+                    "name": f"MCP Server {len(mcp_servers) + 1}",
                     "endpoint": "",
                     "api_key": "",
                 })
                 # Select the new server
-                st.session_state.selected_mcp_server_index = len(st.session_state.mcp_servers) - 1
+                st.session_state.selected_mcp_server_index = len(mcp_servers)
                 st.rerun()
         
         # Get the currently selected server
-        selected_server = st.session_state.mcp_servers[st.session_state.selected_mcp_server_index]
+        selected_server = mcp_servers[st.session_state.selected_mcp_server_index]
         
         # Edit the selected server configuration
         with st.expander("Server Configuration", expanded=True):
-            # Server name
-            new_name = st.text_input(
-                "Server Name:",
-                value=selected_server["name"],
-                key=f"server_name_{st.session_state.selected_mcp_server_index}"
-            )
-            st.session_state.mcp_servers[st.session_state.selected_mcp_server_index]["name"] = new_name
-            
-            # Server endpoint
-            new_endpoint = st.text_input(
-                "API Endpoint:",
-                value=selected_server["endpoint"],
-                key=f"server_endpoint_{st.session_state.selected_mcp_server_index}"
-            )
-            st.session_state.mcp_servers[st.session_state.selected_mcp_server_index]["endpoint"] = new_endpoint
-            
-            # Server API key
-            new_api_key = st.text_input(
-                "API Key:",
-                value=selected_server["api_key"],
-                type="password",
-                key=f"server_api_key_{st.session_state.selected_mcp_server_index}"
-            )
-            st.session_state.mcp_servers[st.session_state.selected_mcp_server_index]["endpoint"] = new_endpoint
-            st.session_state.mcp_servers[st.session_state.selected_mcp_server_index]["api_key"] = new_api_key
-            
-            # Delete button (don't allow deleting the last server)
-            if len(st.session_state.mcp_servers) > 1:
-                if st.button("Delete Server", key=f"delete_server_{st.session_state.selected_mcp_server_index}"):
-                    st.session_state.mcp_servers.pop(st.session_state.selected_mcp_server_index)
-                    st.session_state.selected_mcp_server_index = 0
-                    st.rerun()
+            if selected_server.get("shared"):
+                st.text_input("Server Name:", value=selected_server["name"], disabled=True)
+                st.text_input("API Endpoint:", value=selected_server["endpoint"], disabled=True)
+                st.caption(f"Configured in {server_registry.path} for all users.")
+            else:
+                # Session servers are the dicts in custom_mcp_servers, edited in place
+                selected_server["name"] = st.text_input(
+                    "Server Name:",
+                    value=selected_server["name"],
+                    key=f"server_name_{st.session_state.selected_mcp_server_index}"
+                )
+                selected_server["endpoint"] = st.text_input(
+                    "API Endpoint:",
+                    value=selected_server["endpoint"],
+                    key=f"server_endpoint_{st.session_state.selected_mcp_server_index}"
+                )
+                selected_server["api_key"] = st.text_input(
+                    "API Key:",
+                    value=selected_server["api_key"],
+                    type="password",
+                    key=f"server_api_key_{st.session_state.selected_mcp_server_index}"
+                )
+                
+                # Delete button (don't allow deleting the last server)
+                if len(mcp_servers) > 1:
+                    if st.button("Delete Server", key=f"delete_server_{st.session_state.selected_mcp_server_index}"):
+                        st.session_state.custom_mcp_servers.remove(selected_server)
+                        st.session_state.selected_mcp_server_index = 0
+                        st.rerun()
         
         # Project ID setting (applies to any server)
         st.session_state.mcp_project_id = st.text_input(
@@ -341,22 +405,25 @@ with st.sidebar:
     st.markdown("<div class='sidebar-section'>", unsafe_allow_html=True)
     st.markdown("### Model Settings")
     
-    # Model selector
-    model_options = {
+    # Model selector; a MODELS table in the config file replaces these
+    model_options = dict(server_registry.config.models) or {
         "claude-3-haiku-20240307": "Claude 3 Haiku (Fast)",
         "claude-3-sonnet-20240229": "Claude 3 Sonnet (Balanced)",
         "claude-3-opus-20240229": "Claude 3 Opus (Powerful)"
     }
     
-    if "selected_model" not in st.session_state:
-        st.session_state.selected_model = "claude-3-haiku-20240307"
+    if st.session_state.get("selected_model") not in model_options:
+        st.session_state.selected_model = next(iter(model_options))
         
     st.session_state.selected_model = st.selectbox(
         "Select Claude model:",
         list(model_options.keys()),
         format_func=lambda x: model_options[x],
-        index=list(model_options.keys()).index(st.session_state.get("selected_model", "claude-3-haiku-20240307"))
+        index=list(model_options.keys()).index(st.session_state.selected_model)
     )
+
+    # Sample each turn (script, event loop and server threads) into a flamegraph file
+    st.checkbox("Profile requests", value=profiling.enabled_by_env(), key="profile_turns")
     st.markdown("</div>", unsafe_allow_html=True)
     
     st.markdown("<div class='sidebar-section'>", unsafe_allow_html=True)
@@ -378,12 +445,40 @@ with st.sidebar:
     
     # Add a clear conversation button in the sidebar
     if st.button("Clear Conversation", key="clear_convo"):
-        st.session_state.messages = []
-        st.session_state.messages.append({
-            "role": "assistant", 
-            "content": "Hello! I'm a chat assistant powered by Anthropic's Claude. How can I help you today?"
-        })
+        st.session_state.messages.clear()
+        st.session_state.messages.append(
+            "assistant",
+            "Hello! I'm a chat assistant powered by Anthropic's Claude. How can I help you today?"
+        )
         st.rerun()
+
+    # Save the conversation to a file, or restore one saved earlier
+    with st.expander("Save / Load Conversation"):
+        export_format = st.radio("Format", Archive.FORMATS, horizontal=True, key="export_format")
+        if st.button("Export Conversation", key="export_convo"):
+            exported = io.BytesIO()
+            Archive.export_conversation(st.session_state.messages, exported, export_format)
+            st.download_button(
+                "Download",
+                exported.getvalue(),
+                file_name="conversation" + Archive.EXTENSIONS[export_format],
+                key="download_convo"
+            )
+
+        # A new widget key after each import clears the uploader
+        if "import_round" not in st.session_state:
+            st.session_state.import_round = 0
+        imported = st.file_uploader("Import Conversation", key=f"import_{st.session_state.import_round}")
+        if imported is not None:
+            try:
+                messages = Conversation(Attachments.checked(Archive.import_conversation(imported)))
+            except Exception as e:
+                st.error(f"Couldn't import {imported.name}: {e}")
+            else:
+                cancel_active_turn()
+                st.session_state.messages = messages
+                st.session_state.import_round += 1
+                st.rerun()
         
     # Add some credits
     st.markdown("---")
@@ -391,17 +486,18 @@ with st.sidebar:
 
 # Display chat messages from history
 for message in st.session_state.messages:
-    with st.chat_message(message["role"], avatar="🧑‍💻" if message["role"] == "user" else "🤖"):
-        st.write(message["content"])
+    with st.chat_message(message.role, avatar="🧑‍💻" if message.role == "user" else "🤖"):
+        st.write(message.text)
 
 # Status indicator for current mode
 if st.session_state.run_mode == "standalone":
     status_text = f"Currently running in <strong>{run_mode_options[st.session_state.run_mode]}</strong> mode"
 else:
     server_name = "Unknown"
-    if "mcp_servers" in st.session_state and "selected_mcp_server_index" in st.session_state:
-        if st.session_state.selected_mcp_server_index < len(st.session_state.mcp_servers):
-            server_name = st.session_state.mcp_servers[st.session_state.selected_mcp_server_index]["name"]
+    mcp_servers = get_mcp_servers()
+    if "selected_mcp_server_index" in st.session_state:
+        if st.session_state.selected_mcp_server_index < len(mcp_servers):
+            server_name = mcp_servers[st.session_state.selected_mcp_server_index]["name"]
     
     status_text = f"Currently running in <strong>{run_mode_options[st.session_state.run_mode]}</strong> mode via <strong>{server_name}</strong>"
     
@@ -415,41 +511,81 @@ st.markdown(
     unsafe_allow_html=True
 )
 
+# A Stop click reruns the script, which interrupts and cancels the running turn
+if st.session_state.get("stop_turn"):
+    cancel_active_turn()
+    st.caption("Response stopped.")
+
+# Files for the next message. A new widget key after each send clears the uploader
+if "upload_round" not in st.session_state:
+    st.session_state.upload_round = 0
+uploads = st.file_uploader(
+    "Attach files",
+    accept_multiple_files=True,
+    key=f"uploads_{st.session_state.upload_round}"
+)
+
 # User input with chat_input
 if prompt := st.chat_input("Type your message here..."):
+    # A new message supersedes any turn still running for this session
+    cancel_active_turn()
+
+    # Attachments are stored once on disk by content hash (deduplicated across
+    # sessions); the message only keeps references to them
+    content = prompt
+    if uploads:
+        store = AttachmentStore.get()
+        content = [store.add(f, f.name, f.type).reference() for f in uploads]
+        content.append({"type": "text", "text": prompt})
+        st.session_state.upload_round += 1
+
     # Add user message to chat history
-    st.session_state.messages.append({"role": "user", "content": prompt})
+    user_message = st.session_state.messages.append("user", content)
     
     # Display user message in chat container
     with st.chat_message("user", avatar="🧑‍💻"):
-        st.write(prompt)
+        st.write(user_message.text)
     
+    # Display Claude's response
+    with profiling.profile_turn(enabled=st.session_state.profile_turns) as profile:
+        with st.chat_message("assistant", avatar="🤖"):
+            renderer = StreamRenderer(st.container())
+            stop_placeholder = st.empty()
+            stop_placeholder.button("Stop", key="stop_turn")
+
+            # Get response from Claude API on the background loop. Each tick paints the
+            # streamed text and the status line (live tool progress while tools run),
+            # which is also when Streamlit gets a chance to interrupt us
+            thinking = f"Thinking... (via {run_mode_options[st.session_state.run_mode]})"
+            turn = Turn(run_as(
+                get_claude_response(st.session_state.messages, renderer, st.session_state.run_mode),
+                INTERACTIVE, st.session_state.session_id,
+            ))
+            st.session_state.active_turn = turn
+            try:
+                claude_response = turn.wait(
+                    on_tick=lambda elapsed: renderer.tick(elapsed, thinking),
+                    poll_interval=renderer.frame_interval
+                )
+            except TurnCancelled:
+                claude_response = None
+            except Exception as e:
+                st.error(f"Error: {str(e)}")
+                if isinstance(getattr(e, "response", None), httpx.Response):
+                    st.error(f"Response error: {e.response.text}")
+                claude_response = "I'm having trouble connecting to my AI backend. Please check the API key in your secrets file and try again."
+            finally:
+                st.session_state.active_turn = None
+            stop_placeholder.empty()
+
+            # Write the rest of the response
+            renderer.finish(claude_response)
+            if claude_response is None:
+                st.caption("Response stopped.")
+    if profile:
+        st.caption(f"Profile written to {profile['speedscope']} (hot paths: {profile['hot_paths']})")
 
-    # Display a spinner while waiting for Claude's response
-    with st.spinner(f"Thinking... (via {run_mode_options[st.session_state.run_mode]})"):
-        # Get response from Claude API
-        try:
-            claude_response = asyncio.run(get_claude_response(st.session_state.messages, st.session_state.run_mode))
-        except Exception as e:
-            st.error(f"Error: {str(e)}")
-            claude_response = "I'm having trouble connecting to my AI backend. Please check the API key in your secrets file and try again."
-    
-    # Display Claude's response with typing animation
-    with st.chat_message("assistant", avatar="🤖"):
-        message_placeholder = st.empty()
-        
-        # Simulate typing with a gentle approach
-        full_response = ""
-        # Split the response into words for smoother animation
-        #words = claude_response.split()
-        #for i in range(0, len(words), 3):  # Process 3 words at a time for efficiency
-        #    chunk = " ".join(words[i:i+3])
-        #    full_response += chunk + " "
-        #    message_placeholder.write(full_response + "▌")
-        #    time.sleep(0.05)
-            
-        # Write the final response
-        message_placeholder.write(claude_response)
-    
     # Add Claude's response to chat history
-    st.session_state.messages.append({"role": "assistant", "content": claude_response})
\ No newline at end of file
+    if claude_response is not None:
+        st.session_state.messages.append("assistant", claude_response)
+        compact_history()
@@ -1,8 +1,21 @@
 import streamlit as st
-import requests
+import httpx
+import io
 import json
-import time
 import os
+import uuid
+
+from LLMCPClient import Archive, Attachments
+from LLMCPClient.Attachments import AttachmentStore
+from LLMCPClient.Cancellation import Turn, TurnCancelled
+from LLMCPClient.Deadlines import CUT_OFF, TURN_TIMEOUT, Deadline, DeadlineExceeded, until
+from LLMCPClient.Messages import Conversation
+from LLMCPClient.Providers import get_router, text_deltas
+from LLMCPClient.Scheduler import INTERACTIVE, run_as
+from LLMCPClient.SessionMemory import SessionMemory
+from LLMCPClient.SingleFlight import SingleFlight, request_key
+from LLMCPClient.StreamRenderer import StreamRenderer
+from LLMCPClient.Tokens import CONTEXT_TOKENS
 
 # Set page configuration
 st.set_page_config(
@@ -36,21 +49,26 @@ st.markdown("<h1 style='text-align: center; margin-bottom: 30px;'>🤖 Claude-Po
 st.markdown("<p style='text-align: center; margin-bottom: 30px;'>Ask me anything! I'm powered by Anthropic's Claude AI.</p>", unsafe_allow_html=True)
 
 # Initialize session state variables
+if "session_id" not in st.session_state:
+    # Model and tool calls are queued fairly per session (see LLMCPClient.Scheduler)
+    st.session_state.session_id = uuid.uuid4().hex
+
 if "messages" not in st.session_state:
-    st.session_state.messages = []
+    st.session_state.messages = Conversation()
     # Add a welcome message
-    st.session_state.messages.append({
-        "role": "assistant", 
-        "content": "Hello! I'm a chat assistant powered by Anthropic's Claude. How can I help you today?"
-    })
+    st.session_state.messages.append(
+        "assistant",
+        "Hello! I'm a chat assistant powered by Anthropic's Claude. How can I help you today?"
+    )
+
+# Idle histories are spilled to disk and read back on use (see LLMCPClient.SessionMemory)
+SessionMemory.get().track(st.session_state.session_id, st.session_state.messages)
 
 # Function to call Claude API
-def get_claude_response(messages):
-    url = "https://api.anthropic.com/v1/messages"
-    
+def get_anthropic_api_key():
     # Get API key from secrets
     try:
-        api_key = st.secrets["ANTHROPIC_API_KEY"]
+        return st.secrets["ANTHROPIC_API_KEY"]
     except Exception as e:
         st.error("""
         Error: API key not found in secrets.
@@ -61,36 +79,32 @@ def get_claude_response(messages):
         3. Restart the Streamlit app
         """)
         st.stop()
-    
-    # Convert Streamlit message format to Claude's format
-    claude_messages = []
-    for msg in messages[-10:]:  # Only use last 10 messages to keep context window reasonable
-        if msg["role"] == "user":
-            claude_messages.append({"role": "user", "content": msg["content"]})
-        elif msg["role"] == "assistant":
-            claude_messages.append({"role": "assistant", "content": msg["content"]})
-    
-    headers = {
-        "Content-Type": "application/json",
-        "x-api-key": api_key,
-        "anthropic-version": "2023-06-01"
-    }
-    
-    payload = {
-        "model": "claude-3-haiku-20240307",  # You can change this to other Claude models
-        "max_tokens": 1000,
-        "messages": claude_messages
-    }
-    
+
+MODEL = "claude-3-haiku-20240307"  # You can change this to other Claude models
+
+async def get_claude_response(messages, api_key, backup_api_key=None):
+    """Yield Claude's response text as it streams in."""
+    # Pooled connections shared by every session, with failover to the backup provider;
+    # awaiting the stream lets a cancelled turn close the connection straight away
+    router = get_router("anthropic", api_key, backup_api_key)
+    events = router.stream(
+        model=MODEL,
+        max_tokens=1000,
+        messages=messages.payload(),
+    )
+    # A stalled stream is cut off at the turn's deadline, keeping what was said so far
     try:
-        response = requests.post(url, headers=headers, json=payload)
-        response.raise_for_status()
-        return response.json()["content"][0]["text"]
-    except Exception as e:
-        st.error(f"Error calling Claude API: {str(e)}")
-        if 'response' in locals() and hasattr(response, 'text'):
-            st.error(f"Response error: {response.text}")
-        return "I'm having trouble connecting to my AI backend. Please check the API key in your secrets file and try again."
+        async for text in until(text_deltas(events), Deadline.after(TURN_TIMEOUT)):
+            yield text
+    except DeadlineExceeded:
+        yield "\n\n" + CUT_OFF
+
+def cancel_active_turn():
+    """Cancel this session's in-flight turn, if any (e.g. superseded by a new message)."""
+    turn = st.session_state.get("active_turn")
+    if turn is not None and not turn.done():
+        turn.cancel()
+    st.session_state.active_turn = None
 
 # Sidebar with information
 with st.sidebar:
@@ -122,12 +136,40 @@ with st.sidebar:
     
     # Add a clear conversation button in the sidebar
     if st.button("Clear Conversation", key="clear_convo"):
-        st.session_state.messages = []
-        st.session_state.messages.append({
-            "role": "assistant", 
-            "content": "Hello! I'm a chat assistant powered by Anthropic's Claude. How can I help you today?"
-        })
+        st.session_state.messages.clear()
+        st.session_state.messages.append(
+            "assistant",
+            "Hello! I'm a chat assistant powered by Anthropic's Claude. How can I help you today?"
+        )
         st.rerun()
+
+    # Save the conversation to a file, or restore one saved earlier
+    with st.expander("Save / Load Conversation"):
+        export_format = st.radio("Format", Archive.FORMATS, horizontal=True, key="export_format")
+        if st.button("Export Conversation", key="export_convo"):
+            exported = io.BytesIO()
+            Archive.export_conversation(st.session_state.messages, exported, export_format)
+            st.download_button(
+                "Download",
+                exported.getvalue(),
+                file_name="conversation" + Archive.EXTENSIONS[export_format],
+                key="download_convo"
+            )
+
+        # A new widget key after each import clears the uploader
+        if "import_round" not in st.session_state:
+            st.session_state.import_round = 0
+        imported = st.file_uploader("Import Conversation", key=f"import_{st.session_state.import_round}")
+        if imported is not None:
+            try:
+                messages = Conversation(Attachments.checked(Archive.import_conversation(imported)))
+            except Exception as e:
+                st.error(f"Couldn't import {imported.name}: {e}")
+            else:
+                cancel_active_turn()
+                st.session_state.messages = messages
+                st.session_state.import_round += 1
+                st.rerun()
         
     # Add some credits
     st.markdown("---")
@@ -135,39 +177,82 @@ with st.sidebar:
 
 # Display chat messages from history
 for message in st.session_state.messages:
-    with st.chat_message(message["role"], avatar="🧑‍💻" if message["role"] == "user" else "🤖"):
-        st.write(message["content"])
+    with st.chat_message(message.role, avatar="🧑‍💻" if message.role == "user" else "🤖"):
+        st.write(message.text)
+
+# A Stop click reruns the script, which interrupts and cancels the running turn
+if st.session_state.get("stop_turn"):
+    cancel_active_turn()
+    st.caption("Response stopped.")
+
+# Files for the next message. A new widget key after each send clears the uploader
+if "upload_round" not in st.session_state:
+    st.session_state.upload_round = 0
+uploads = st.file_uploader(
+    "Attach files",
+    accept_multiple_files=True,
+    key=f"uploads_{st.session_state.upload_round}"
+)
 
 # User input with chat_input
 if prompt := st.chat_input("Type your message here..."):
+    # A new message supersedes any turn still running for this session
+    cancel_active_turn()
+
+    # Attachments are stored once on disk by content hash (deduplicated across
+    # sessions); the message only keeps references to them
+    content = prompt
+    if uploads:
+        store = AttachmentStore.get()
+        content = [store.add(f, f.name, f.type).reference() for f in uploads]
+        content.append({"type": "text", "text": prompt})
+        st.session_state.upload_round += 1
+
     # Add user message to chat history
-    st.session_state.messages.append({"role": "user", "content": prompt})
+    user_message = st.session_state.messages.append("user", content)
     
     # Display user message in chat container
     with st.chat_message("user", avatar="🧑‍💻"):
-        st.write(prompt)
-    
-    # Display a spinner while waiting for Claude's response
-    with st.spinner("Thinking..."):
-        # Get response from Claude API
-        claude_response = get_claude_response(st.session_state.messages)
+        st.write(user_message.text)
     
-    # Display Claude's response with typing animation
+    # Display Claude's response as it streams in. The renderer repaints at a fixed frame
+    # rate and only rewrites the paragraph being written, so long answers stay cheap;
+    # each tick also gives Streamlit a chance to interrupt the wait when Stop is clicked
     with st.chat_message("assistant", avatar="🤖"):
-        message_placeholder = st.empty()
-        
-        # Simulate typing with a gentle approach
-        full_response = ""
-        # Split the response into words for smoother animation
-        words = claude_response.split()
-        for i in range(0, len(words), 3):  # Process 3 words at a time for efficiency
-            chunk = " ".join(words[i:i+3])
-            full_response += chunk + " "
-            message_placeholder.write(full_response + "▌")
-            time.sleep(0.05)
+        renderer = StreamRenderer(st.container())
+        stop_placeholder = st.empty()
+        stop_placeholder.button("Stop", key="stop_turn")
+        # Only use the last 10 messages, within the token budget, to keep the context window
+        # reasonable; the turn gets its own snapshot of the (immutable) Message records
+        window = Conversation(st.session_state.messages.window(10, CONTEXT_TOKENS, MODEL))
+        api_key = get_anthropic_api_key()
+        backup_api_key = st.secrets.get("OPENAI_API_KEY")
+        # Identical requests in flight from other sessions share one stream
+        turn = Turn(run_as(renderer.consume(SingleFlight.get().stream(
+            request_key("direct", window.payload()),
+            lambda: get_claude_response(window, api_key, backup_api_key),
+        )), INTERACTIVE, st.session_state.session_id))
+        st.session_state.active_turn = turn
+        try:
+            claude_response = turn.wait(
+                on_tick=lambda elapsed: renderer.tick(elapsed, "Thinking..."),
+                poll_interval=renderer.frame_interval
+            )
+        except TurnCancelled:
+            renderer.finish()
+            st.caption("Response stopped.")
+            st.stop()
+        except Exception as e:
+            st.error(f"Error calling Claude API: {str(e)}")
+            if isinstance(getattr(e, "response", None), httpx.Response):
+                st.error(f"Response error: {e.response.text}")
+            claude_response = "I'm having trouble connecting to my AI backend. Please check the API key in your secrets file and try again."
+        finally:
+            st.session_state.active_turn = None
+        stop_placeholder.empty()
             
-        # Write the final response
-        message_placeholder.write(claude_response)
+        # Write the rest of the response
+        renderer.finish(claude_response)
     
     # Add Claude's response to chat history
-    st.session_state.messages.append({"role": "assistant", "content": claude_response})
\ No newline at end of file
+    st.session_state.messages.append("assistant", claude_response)
\ No newline at end of file
@@ -1,5 +1,9 @@
 import streamlit as st
-from openai import OpenAI
+
+from LLMCPClient.Cancellation import Turn
+from LLMCPClient.Messages import Conversation
+from LLMCPClient.Providers import get_router, text_deltas
+from LLMCPClient.StreamRenderer import StreamRenderer
 
 # Show title and description.
 st.title("💬 Hello I'm your Chat Genie")
@@ -18,40 +22,40 @@ if not openai_api_key:
     st.info("Please add your OpenAI API key to continue.", icon="🗝️")
 else:
 
-    # Create an OpenAI client.
-    client = OpenAI(api_key=openai_api_key)
+    # The process-wide OpenAI client (pooled connections shared by all sessions), failing
+    # over to Claude when an Anthropic key is configured too.
+    router = get_router("openai", st.secrets.get("ANTHROPIC_API_KEY"), openai_api_key)
 
     # Create a session state variable to store the chat messages. This ensures that the
     # messages persist across reruns.
     if "messages" not in st.session_state:
-        st.session_state.messages = []
+        st.session_state.messages = Conversation()
 
     # Display the existing chat messages via `st.chat_message`.
     for message in st.session_state.messages:
-        with st.chat_message(message["role"]):
-            st.markdown(message["content"])
+        with st.chat_message(message.role):
+            st.markdown(message.content)
 
     # Create a chat input field to allow the user to enter a message. This will display
     # automatically at the bottom of the page.
     if prompt := st.chat_input("What is up?"):
 
         # Store and display the current prompt.
-        st.session_state.messages.append({"role": "user", "content": prompt})
+        st.session_state.messages.append("user", prompt)
         with st.chat_message("user"):
             st.markdown(prompt)
 
-        # Generate a response using the OpenAI API.
-        stream = client.chat.completions.create(
+        # Generate a response using the OpenAI API on the background loop.
+        events = router.stream(
             model="gpt-3.5-turbo",
-            messages=[
-                {"role": m["role"], "content": m["content"]}
-                for m in st.session_state.messages
-            ],
-            stream=True,
+            max_tokens=1000,
+            messages=st.session_state.messages.payload(),
         )
 
-        # Stream the response to the chat using `st.write_stream`, then store it in 
-        # session state.
+        # Stream the response to the chat, then store it in session state.
         with st.chat_message("assistant"):
-            response = st.write_stream(stream)
-        st.session_state.messages.append({"role": "assistant", "content": response})
+            renderer = StreamRenderer(st.container())
+            turn = Turn(renderer.consume(text_deltas(events)))
+            response = turn.wait(on_tick=renderer.tick, poll_interval=renderer.frame_interval)
+            renderer.finish(response)
+        st.session_state.messages.append("assistant", response)
@@ -4,7 +4,15 @@ import asyncio
 async def main():
     client = MCPClient()
     try:
+        # Connect to the model API while connecting to the server (which prefetches its
+        # catalogs), so the first query doesn't pay for either. The server connection stays
+        # in this task: its transport has to be closed by the task that opened it.
+        warming = asyncio.create_task(client.provider.warm())
         await client.connect_to_http_server("http://localhost:8000/mcp")
+        try:
+            await warming
+        except Exception as e:
+            print(f"Model API warm-up failed: {e}")
 
         while True:
 